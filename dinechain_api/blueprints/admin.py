@@ -1,9 +1,22 @@
-from flask import Blueprint, render_template_string, request, abort
+from flask import Blueprint, Response, request, abort
+import csv
+import io
+import json
 import os
-from .orders import get_db_conn
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
+from .orders import get_db_conn, connect_blocking_reader
+from ..services.analytics import get_sales_analytics
+from ..utils.internal_auth import is_internal_request
 
 admin_bp = Blueprint("admin", __name__)
 
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "50"))
+ADMIN_MAX_PAGE_SIZE = int(os.getenv("ADMIN_MAX_PAGE_SIZE", "200"))
+# Rows fetched from the export cursor per chunk written to the response
+ADMIN_EXPORT_CHUNK_ROWS = int(os.getenv("ADMIN_EXPORT_CHUNK_ROWS", "500"))
+
 TEMPLATE = """
 <!DOCTYPE html>
 <html>
@@ -30,14 +43,26 @@ TEMPLATE = """
             text-align: center;
             color: #5a67d8;
         }
-        #searchInput {
-            width: 100%;
-            padding: 10px;
+        .filters {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 10px;
             margin-bottom: 20px;
+        }
+        .filters input, .filters select, .filters button {
+            padding: 10px;
             border: 1px solid #ddd;
             border-radius: 4px;
             box-sizing: border-box;
         }
+        .filters input[name="q"] {
+            flex: 1 1 300px;
+        }
+        .pager {
+            display: flex;
+            justify-content: space-between;
+            margin-top: 20px;
+        }
         table {
             width: 100%;
             border-collapse: collapse;
@@ -66,21 +91,45 @@ TEMPLATE = """
 <body>
 <div class="container">
     <h2>Admin - Orders</h2>
-    <input type="text" id="searchInput" onkeyup="searchTable()" placeholder="Search for orders by any field...">
+    <form class="filters" method="get" action="">
+        <input type="text" name="q" value="{{ filters.q }}" placeholder="Search customer, items or delivery...">
+        <select name="paid">
+            <option value="">Paid: any</option>
+            <option value="1" {{ 'selected' if filters.paid == '1' }}>Paid</option>
+            <option value="0" {{ 'selected' if filters.paid == '0' }}>Unpaid</option>
+        </select>
+        <select name="platform">
+            <option value="">Platform: any</option>
+            {% for value in platforms %}
+            <option value="{{ value }}" {{ 'selected' if filters.platform == value }}>{{ value }}</option>
+            {% endfor %}
+        </select>
+        <select name="payment_method">
+            <option value="">Payment: any</option>
+            {% for value in payment_methods %}
+            <option value="{{ value }}" {{ 'selected' if filters.payment_method == value }}>{{ value }}</option>
+            {% endfor %}
+        </select>
+        <input type="date" name="date_from" value="{{ filters.date_from }}" title="From">
+        <input type="date" name="date_to" value="{{ filters.date_to }}" title="To">
+        <button type="submit">Filter</button>
+    </form>
     <table id="ordersTable">
         <thead>
-            <tr><th>ID</th><th>Chat ID</th><th>Customer Name</th><th>Platform</th><th>Summary</th><th>Delivery</th><th>Total</th><th>Paid</th><th>Ref</th><th>Private Key</th><th>Time</th></tr>
+            <tr><th>ID</th><th>Chat ID</th><th>Customer Name</th><th>Platform</th><th>Items</th><th>Delivery</th><th>Total</th><th>Paid</th><th>Ref</th><th>Wallet</th><th>Time</th></tr>
         </thead>
         <tbody>
         {% for order in orders %}
         <tr>
             <td>{{ order['id'] }}</td><td>{{ order['chat_id'] }}</td>
             <td>{{ order['customer_name'] }}</td><td>{{ order['platform'] }}</td>
-            <td>{{ order['summary'] }}</td><td>{{ order['delivery'] }}</td>
+            <td>{{ order['items'] or '-' }}</td><td>{{ order['delivery'] }}</td>
             <td>{{ order['total'] }}</td><td>{{ '✅' if order['paid'] else '❌' }}</td>
             <td>{{ order['reference'] or '-' }}</td>
             <td>
-                {% if order['payment_method'] == 'crypto' and order['paid'] and order['private_key'] %}
+                {% if order['derivation_index'] is not none %}
+                    #{{ order['derivation_index'] }}
+                {% elif order['payment_method'] == 'crypto' and order['paid'] and order['private_key'] %}
                     <button onclick="togglePrivateKey(this)">Show</button>
                     <span class="private-key">{{ order['private_key'] }}</span>
                 {% else %}
@@ -89,35 +138,18 @@ TEMPLATE = """
             </td>
             <td>{{ order['timestamp'] }}</td>
         </tr>
+        {% else %}
+        <tr><td colspan="11">No orders match these filters.</td></tr>
         {% endfor %}
         </tbody>
     </table>
+    <div class="pager">
+        <a href="{{ first_url }}">« Newest</a>
+        {% if next_url %}<a href="{{ next_url }}">Older »</a>{% endif %}
+    </div>
 </div>
 
 <script>
-function searchTable() {
-    var input, filter, table, tbody, tr, td, i, j, txtValue;
-    input = document.getElementById("searchInput");
-    filter = input.value.toUpperCase();
-    table = document.getElementById("ordersTable");
-    tbody = table.getElementsByTagName("tbody")[0];
-    tr = tbody.getElementsByTagName("tr");
-
-    for (i = 0; i < tr.length; i++) {
-        tr[i].style.display = "none";
-        td = tr[i].getElementsByTagName("td");
-        for (j = 0; j < td.length; j++) {
-            if (td[j]) {
-                txtValue = td[j].textContent || td[j].innerText;
-                if (txtValue.toUpperCase().indexOf(filter) > -1) {
-                    tr[i].style.display = "";
-                    break;
-                }
-            }
-        }
-    }
-}
-
 function togglePrivateKey(button) {
     var keySpan = button.nextElementSibling;
     if (keySpan.style.display === 'none') {
@@ -134,10 +166,211 @@ function togglePrivateKey(button) {
 </html>
 """
 
+PLATFORMS = ("telegram", "whatsapp")
+PAYMENT_METHODS = ("card", "crypto")
+FILTER_FIELDS = ("q", "paid", "platform", "payment_method", "date_from", "date_to")
+
+# Compiled once against the app's Jinja environment when the blueprint is registered
+_template = None
+
+
+@admin_bp.record_once
+def _compile_template(state):
+    global _template
+    _template = state.app.jinja_env.from_string(TEMPLATE)
+
+
+def _fts_query(text):
+    """Turns free text into an FTS5 query: every word must match, as a prefix."""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _encode_cursor(order):
+    return f"{order['timestamp']}~{order['id']}"
+
+
+def _decode_cursor(value):
+    try:
+        timestamp, order_id = value.rsplit("~", 1)
+        return timestamp, int(order_id)
+    except ValueError:
+        abort(400, "Invalid page cursor")
+
+
+def _order_filters(filters):
+    """WHERE clauses and params for the filters shared by the orders page and the export."""
+    where, params = [], []
+    if filters["paid"] in ("0", "1"):
+        where.append("paid = ?")
+        params.append(int(filters["paid"]))
+    if filters["platform"]:
+        where.append("platform = ?")
+        params.append(filters["platform"])
+    if filters["payment_method"]:
+        where.append("payment_method = ?")
+        params.append(filters["payment_method"])
+    if filters["date_from"]:
+        where.append("timestamp >= ?")
+        params.append(filters["date_from"])
+    if filters["date_to"]:
+        # Inclusive of the whole end day
+        where.append("timestamp < date(?, '+1 day')")
+        params.append(filters["date_to"])
+    if filters["q"] and _fts_query(filters["q"]):
+        where.append("id IN (SELECT rowid FROM orders_fts WHERE orders_fts MATCH ?)")
+        params.append(_fts_query(filters["q"]))
+    return where, params
+
+
+def _build_orders_query(filters, cursor, limit):
+    """Builds the keyset-paginated orders query; never reads more than ``limit + 1`` matching rows."""
+    where, params = _order_filters(filters)
+    if cursor:
+        where.append("(timestamp, id) < (?, ?)")
+        params.extend(cursor)
+
+    sql = """
+        SELECT id, chat_id, customer_name, platform, delivery, total, paid,
+               reference, payment_method, private_key, derivation_index, timestamp,
+               (SELECT group_concat(CASE WHEN quantity > 1 THEN name || ' x' || quantity ELSE name END, ', ')
+                FROM order_items WHERE order_id = orders.id) AS items
+        FROM orders
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
 @admin_bp.route("/admin")
 async def admin_dashboard():
-    async with get_db_conn() as conn:
-        cursor = await conn.cursor()
-        await cursor.execute("SELECT * FROM orders ORDER BY timestamp DESC")
-        orders = await cursor.fetchall()
-    return render_template_string(TEMPLATE, orders=orders)
+    filters = {field: request.args.get(field, "").strip() for field in FILTER_FIELDS}
+    _normalize_date_filters(filters)
+    limit = min(max(request.args.get("limit", ADMIN_PAGE_SIZE, type=int), 1), ADMIN_MAX_PAGE_SIZE)
+    cursor = _decode_cursor(request.args["before"]) if request.args.get("before") else None
+
+    sql, params = _build_orders_query(filters, cursor, limit)
+    async with get_db_conn(readonly=True) as conn:
+        try:
+            rows = await (await conn.execute(sql, params)).fetchall()
+        except sqlite3.OperationalError as e:
+            # Malformed FTS syntax that slipped through quoting
+            abort(400, f"Invalid search: {e}")
+
+    orders, has_more = rows[:limit], len(rows) > limit
+    query = {field: value for field, value in filters.items() if value}
+    if limit != ADMIN_PAGE_SIZE:
+        query["limit"] = limit
+    next_url = f"?{urlencode({**query, 'before': _encode_cursor(orders[-1])})}" if has_more else None
+    first_url = f"?{urlencode(query)}" if query else "?"
+
+    return _template.render(
+        orders=orders,
+        filters=filters,
+        platforms=PLATFORMS,
+        payment_methods=PAYMENT_METHODS,
+        next_url=next_url,
+        first_url=first_url,
+    )
+
+
+def _parse_date(value, default):
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, f"Invalid date: {value}")
+
+
+def _normalize_date_filters(filters):
+    """Rejects malformed date filters and rewrites the rest as YYYY-MM-DD for the SQL comparisons."""
+    for field in ("date_from", "date_to"):
+        if filters[field]:
+            filters[field] = _parse_date(filters[field], None).isoformat()
+
+
+@admin_bp.route("/admin/analytics")
+async def admin_analytics():
+    """Sales rollups as JSON: ?from=YYYY-MM-DD&to=YYYY-MM-DD&platform=telegram&top=10 (UTC, last 7 days by default)."""
+    today = datetime.now(timezone.utc).date()
+    date_to = _parse_date(request.args.get("to"), today)
+    date_from = _parse_date(request.args.get("from"), date_to - timedelta(days=6))
+    if date_from > date_to:
+        abort(400, "'from' must not be after 'to'")
+    top = min(max(request.args.get("top", 10, type=int), 1), 100)
+    return await get_sales_analytics(
+        date_from.isoformat(), date_to.isoformat(), platform=request.args.get("platform") or None, top_items=top
+    )
+
+
+# Private keys are never exported
+EXPORT_COLUMNS = (
+    "id", "timestamp", "paid_at", "platform", "chat_id", "customer_name", "payment_method",
+    "paid", "expired_at", "total", "reference", "delivery", "deposit_address", "derivation_index",
+    "deposit_wallet", "derivation_path", "summary",
+)
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _export_rows(sql, params, fmt):
+    """Yields the export in chunks straight off a server-side cursor."""
+    conn = connect_blocking_reader()
+    try:
+        cursor = conn.execute(sql, params)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(ADMIN_EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            for row in rows:
+                if fmt == "csv":
+                    writer.writerow(tuple(row))
+                else:
+                    buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if fmt == "csv" and buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        conn.close()
+
+
+@admin_bp.route("/admin/export")
+@admin_bp.route("/admin/export.<fmt>")
+def admin_export(fmt=None):
+    """Streams matching orders, oldest first: ?format=csv|ndjson plus the /admin filters.
+
+    A plain (sync) view: the response is generated in the request thread from
+    its own SQLite connection, in constant memory, without touching the app loop.
+    It carries customer contact details, so it needs the internal API key.
+    """
+    if not is_internal_request():
+        return "Unauthorized", 401
+    fmt = fmt or request.args.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        abort(400, f"Unsupported export format: {fmt}")
+    filters = {field: request.args.get(field, "").strip() for field in FILTER_FIELDS}
+    _normalize_date_filters(filters)
+    where, params = _order_filters(filters)
+
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM orders"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp, id"
+
+    filename = f"orders-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        _export_rows(sql, params, fmt),
+        content_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
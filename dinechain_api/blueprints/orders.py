@@ -1,60 +1,147 @@
 import aiosqlite
+import asyncio
 import os
+import sqlite3
 from contextlib import asynccontextmanager
+from ..services.migrations import run_migrations
 
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'orders.db')
+# An empty value (e.g. a blank line in .env) means the default too: SQLite would
+# otherwise open a private temporary database per connection
+DATABASE_PATH = os.getenv("DATABASE_PATH") or os.path.join(os.path.dirname(__file__), 'orders.db')
 
-@asynccontextmanager
-async def get_db_conn():
-    """Establishes a connection to the SQLite database as a context manager."""
-    conn = await aiosqlite.connect(DATABASE_PATH)
+# Connection pool sizing and SQLite tuning
+DB_READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Long-lived connections: one writer (SQLite allows a single writer at a time)
+# and a bounded set of readers that WAL lets run alongside it.
+_writer = None
+_writer_lock = None
+_open_lock = None
+_readers = None
+_reader_count = 0
+
+
+async def _connect(readonly=False):
+    connection = aiosqlite.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+    # Don't let idle pooled connections keep the interpreter alive at exit
+    connection.daemon = True
+    conn = await connection
     conn.row_factory = aiosqlite.Row
-    try:
-        yield conn
-    finally:
-        await conn.close()
+    if not readonly:
+        await conn.execute("PRAGMA journal_mode = WAL")
+    await conn.execute("PRAGMA synchronous = NORMAL")
+    await conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    await conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    await conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    await conn.execute("PRAGMA temp_store = MEMORY")
+    if readonly:
+        await conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def connect_blocking_reader():
+    """A plain read-only sqlite3 connection for long scans (e.g. exports).
+
+    Used from a request thread so a slow consumer never holds one of the
+    pooled connections the app loop depends on.
+    """
+    conn = sqlite3.connect(DATABASE_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+async def _get_writer():
+    global _writer, _writer_lock, _open_lock
+    if _writer_lock is None:
+        _writer_lock = asyncio.Lock()
+        _open_lock = asyncio.Lock()
+    async with _open_lock:
+        if _writer is None:
+            # The writer is opened first so WAL mode is in place before any reader
+            _writer = await _connect()
+    return _writer
+
+
+async def _acquire_reader():
+    global _readers, _reader_count
+    if _readers is None:
+        _readers = asyncio.Queue()
+    if _readers.empty() and _reader_count < DB_READER_POOL_SIZE:
+        _reader_count += 1
+        try:
+            await _get_writer()
+            return await _connect(readonly=True)
+        except Exception:
+            _reader_count -= 1
+            raise
+    return await _readers.get()
+
+
+@asynccontextmanager
+async def get_db_conn(readonly=False):
+    """Checks out a pooled connection to the SQLite database as a context manager.
+
+    Read-only callers share the reader pool; everyone else waits for the single
+    writer, so keep writer blocks short and never await network calls inside them.
+    """
+    if readonly:
+        conn = await _acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            _readers.put_nowait(conn)
+        return
+
+    conn = await _get_writer()
+    async with _writer_lock:
+        try:
+            yield conn
+        finally:
+            # Never hand the next caller a half-finished transaction
+            if conn.in_transaction:
+                await conn.rollback()
+
+
+async def get_order_items(conn, order_id):
+    """An order's line items as {"menu_item_id", "name", "price" (cents per unit), "quantity"} dicts."""
+    cursor = await conn.execute(
+        "SELECT menu_item_id, name, unit_price AS price, quantity FROM order_items WHERE order_id = ? ORDER BY id",
+        (order_id,)
+    )
+    return [dict(row) for row in await cursor.fetchall()]
+
+
+async def close_db_pool():
+    """Closes every pooled connection."""
+    global _writer, _writer_lock, _open_lock, _readers, _reader_count
+    if _readers is not None:
+        while not _readers.empty():
+            await _readers.get_nowait().close()
+        _readers = None
+        _reader_count = 0
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+    _writer_lock = _open_lock = None
 
 async def init_db():
-    """Initializes the database and creates tables if they don't exist."""
+    """Initializes the database by applying any pending schema migrations."""
     async with get_db_conn() as conn:
-        async with conn.cursor() as cursor:
-            # Create orders table
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id TEXT NOT NULL,
-                    customer_name TEXT,
-                    platform TEXT,
-                    summary TEXT,
-                    delivery TEXT,
-                    total INTEGER,
-                    paid INTEGER DEFAULT 0,
-                    reference TEXT,
-                    payment_method TEXT,
-                    deposit_address TEXT,
-                    private_key TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            
-            # Create conversations table
-            await cursor.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id TEXT NOT NULL,
-                    platform TEXT,
-                    history TEXT,
-                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(chat_id, platform)
-                );
-            """)
-
-            # Drop the obsolete circle_wallets table if it exists
-            await cursor.execute("DROP TABLE IF EXISTS circle_wallets")
-        
-            await conn.commit()
-    print("✅ Database initialized successfully.")
+        version = await run_migrations(conn)
+        await conn.execute("PRAGMA optimize")
+    print(f"✅ Database initialized successfully (schema v{version}).")
 
 if __name__ == '__main__':
-    import asyncio
-    asyncio.run(init_db())
+    async def main():
+        await init_db()
+        await close_db_pool()
+
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import asyncio
+from .menu import MENU_ITEMS_BY_ID, display_name
+from ..blueprints.orders import get_db_conn, init_db, close_db_pool
+
+# Sales rollups, maintained incrementally when an order is marked paid so the
+# admin analytics read a handful of buckets instead of every order. Buckets
+# are UTC; revenue is in cents. ``backfill_rollups`` rebuilds them from the
+# orders table (python -m dinechain_api.services.analytics).
+#
+# Item buckets are keyed by menu item id, so "Jollof Rice" and "jollof rice"
+# from the LLM's order JSON count as one dish. Lines that didn't match the menu
+# fall back to their lower-cased, trimmed name.
+
+_ITEM_ROLLUP_SELECT = """
+    SELECT date(COALESCE(o.paid_at, o.timestamp)) AS day,
+           COALESCE(line.menu_item_id, lower(trim(line.name))) AS item,
+           SUM(line.quantity) AS quantity,
+           SUM(line.unit_price * line.quantity) AS revenue
+    FROM orders AS o JOIN order_items AS line ON line.order_id = o.id
+    WHERE {where}
+    GROUP BY day, item
+"""
+
+_HOURLY_ROLLUP_SELECT = """
+    SELECT strftime('%Y-%m-%d %H:00:00', COALESCE(paid_at, timestamp)) AS hour,
+           COALESCE(platform, 'unknown') AS platform,
+           COUNT(*) AS orders,
+           SUM(COALESCE(total, 0)) AS revenue
+    FROM orders
+    WHERE {where}
+    GROUP BY hour, platform
+"""
+
+
+async def record_paid_order(conn, order_id):
+    """Adds a just-paid order to the rollups, on ``conn``'s open transaction.
+
+    Call exactly once per order, in the same transaction that sets ``paid = 1``.
+    """
+    await conn.execute(
+        f"""
+        INSERT INTO sales_hourly (hour, platform, orders, revenue)
+        {_HOURLY_ROLLUP_SELECT.format(where="id = ?")}
+        ON CONFLICT(hour, platform) DO UPDATE SET
+            orders = orders + excluded.orders, revenue = revenue + excluded.revenue
+        """,
+        (order_id,)
+    )
+    await conn.execute(
+        f"""
+        INSERT INTO item_sales_daily (day, item, quantity, revenue)
+        {_ITEM_ROLLUP_SELECT.format(where="o.id = ?")}
+        ON CONFLICT(day, item) DO UPDATE SET
+            quantity = quantity + excluded.quantity, revenue = revenue + excluded.revenue
+        """,
+        (order_id,)
+    )
+
+
+async def backfill_rollups():
+    """Rebuilds both rollup tables from every paid order. Safe to re-run."""
+    async with get_db_conn() as conn:
+        await conn.execute("BEGIN IMMEDIATE")
+        await conn.execute("DELETE FROM sales_hourly")
+        await conn.execute("DELETE FROM item_sales_daily")
+        await conn.execute(
+            f"INSERT INTO sales_hourly (hour, platform, orders, revenue) {_HOURLY_ROLLUP_SELECT.format(where='paid = 1')}"
+        )
+        await conn.execute(
+            f"INSERT INTO item_sales_daily (day, item, quantity, revenue) {_ITEM_ROLLUP_SELECT.format(where='o.paid = 1')}"
+        )
+        cursor = await conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(orders), 0) AS orders FROM sales_hourly")
+        row = await cursor.fetchone()
+        await conn.commit()
+    print(f"📊 Rebuilt sales rollups: {row['orders']} paid order(s) in {row['n']} hourly bucket(s).")
+
+
+def _item_entry(row):
+    menu_item = MENU_ITEMS_BY_ID.get(row["item"])
+    return {
+        "item": display_name(menu_item) if menu_item else row["item"],
+        "menu_item_id": menu_item.id if menu_item else None,
+        "quantity": row["quantity"],
+        "revenue": row["revenue"],
+    }
+
+
+async def get_sales_analytics(date_from, date_to, platform=None, top_items=10):
+    """Revenue and orders per hour and per day, plus top items, for an inclusive UTC date range."""
+    hour_from, hour_to = f"{date_from} 00:00:00", f"{date_to} 23:00:00"
+    platform_filter, params = "", [hour_from, hour_to]
+    if platform:
+        platform_filter = " AND platform = ?"
+        params.append(platform)
+
+    async with get_db_conn(readonly=True) as conn:
+        cursor = await conn.execute(
+            f"""
+            SELECT hour, platform, orders, revenue FROM sales_hourly
+            WHERE hour BETWEEN ? AND ?{platform_filter}
+            ORDER BY hour, platform
+            """,
+            params
+        )
+        hourly = [dict(row) for row in await cursor.fetchall()]
+        cursor = await conn.execute(
+            """
+            SELECT item, SUM(quantity) AS quantity, SUM(revenue) AS revenue FROM item_sales_daily
+            WHERE day BETWEEN ? AND ?
+            GROUP BY item
+            ORDER BY quantity DESC, revenue DESC
+            LIMIT ?
+            """,
+            (date_from, date_to, top_items)
+        )
+        items = [_item_entry(row) for row in await cursor.fetchall()]
+
+    daily = {}
+    for bucket in hourly:
+        day = daily.setdefault(bucket["hour"][:10], {"day": bucket["hour"][:10], "orders": 0, "revenue": 0})
+        day["orders"] += bucket["orders"]
+        day["revenue"] += bucket["revenue"]
+
+    return {
+        "from": date_from,
+        "to": date_to,
+        "platform": platform,
+        "currency": "usd_cents",
+        "totals": {
+            "orders": sum(bucket["orders"] for bucket in hourly),
+            "revenue": sum(bucket["revenue"] for bucket in hourly),
+        },
+        "daily": list(daily.values()),
+        "hourly": hourly,
+        # Item rollups are per day across platforms
+        "top_items": items,
+    }
+
+
+if __name__ == "__main__":
+    async def main():
+        await init_db()
+        await backfill_rollups()
+        await close_db_pool()
+
+    asyncio.run(main())
@@ -0,0 +1,263 @@
+import os
+import re
+from collections import Counter
+from .menu import MENU, MENU_ITEMS, MENU_ITEMS_BY_ID, FOOD_CATEGORIES, DRINK_CATEGORIES, display_name, format_price
+
+# Rule-based answers for the turns that don't need the LLM: greetings, menu and
+# category listings, price questions and plain "2 jollof rice and a coke"
+# orders. Anything the rules can't fully account for returns None and goes to
+# the LLM as before.
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1").lower() in ("1", "true", "yes")
+
+fast_path_stats = Counter()
+
+GREETING_RE = re.compile(r"^(hi|hello|hey|hiya|howdy|good (morning|afternoon|evening))( there| dinechain| bot)?$")
+PRICE_RE = re.compile(
+    r"^(how much (is|are|for|does|do)|what'?s the price of|what is the price of|price of|what does|what do)"
+    r"( a| an| the| one)? (?P<item>.+?)( cost| costs| go for)?$"
+)
+ORDER_PREFIX_RE = re.compile(
+    r"^(please )?(i want|i'd like|i would like|i'll have|i will have|i'll take|can i get|can i have|could i get|"
+    r"could i have|give me|get me|let me get|let me have|add|order|i'd love)( to order)?\b"
+)
+
+FILLER_WORDS = {
+    "what", "whats", "what's", "do", "you", "have", "got", "sell", "serve", "is", "are", "there", "any", "the",
+    "your", "me", "show", "list", "see", "can", "could", "i", "please", "pls", "available", "today", "today's",
+    "options", "on", "kinds", "kind", "types", "type", "of", "which", "tell", "about", "send", "give", "a",
+    "full", "whole", "us", "our", "again",
+}
+ORDER_SEPARATORS = {"and", ",", "plus", "with", "&", "also", "please"}
+
+QUANTITY_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+MAX_QUANTITY = 20
+
+CATEGORY_KEYWORDS = {
+    "menu": tuple(MENU),
+    "food": FOOD_CATEGORIES, "foods": FOOD_CATEGORIES, "meals": FOOD_CATEGORIES,
+    "drinks": DRINK_CATEGORIES, "drink": DRINK_CATEGORIES, "beverages": DRINK_CATEGORIES,
+    "main meal": ("Main Meal",), "main meals": ("Main Meal",), "mains": ("Main Meal",),
+    "soups": ("Soups",), "soup": ("Soups",),
+    "swallows": ("Swallows",), "swallow": ("Swallows",),
+    "local fridays": ("Local Fridays",), "friday dish": ("Local Fridays",),
+    "protein": ("Protein",), "proteins": ("Protein",),
+    "pastries": ("Pastries",), "pastry": ("Pastries",), "snacks": ("Pastries",),
+    "shawarma": ("Shawarma",), "shawarmas": ("Shawarma",),
+    "cocktails": ("Cocktails",), "cocktail": ("Cocktails",), "mocktails": ("Cocktails",),
+    "milkshakes": ("Milkshake & Dairy",), "milkshake": ("Milkshake & Dairy",), "dairy": ("Milkshake & Dairy",),
+    "shakes": ("Milkshake & Dairy",),
+    "fruit drinks": ("Fruit Drinks",), "juice": ("Fruit Drinks",), "juices": ("Fruit Drinks",),
+    "soda": ("Soda",), "sodas": ("Soda",), "soft drinks": ("Soda",),
+}
+
+# Words that qualify an item name that exists in more than one category
+CATEGORY_QUALIFIERS = {
+    "Soups": ("soup",),
+    "Shawarma": ("shawarma",),
+    "Cocktails": ("cocktail", "mocktail"),
+    "Milkshake & Dairy": ("milkshake", "shake"),
+    "Fruit Drinks": ("juice", "drink"),
+    "Soda": ("soda",),
+}
+
+ITEM_ALIASES = {
+    "jollof": "main-meal/jollof-rice",
+    "white rice": "main-meal/whiterice-beans",
+    "coca cola": "soda/coke",
+    "cola": "soda/coke",
+    "water": "soda/bottle-water",
+    "doughnut": "pastries/dough-nut",
+    "donut": "pastries/dough-nut",
+    "pina colada": "cocktails/pinacolada",
+    "malt": "soda/can-malt",
+    "zobo": "fruit-drinks/fruity-zobo",
+    "tiger nut": "fruit-drinks/tiger-nut-milk",
+    "goat": "protein/goat-meat",
+    "meatpie": "pastries/meat-pie",
+    "chivita": "soda/chivita-100",
+}
+
+
+def _normalize(text):
+    text = text.lower().replace("’", "'")
+    text = re.sub(r"[^a-z0-9%&',/ ]+", " ", text)
+    text = text.replace("/", " ").replace(",", " , ")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _singular(token):
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _key(text):
+    return tuple(_singular(token) for token in _normalize(text).split())
+
+
+def _build_item_index():
+    index = {}
+    for item in MENU_ITEMS:
+        keys = {_key(item.name)}
+        for qualifier in CATEGORY_QUALIFIERS.get(item.category, ()):
+            keys.add(_key(f"{item.name} {qualifier}"))
+            keys.add(_key(f"{qualifier} {item.name}"))
+        for key in keys:
+            index.setdefault(key, set()).add(item.id)
+    for alias, item_id in ITEM_ALIASES.items():
+        index.setdefault(_key(alias), set()).add(item_id)
+    return index
+
+
+ITEM_INDEX = _build_item_index()
+LONGEST_ITEM_KEY = max(len(key) for key in ITEM_INDEX)
+
+
+def _match_item(tokens, start):
+    """Longest menu-item match at ``start``. Returns (item ids, tokens consumed)."""
+    for length in range(min(LONGEST_ITEM_KEY, len(tokens) - start), 0, -1):
+        ids = ITEM_INDEX.get(tuple(_singular(t) for t in tokens[start:start + length]))
+        if ids:
+            return ids, length
+    return None, 0
+
+
+def _parse_quantity(token):
+    if token in QUANTITY_WORDS:
+        return QUANTITY_WORDS[token]
+    match = re.fullmatch(r"x?(\d{1,2})x?", token)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+def parse_order_lines(text):
+    """Parses '2 jollof rice and a coke' into [(MenuItem, quantity)], or None if any part is unclear."""
+    text = ORDER_PREFIX_RE.sub("", _normalize(text)).strip()
+    tokens = text.split()
+    lines = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ORDER_SEPARATORS and token not in QUANTITY_WORDS:
+            i += 1
+            continue
+        quantity = _parse_quantity(token)
+        if quantity is not None:
+            ids, consumed = _match_item(tokens, i + 1)
+            if not ids:
+                # "a" can also start an item name; otherwise the quantity dangles
+                ids, consumed = _match_item(tokens, i)
+                if not ids:
+                    return None
+                quantity = 1
+            else:
+                consumed += 1
+        else:
+            quantity = 1
+            ids, consumed = _match_item(tokens, i)
+            if not ids:
+                return None
+        if len(ids) != 1 or not 0 < quantity <= MAX_QUANTITY:
+            # Ambiguous ("beef": protein or shawarma?) or implausible; let the LLM ask
+            return None
+        lines.append((MENU_ITEMS_BY_ID[next(iter(ids))], quantity))
+        i += consumed
+    return lines or None
+
+
+def _format_categories(categories):
+    return "\n\n".join(
+        f"*{category}*\n" + "\n".join(f"- {name}: {format_price(price)}" for name, price in MENU[category])
+        for category in categories
+    )
+
+
+def _answer_greeting(text):
+    if GREETING_RE.match(text):
+        return (
+            "Hi there! 👋 Welcome to DineChain. What name should I put your order under?\n\n"
+            "You can say 'menu' to see everything we have today."
+        )
+    return None
+
+
+def _answer_listing(text):
+    tokens = [token for token in text.replace(",", " ").split() if token not in FILLER_WORDS]
+    if not tokens:
+        return None
+    categories = []
+    for part in " ".join(tokens).split(" and "):
+        part = part.strip()
+        if part not in CATEGORY_KEYWORDS:
+            return None
+        categories.extend(c for c in CATEGORY_KEYWORDS[part] if c not in categories)
+    heading = "Here's today's menu 🍲" if len(categories) == len(MENU) else "Here's what we have:"
+    return f"{heading}\n\n{_format_categories(categories)}\n\nWhat would you like to order?"
+
+
+def _answer_price(text):
+    match = PRICE_RE.match(text)
+    if not match:
+        return None
+    tokens = match.group("item").split()
+    ids, consumed = _match_item(tokens, 0)
+    if not ids or consumed != len(tokens):
+        return None
+    items = sorted((MENU_ITEMS_BY_ID[item_id] for item_id in ids), key=lambda item: item.price)
+    if len(items) == 1:
+        return f"{display_name(items[0])} is {format_price(items[0].price)}. Would you like to add it to your order?"
+    options = "\n".join(f"- {item.name} ({item.category}): {format_price(item.price)}" for item in items)
+    return f"We have a few of those:\n{options}\n\nWhich one would you like?"
+
+
+def _answer_order(text):
+    lines = parse_order_lines(text)
+    if not lines:
+        return None
+    summary = "\n".join(
+        f"- {quantity} x {display_name(item)}: {format_price(item.price * quantity)}" for item, quantity in lines
+    )
+    return (
+        f"Got it! Added to your order:\n{summary}\n\n"
+        "Anything else? When you're done, let me know: dine in or home delivery? If home delivery, please provide your address."
+    )
+
+
+INTENTS = (
+    ("greeting", _answer_greeting),
+    ("listing", _answer_listing),
+    ("price", _answer_price),
+    ("order", _answer_order),
+)
+
+
+def answer_without_llm(user_text):
+    """Returns a deterministic reply for common turns, or None when the LLM should handle it."""
+    if not FAST_PATH_ENABLED:
+        return None
+    text = _normalize(user_text).rstrip(" ,")
+    for intent, answer in INTENTS:
+        reply = answer(text)
+        if reply:
+            fast_path_stats["hits"] += 1
+            fast_path_stats[f"hits.{intent}"] += 1
+            return reply
+    fast_path_stats["misses"] += 1
+    return None
+
+
+def get_fast_path_stats():
+    hits, misses = fast_path_stats["hits"], fast_path_stats["misses"]
+    total = hits + misses
+    return {
+        "enabled": FAST_PATH_ENABLED,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "llm_calls_saved": hits,
+        "by_intent": {intent: fast_path_stats[f"hits.{intent}"] for intent, _ in INTENTS},
+    }
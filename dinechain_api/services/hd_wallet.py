@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import os
+import sys
+from eth_account import Account
+from eth_account.hdaccount import key_from_seed, seed_from_mnemonic
+from dotenv import load_dotenv
+from ..blueprints.orders import get_db_conn
+
+load_dotenv()
+
+# Deposit addresses derived from one HD wallet (BIP32/BIP44) instead of a new
+# random key per order. A background task keeps a pool of pre-derived
+# addresses in the deposit_addresses table, so giving an order its address is
+# a single indexed UPDATE; orders store the derivation index, path and wallet
+# fingerprint, never a key. Sweep funds by deriving keys offline with
+# `python -m dinechain_api.services.hd_wallet <index> [<fingerprint>]`.
+HD_WALLET_MNEMONIC = os.getenv("HD_WALLET_MNEMONIC")
+HD_WALLET_PASSPHRASE = os.getenv("HD_WALLET_PASSPHRASE", "")
+HD_WALLET_ACCOUNT = int(os.getenv("HD_WALLET_ACCOUNT", "0"))
+# Refill when fewer than DEPOSIT_POOL_LOW_WATER unclaimed addresses are left
+DEPOSIT_POOL_SIZE = int(os.getenv("DEPOSIT_POOL_SIZE", "100"))
+DEPOSIT_POOL_LOW_WATER = int(os.getenv("DEPOSIT_POOL_LOW_WATER", "20"))
+DEPOSIT_POOL_POLL_INTERVAL = float(os.getenv("DEPOSIT_POOL_POLL_INTERVAL", "60"))
+
+
+class HDWallet:
+    """Derives addresses at m/44'/60'/<account>'/0/<index> from a BIP39 mnemonic."""
+
+    def __init__(self, mnemonic, passphrase="", account=0):
+        self._seed = seed_from_mnemonic(mnemonic, passphrase)
+        self.path_prefix = f"m/44'/60'/{account}'/0"
+        # Identifies the wallet without revealing anything about its keys
+        self.fingerprint = hashlib.sha256(self._seed + self.path_prefix.encode()).hexdigest()[:16]
+
+    def path(self, index):
+        return f"{self.path_prefix}/{index}"
+
+    def private_key(self, index):
+        return key_from_seed(self._seed, self.path(index))
+
+    def address(self, index):
+        return Account.from_key(self.private_key(index)).address
+
+
+def load_wallet_from_env():
+    if not HD_WALLET_MNEMONIC:
+        return None
+    return HDWallet(HD_WALLET_MNEMONIC, HD_WALLET_PASSPHRASE, HD_WALLET_ACCOUNT)
+
+
+class DepositAddressPool:
+    """Keeps a pool of derived deposit addresses and hands them out to orders.
+
+    Several gunicorn workers may fill the same pool; an index derived twice is
+    dropped by the primary key, and a claim is one atomic UPDATE, so no
+    address is ever given to two orders.
+    """
+
+    def __init__(self, wallet, size=DEPOSIT_POOL_SIZE, low_water=DEPOSIT_POOL_LOW_WATER):
+        self.wallet = wallet
+        self.size = size
+        self.low_water = low_water
+        self._wake = None
+        self._task = None
+        self._fill_lock = asyncio.Lock()
+        self.derived = 0
+        self.claimed = 0
+        self.refills = 0
+        self.empty = 0
+
+    async def start(self):
+        """Starts the refill task. Must be awaited on the app loop."""
+        if self._task:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="deposit-address-pool")
+        print(f"🔑 Deposit address pool started (wallet {self.wallet.fingerprint}, {self.wallet.path_prefix}/*).")
+
+    def wake(self):
+        if self._wake:
+            self._wake.set()
+
+    async def available(self):
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute(
+                "SELECT COUNT(*) FROM deposit_addresses WHERE wallet = ? AND order_id IS NULL", (self.wallet.fingerprint,)
+            )
+            return (await cursor.fetchone())[0]
+
+    async def fill(self):
+        """Tops the pool up to ``size`` unclaimed addresses. Returns how many were added."""
+        async with self._fill_lock:
+            missing = self.size - await self.available()
+            if missing <= 0:
+                return 0
+            async with get_db_conn(readonly=True) as conn:
+                cursor = await conn.execute(
+                    "SELECT COALESCE(MAX(derivation_index) + 1, 0) FROM deposit_addresses WHERE wallet = ?",
+                    (self.wallet.fingerprint,)
+                )
+                start = (await cursor.fetchone())[0]
+            # Key derivation is CPU-bound; keep it off the event loop
+            rows = await asyncio.to_thread(
+                lambda: [(self.wallet.fingerprint, index, self.wallet.address(index)) for index in range(start, start + missing)]
+            )
+            async with get_db_conn() as conn:
+                await conn.executemany(
+                    "INSERT OR IGNORE INTO deposit_addresses (wallet, derivation_index, address) VALUES (?, ?, ?)", rows
+                )
+                await conn.commit()
+            self.derived += len(rows)
+            self.refills += 1
+            return len(rows)
+
+    async def claim(self, conn, order_id):
+        """Assigns the next free address to an order, on ``conn``'s open transaction.
+
+        Returns ``(derivation_index, address)``, or None if the pool is empty.
+        The partial index holds only unclaimed rows, so this never walks past
+        addresses already handed out.
+        """
+        cursor = await conn.execute(
+            """
+            UPDATE deposit_addresses SET order_id = ?, claimed_at = CURRENT_TIMESTAMP
+            WHERE wallet = ? AND derivation_index = (
+                SELECT derivation_index FROM deposit_addresses INDEXED BY idx_deposit_addresses_free
+                WHERE wallet = ? AND order_id IS NULL
+                ORDER BY derivation_index
+                LIMIT 1
+            )
+            RETURNING derivation_index, address
+            """,
+            (order_id, self.wallet.fingerprint, self.wallet.fingerprint)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            self.empty += 1
+            self.wake()
+            return None
+        self.claimed += 1
+        # The filler checks the low-water mark (an indexed count) and tops up if needed
+        self.wake()
+        return row["derivation_index"], row["address"]
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.available() < self.low_water:
+                    added = await self.fill()
+                    if added:
+                        print(f"🔑 Derived {added} deposit address(es).")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"🚨 Deposit address pool error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=DEPOSIT_POOL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "running": self._task is not None,
+            "wallet": self.wallet.fingerprint,
+            "derived": self.derived,
+            "claimed": self.claimed,
+            "refills": self.refills,
+            "empty": self.empty,
+        }
+
+
+if __name__ == "__main__":
+    # Prints the address and private key for a derivation index, for sweeping funds.
+    # Pass the order's deposit_wallet too, so a changed HD_WALLET_ACCOUNT or
+    # passphrase can't silently derive the wrong key.
+    wallet = load_wallet_from_env()
+    if wallet is None or len(sys.argv) not in (2, 3):
+        sys.exit("Usage: HD_WALLET_MNEMONIC=... python -m dinechain_api.services.hd_wallet <derivation_index> [<deposit_wallet>]")
+    index = int(sys.argv[1])
+    if len(sys.argv) == 3 and sys.argv[2] != wallet.fingerprint:
+        sys.exit(
+            f"This order was derived from wallet {sys.argv[2]}, but the configured wallet is {wallet.fingerprint} "
+            f"({wallet.path_prefix}). Check HD_WALLET_PASSPHRASE, and HD_WALLET_ACCOUNT against the order's derivation_path."
+        )
+    print(f"{wallet.path(index)}  {wallet.address(index)}  0x{wallet.private_key(index).hex()}")
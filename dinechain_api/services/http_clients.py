@@ -0,0 +1,57 @@
+import os
+import importlib.util
+import httpx
+
+# One keep-alive connection pool per upstream, created once on the app loop and
+# reused by every outbound call so requests skip the TCP/TLS handshake.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+UPSTREAM_TIMEOUTS = {
+    "telegram": float(os.getenv("TELEGRAM_HTTP_TIMEOUT", "10")),
+    "twilio": float(os.getenv("TWILIO_HTTP_TIMEOUT", "15")),
+    "llm": float(os.getenv("LLM_HTTP_TIMEOUT", "30")),
+    "snowtrace": float(os.getenv("SNOWTRACE_HTTP_TIMEOUT", "30")),
+}
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+_clients = {}
+
+
+def _build_client(name):
+    timeout = UPSTREAM_TIMEOUTS.get(name, 30.0)
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=httpx.Timeout(timeout, connect=min(HTTP_CONNECT_TIMEOUT, timeout)),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_http_client(name):
+    """Returns the shared client for an upstream, creating it on first use."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+    return client
+
+
+async def init_http_clients():
+    """Creates the pooled clients for every known upstream. Call on the app loop."""
+    for name in UPSTREAM_TIMEOUTS:
+        get_http_client(name)
+    print(f"✅ HTTP clients ready (http2={'on' if HTTP2_AVAILABLE else 'off'}).")
+
+
+async def close_http_clients():
+    """Closes every pooled client and drops its connections."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,106 @@
+import asyncio
+import contextvars
+import os
+from contextlib import contextmanager
+
+# Replies returned in the webhook response itself (TwiML <Message> for
+# WhatsApp, Telegram's method-in-response) instead of a separate outbound API
+# call. The webhook waits up to INLINE_REPLY_DEADLINE for the turn's first
+# reply; anything later, or any further message in the same turn, goes out
+# through the API as before. Off by default: a waiting webhook holds its
+# server thread, which the fast-ack webhooks otherwise never do.
+INLINE_REPLIES = os.getenv("INLINE_REPLIES", "0").lower() in ("1", "true", "yes")
+INLINE_REPLY_DEADLINE = float(os.getenv("INLINE_REPLY_DEADLINE", "2.5"))
+# Longer replies are sent through the API (Telegram's limit; Twilio's per-message limit)
+INLINE_REPLY_MAX_CHARS = {"telegram": 4096, "whatsapp": 1600}
+
+_current = contextvars.ContextVar("inline_reply", default=None)
+
+inline_stats = {"inline": 0, "late": 0}
+
+
+class InlineReply:
+    """One webhook's slot for an inline reply.
+
+    The webhook view awaits ``wait()``; the message worker's first reply for
+    the same chat fills the slot through ``offer()``. Both run on the app
+    loop, so once ``wait()`` has given up no reply can slip in afterwards.
+    """
+
+    def __init__(self, platform, chat_id):
+        self.platform = platform
+        self.chat_id = chat_id
+        self._future = asyncio.get_running_loop().create_future()
+        self._responded = asyncio.Event()
+        self.claimed = False
+
+    def offer(self, text):
+        """Takes ``text`` as the inline reply. Returns False if the slot is closed or the text is too long."""
+        if self._future.done() or len(text) > INLINE_REPLY_MAX_CHARS.get(self.platform, 1600):
+            return False
+        self.claimed = True
+        self._future.set_result(text)
+        return True
+
+    def close(self):
+        """Releases the webhook without a reply (nothing to say, or the reply is streamed)."""
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout=INLINE_REPLY_DEADLINE):
+        """The inline reply text, or None if none was offered within ``timeout``."""
+        try:
+            text = await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            text = None
+            inline_stats["late"] += 1
+        self.close()
+        if text is not None:
+            inline_stats["inline"] += 1
+        return text
+
+    def responded(self):
+        """Called by the webhook once its response is built."""
+        self._responded.set()
+
+    async def wait_responded(self, timeout=1.0):
+        """Keeps a follow-up message from overtaking the inline reply."""
+        try:
+            await asyncio.wait_for(self._responded.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+@contextmanager
+def replying_inline(inline_reply):
+    """Makes ``inline_reply`` available to ``send_inline`` for the duration of one turn."""
+    token = _current.set(inline_reply)
+    try:
+        yield inline_reply
+    finally:
+        _current.reset(token)
+        if inline_reply:
+            inline_reply.close()
+
+
+def release_inline_reply():
+    """Lets the current turn's webhook respond now; used when the reply is streamed instead."""
+    inline_reply = _current.get()
+    if inline_reply:
+        inline_reply.close()
+
+
+async def send_inline(platform, chat_id, text):
+    """Hands ``text`` to the waiting webhook. Returns False if it must be sent through the API."""
+    inline_reply = _current.get()
+    if not inline_reply or (inline_reply.platform, inline_reply.chat_id) != (platform, chat_id):
+        return False
+    if inline_reply.offer(text):
+        return True
+    if inline_reply.claimed:
+        await inline_reply.wait_responded()
+    return False
+
+
+def get_inline_reply_stats():
+    return {"enabled": INLINE_REPLIES, "deadline": INLINE_REPLY_DEADLINE, **inline_stats}
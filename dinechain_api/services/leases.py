@@ -0,0 +1,49 @@
+import os
+import socket
+import time
+import uuid
+from ..blueprints.orders import get_db_conn
+
+# Identifies this process as a lease holder across every worker on the host
+PROCESS_OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(name, ttl, owner=PROCESS_OWNER_ID):
+    """Takes (or re-takes) the named lease if it is free, expired or already ours."""
+    now = time.time()
+    async with get_db_conn() as conn:
+        cursor = await conn.execute(
+            """
+            INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+            """,
+            (name, owner, now + ttl, now),
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def renew_lease(name, ttl, owner=PROCESS_OWNER_ID):
+    """Extends a lease we hold. Returns False if it was lost to another owner."""
+    async with get_db_conn() as conn:
+        cursor = await conn.execute(
+            "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl, name, owner),
+        )
+        await conn.commit()
+        return cursor.rowcount == 1
+
+
+async def release_lease(name, owner=PROCESS_OWNER_ID):
+    async with get_db_conn() as conn:
+        await conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+        await conn.commit()
+
+
+async def purge_expired_leases():
+    """Drops leases left behind by processes that died while holding them."""
+    async with get_db_conn() as conn:
+        cursor = await conn.execute("DELETE FROM leases WHERE expires_at < ?", (time.time(),))
+        await conn.commit()
+        return cursor.rowcount
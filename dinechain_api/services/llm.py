@@ -1,28 +1,264 @@
+import hashlib
+import json
 import os
-import httpx
-
-async def get_llm_response(history):
-    """Calls the IO Intelligence API to get a response."""
-    LLM_BASE_URL = "https://api.intelligence.io.solutions/api/v1"
-    IOINTELLIGENCE_API_KEY = os.getenv("LLM_API_KEY")
-
-    if not LLM_BASE_URL or not IOINTELLIGENCE_API_KEY:
-        raise ValueError("BASE_URL and LLM_API_KEY must be set in the environment.")
-        
-    url = f"{LLM_BASE_URL}/chat/completions"
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {IOINTELLIGENCE_API_KEY}"
-    }
-    data = {
-        "model": "meta-llama/Llama-3.2-90B-Vision-Instruct",
+import re
+import time
+from collections import Counter, OrderedDict
+from .http_clients import get_http_client
+from .llm_router import llm_router
+from ..blueprints.orders import get_db_conn
+
+# Response cache: an in-memory LRU in front of an optional SQLite tier. Keys
+# hash the normalised message list and model parameters; entries are grouped
+# by the prompt template's id and version (see prompts.prompt_namespace), so
+# bumping a template's version never serves stale replies and old namespaces
+# can be purged.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+LLM_CACHE_SQLITE = os.getenv("LLM_CACHE_SQLITE", "0").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_SQLITE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SQLITE_MAX_ENTRIES", "20000"))
+# Only the opening turns of a conversation are generic enough to share
+LLM_CACHE_MAX_USER_TURNS = int(os.getenv("LLM_CACHE_MAX_USER_TURNS", "2"))
+LLM_CACHE_MAX_USER_CHARS = int(os.getenv("LLM_CACHE_MAX_USER_CHARS", "80"))
+
+llm_cache_stats = Counter()
+
+
+def _normalize_content(role, content):
+    if role != "user":
+        return content
+    content = re.sub(r"\s+", " ", content.strip().lower())
+    return content.rstrip("!?. ")
+
+
+def cache_key(data, namespace):
+    payload = json.dumps({
+        "namespace": namespace,
+        "model": data["model"],
+        "temperature": data["temperature"],
+        "max_tokens": data["max_tokens"],
+        "messages": [[msg["role"], _normalize_content(msg["role"], msg["content"])] for msg in data["messages"]],
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_cacheable_conversation(history):
+    """True for the short, generic opening turns that many conversations share.
+
+    ``history`` is the conversation's own messages, without the prompt template.
+    Anything that may carry customer details (numbers, emails, long free text, or
+    a conversation past its opening turns) is never cached.
+    """
+    user_messages = [msg["content"] for msg in history if msg["role"] == "user"]
+    if len(user_messages) > LLM_CACHE_MAX_USER_TURNS:
+        return False
+    return all(len(text) <= LLM_CACHE_MAX_USER_CHARS and not re.search(r"\d|@", text) for text in user_messages)
+
+
+def is_cacheable_response(result):
+    try:
+        content = result["choices"][0]["message"]["content"] or ""
+    except (KeyError, IndexError, TypeError):
+        return False
+    # Final order summaries are tied to one customer's order
+    return bool(content) and "```json" not in content
+
+
+class LLMResponseCache:
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl=LLM_CACHE_TTL, use_sqlite=LLM_CACHE_SQLITE,
+                 sqlite_max_entries=LLM_CACHE_SQLITE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_sqlite = use_sqlite
+        self.sqlite_max_entries = sqlite_max_entries
+        self._entries = OrderedDict()
+        self._writes_since_prune = 0
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, _, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                llm_cache_stats["hits.memory"] += 1
+                return value
+            del self._entries[key]
+
+        if self.use_sqlite:
+            async with get_db_conn(readonly=True) as conn:
+                cursor = await conn.execute(
+                    "SELECT namespace, response, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                )
+                row = await cursor.fetchone()
+            if row:
+                value = json.loads(row['response'])
+                self._remember(key, row['namespace'], value, row['expires_at'])
+                llm_cache_stats["hits.sqlite"] += 1
+                return value
+
+        llm_cache_stats["misses"] += 1
+        return None
+
+    def _remember(self, key, namespace, value, expires_at):
+        self._entries[key] = (expires_at, namespace, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def set(self, key, namespace, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, namespace, value, expires_at)
+        llm_cache_stats["stores"] += 1
+        if not self.use_sqlite:
+            return
+        async with get_db_conn() as conn:
+            await conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, namespace, response, expires_at) VALUES (?, ?, ?, ?)",
+                (key, namespace, json.dumps(value), expires_at)
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._writes_since_prune = 0
+                await conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+                await conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.sqlite_max_entries,)
+                )
+            await conn.commit()
+
+    async def invalidate(self, keep_namespaces=None):
+        """Drops every entry, or only those outside ``keep_namespaces``."""
+        keep = set(keep_namespaces or ())
+        for key in [k for k, (_, namespace, _) in self._entries.items() if namespace not in keep]:
+            del self._entries[key]
+        if not self.use_sqlite:
+            return
+        async with get_db_conn() as conn:
+            placeholders = ", ".join("?" for _ in keep)
+            await conn.execute(f"DELETE FROM llm_cache WHERE namespace NOT IN ({placeholders})", tuple(keep))
+            await conn.commit()
+
+    def stats(self):
+        hits = llm_cache_stats["hits.memory"] + llm_cache_stats["hits.sqlite"]
+        lookups = hits + llm_cache_stats["misses"]
+        return {
+            "enabled": LLM_CACHE_ENABLED,
+            "sqlite": self.use_sqlite,
+            "entries": len(self._entries),
+            "hits": hits,
+            "hits_memory": llm_cache_stats["hits.memory"],
+            "hits_sqlite": llm_cache_stats["hits.sqlite"],
+            "misses": llm_cache_stats["misses"],
+            "uncacheable": llm_cache_stats["uncacheable"],
+            "stores": llm_cache_stats["stores"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+llm_cache = LLMResponseCache()
+
+
+def _build_llm_request(history):
+    if not llm_router.backends or not all(backend.api_key for backend in llm_router.backends):
+        raise ValueError("LLM_API_KEY (or api keys for every LLM_PROVIDERS entry) must be set in the environment.")
+
+    # The model here only keys the cache; each backend sends its own model
+    return {
+        "model": llm_router.backends[0].model,
         "messages": [{"role": msg["role"], "content": msg["content"]} for msg in history],
         "temperature": 0.7,
         "max_tokens": 400
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, json=data, timeout=30.0)
+
+async def _cached_response(data, cacheable, namespace):
+    """Returns (cache key or None, cached result or None) for a request."""
+    if not (cacheable and namespace and LLM_CACHE_ENABLED):
+        llm_cache_stats["uncacheable"] += 1
+        return None, None
+    key = cache_key(data, namespace)
+    return key, await llm_cache.get(key)
+
+
+async def get_llm_response(history, cacheable=False, namespace=None):
+    """Calls the IO Intelligence API to get a response.
+
+    Set ``cacheable`` only when the reply cannot depend on customer-specific data
+    (see ``is_cacheable_conversation``). Replies are only cached under a
+    ``namespace`` (the prompt template's ``prompt_namespace``).
+    """
+    data = _build_llm_request(history)
+    key, cached = await _cached_response(data, cacheable, namespace)
+    if cached is not None:
+        return cached
+
+    client = get_http_client("llm")
+
+    async def post_completion(backend, timeout):
+        response = await client.post(
+            backend.url, headers=backend.headers, json={**data, "model": backend.model}, timeout=timeout
+        )
         response.raise_for_status()
-        return response.json() 
+        return response.json()
+
+    result = await llm_router.call(post_completion)
+
+    if key and is_cacheable_response(result):
+        await llm_cache.set(key, namespace, result)
+    return result
+
+
+async def stream_llm_response(history, cacheable=False, namespace=None):
+    """Streams the reply from the chat-completions SSE endpoint, yielding text deltas as they arrive.
+
+    Retries and fallbacks apply until the stream is open; once text has been
+    yielded a failure is raised to the caller.
+    """
+    data = _build_llm_request(history)
+    key, cached = await _cached_response(data, cacheable, namespace)
+    if cached is not None:
+        yield cached["choices"][0]["message"]["content"] or ""
+        return
+
+    client = get_http_client("llm")
+
+    async def open_stream(backend, timeout):
+        request = client.build_request(
+            "POST", backend.url, headers=backend.headers,
+            json={**data, "model": backend.model, "stream": True}, timeout=timeout
+        )
+        response = await client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+
+    # Routing, retries and hedging cover opening the stream (time to first byte)
+    response = await llm_router.call(open_stream, release=lambda response: response.aclose())
+    parts = []
+    try:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            chunk = json.loads(payload)
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        await response.aclose()
+
+    result = {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+    if key and is_cacheable_response(result):
+        await llm_cache.set(key, namespace, result)
+
+
+def get_llm_client_stats():
+    return llm_router.stats()
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+import httpx
+from dotenv import load_dotenv
+from .resilience import CircuitBreaker, CircuitOpenError, backoff_delay, is_retryable, retry_after_seconds
+
+# Registry of OpenAI-compatible chat-completions backends plus a router that
+# sends each request to a healthy one. Backends come from LLM_PROVIDERS (a JSON
+# list), which are peers ranked by latency, or by default from
+# LLM_BASE_URL/LLM_API_KEY with LLM_MODEL followed by each of
+# LLM_FALLBACK_MODELS, which are tried strictly in that order.
+load_dotenv()
+
+DEFAULT_LLM_BASE_URL = "https://api.intelligence.io.solutions/api/v1"
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+# Per-attempt timeout and the total time a single turn may spend on the LLM
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "15"))
+LLM_TURN_BUDGET = float(os.getenv("LLM_TURN_BUDGET", "25"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("LLM_BREAKER_RECOVERY_TIMEOUT", "30"))
+
+LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.3"))
+# Assumed latency for a backend with no samples yet, so registry order decides
+LLM_ROUTER_DEFAULT_LATENCY = float(os.getenv("LLM_ROUTER_DEFAULT_LATENCY", "2.0"))
+# Share of requests sent to a random healthy backend to keep its stats fresh
+LLM_ROUTER_EXPLORE_RATE = float(os.getenv("LLM_ROUTER_EXPLORE_RATE", "0.05"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+
+class LLMUnavailableError(Exception):
+    """Every backend failed, was circuit-broken, or the turn's latency budget ran out."""
+
+
+class LLMBackend:
+    def __init__(self, name, base_url, api_key, model):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.breaker = CircuitBreaker(
+            f"llm:{name}", failure_threshold=LLM_BREAKER_FAILURE_THRESHOLD, recovery_timeout=LLM_BREAKER_RECOVERY_TIMEOUT
+        )
+        self.ewma_latency = None
+        self.ewma_error_rate = 0.0
+        self.latencies = deque(maxlen=100)
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"{self.base_url}/chat/completions"
+
+    @property
+    def headers(self):
+        return {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+
+    def record(self, latency, ok):
+        alpha = LLM_ROUTER_EWMA_ALPHA
+        self.requests += 1
+        self.ewma_error_rate = alpha * (0.0 if ok else 1.0) + (1 - alpha) * self.ewma_error_rate
+        if ok:
+            self.latencies.append(latency)
+            self.ewma_latency = latency if self.ewma_latency is None else alpha * latency + (1 - alpha) * self.ewma_latency
+
+    def score(self):
+        """Expected cost of sending a request here; lower is better."""
+        latency = self.ewma_latency if self.ewma_latency is not None else LLM_ROUTER_DEFAULT_LATENCY
+        return latency * (1 + 4 * self.ewma_error_rate)
+
+    def p95_latency(self):
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "base_url": self.base_url,
+            "requests": self.requests,
+            "ewma_latency": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            "ewma_error_rate": round(self.ewma_error_rate, 4),
+            "p95_latency": self.p95_latency(),
+            "breaker": self.breaker.stats(),
+        }
+
+
+def load_backends_from_env():
+    providers = os.getenv("LLM_PROVIDERS")
+    if providers:
+        backends = []
+        for i, provider in enumerate(json.loads(providers)):
+            api_key = provider.get("api_key") or os.getenv(provider.get("api_key_env", "LLM_API_KEY"))
+            backends.append(LLMBackend(
+                provider.get("name") or f"provider-{i}", provider["base_url"], api_key, provider["model"]
+            ))
+        return backends
+
+    base_url = os.getenv("LLM_BASE_URL") or DEFAULT_LLM_BASE_URL
+    api_key = os.getenv("LLM_API_KEY")
+    models = [os.getenv("LLM_MODEL", "meta-llama/Llama-3.2-90B-Vision-Instruct")] + os.getenv("LLM_FALLBACK_MODELS", "").split(",")
+    return [LLMBackend(model.strip(), base_url, api_key, model.strip()) for model in models if model.strip()]
+
+
+class LLMRouter:
+    """Routes each call to a healthy backend, with retries, fallbacks and optional hedging.
+
+    ``call(backend, timeout)`` performs one attempt against one backend. With
+    ``adaptive`` the backends are ranked by EWMA latency weighted by EWMA error
+    rate; otherwise they are tried in registry order (primary first). Open
+    circuits are skipped. With hedging enabled a duplicate request goes to the
+    next backend if the first hasn't answered within its p95 latency, and the
+    first success wins.
+    """
+
+    def __init__(self, backends, adaptive=False, hedge=LLM_HEDGE_ENABLED, turn_budget=LLM_TURN_BUDGET):
+        self.backends = backends
+        self.adaptive = adaptive
+        self.hedge = hedge
+        self.turn_budget = turn_budget
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+
+    def ranked(self):
+        if not self.adaptive:
+            return list(self.backends)
+        order = sorted(self.backends, key=lambda backend: (backend.score(), self.backends.index(backend)))
+        if len(order) > 1 and random.random() < LLM_ROUTER_EXPLORE_RATE:
+            order.insert(0, order.pop(random.randrange(1, len(order))))
+        return order
+
+    async def _try_backend(self, backend, call, deadline):
+        """One backend with bounded retries; returns the result or raises the last error."""
+        if not backend.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {backend.name}")
+        last_error = None
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMUnavailableError("LLM latency budget exhausted") from last_error
+            started = time.monotonic()
+            try:
+                result = await call(backend, min(LLM_ATTEMPT_TIMEOUT, remaining))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_error = e
+                rejected = isinstance(e, httpx.HTTPStatusError) and e.response.status_code in (401, 403)
+                if not (is_retryable(e) or rejected):
+                    raise
+                backend.record(time.monotonic() - started, ok=False)
+                backend.breaker.record_failure()
+                if rejected:
+                    # Bad credentials won't fix themselves on a retry
+                    print(f"⚠️ LLM backend {backend.name} rejected our credentials.")
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = backoff_delay(attempt, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY)
+                if attempt == LLM_MAX_RETRIES or not backend.breaker.allow() or time.monotonic() + delay >= deadline:
+                    raise
+                print(f"🔁 Retrying LLM call on {backend.name} in {delay:.2f}s after: {type(e).__name__}")
+                await asyncio.sleep(delay)
+            else:
+                backend.record(time.monotonic() - started, ok=True)
+                backend.breaker.record_success()
+                return result
+        raise last_error
+
+    async def _discard(self, tasks, release):
+        """Cancels the attempts that lost a hedge and releases any result they still produced."""
+        for task in tasks:
+            task.cancel()
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if release and not isinstance(result, BaseException):
+                try:
+                    await release(result)
+                except Exception as e:
+                    print(f"⚠️ Could not release a hedged LLM response: {e}")
+
+    async def _hedged(self, primary, secondary, call, deadline, release):
+        """Tries ``primary``, racing ``secondary`` against it if it is slow; both are tried before giving up."""
+        first = asyncio.create_task(self._try_backend(primary, call, deadline))
+        delay = max(LLM_HEDGE_MIN_DELAY, primary.p95_latency() or 0.0)
+        try:
+            done, _ = await asyncio.wait({first}, timeout=min(delay, max(0.0, deadline - time.monotonic())))
+        except asyncio.CancelledError:
+            await self._discard([first], release)
+            raise
+        if done:
+            if first.exception() is None:
+                return first.result()
+            # The primary failed fast (e.g. a 400 for this model); plain failover
+            print(f"⚠️ LLM backend {primary.name} failed ({type(first.exception()).__name__}); trying {secondary.name}.")
+            return await self._try_backend(secondary, call, deadline)
+
+        self.hedged_requests += 1
+        second = asyncio.create_task(self._try_backend(secondary, call, deadline))
+        pending = {first, second}
+        winner = None
+        error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+            if winner is None:
+                raise error
+            if winner is second:
+                self.hedge_wins += 1
+            return winner.result()
+        finally:
+            # Both attempts may have succeeded; the loser's response must still be closed
+            await self._discard([task for task in (first, second) if task is not winner], release)
+
+    async def call(self, call, release=None):
+        """Runs ``call`` on the backends in turn until one succeeds.
+
+        ``release(result)`` is awaited for a result that is not returned (the
+        losing side of a hedge), e.g. to close a streaming response.
+        """
+        deadline = time.monotonic() + self.turn_budget
+        candidates = self.ranked()
+        last_error = None
+        i = 0
+        while i < len(candidates):
+            if time.monotonic() >= deadline:
+                raise LLMUnavailableError("LLM latency budget exhausted") from last_error
+            backend = candidates[i]
+            try:
+                # Only a healthy pair is hedged; _hedged tries both before it fails
+                if (self.hedge and i + 1 < len(candidates)
+                        and backend.breaker.state == "closed" and candidates[i + 1].breaker.state == "closed"):
+                    secondary = candidates[i + 1]
+                    i += 2
+                    return await self._hedged(backend, secondary, call, deadline, release)
+                i += 1
+                return await self._try_backend(backend, call, deadline)
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                # Fall through to the next backend (e.g. rejected credentials, or 400/404 for this model)
+                last_error = e
+        raise LLMUnavailableError(
+            f"All LLM backends failed; last error: {type(last_error).__name__}: {last_error}"
+        ) from last_error
+
+    def stats(self):
+        return {
+            "hedging": self.hedge,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "backends": {backend.name: backend.stats() for backend in self.backends},
+        }
+
+
+# Latency ranking only makes sense between real peers; the default
+# LLM_MODEL/LLM_FALLBACK_MODELS chain keeps its primary-first order
+llm_router = LLMRouter(load_backends_from_env(), adaptive=bool(os.getenv("LLM_PROVIDERS")))
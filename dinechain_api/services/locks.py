@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from .leases import acquire_lease, renew_lease, release_lease, purge_expired_leases
+
+CONVERSATION_LOCK_MAX = int(os.getenv("CONVERSATION_LOCK_MAX", "10000"))
+CONVERSATION_LOCK_IDLE_TTL = float(os.getenv("CONVERSATION_LOCK_IDLE_TTL", "600"))
+CONVERSATION_LOCKS_CROSS_PROCESS = os.getenv("CONVERSATION_LOCKS_CROSS_PROCESS", "0").lower() in ("1", "true", "yes")
+CONVERSATION_LEASE_TTL = float(os.getenv("CONVERSATION_LEASE_TTL", "30"))
+
+
+class _LockEntry:
+    __slots__ = ("lock", "users", "last_used")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationLocks:
+    """Per-conversation mutual exclusion with bounded memory.
+
+    In-process locks are kept in LRU order and evicted once idle for longer than
+    ``idle_ttl`` or when more than ``max_locks`` exist. With ``cross_process`` the
+    in-process lock is backed by a lease row in SQLite, so several worker
+    processes never interleave turns for the same chat.
+    """
+
+    def __init__(self, max_locks=CONVERSATION_LOCK_MAX, idle_ttl=CONVERSATION_LOCK_IDLE_TTL,
+                 cross_process=CONVERSATION_LOCKS_CROSS_PROCESS, lease_ttl=CONVERSATION_LEASE_TTL):
+        self.max_locks = max_locks
+        self.idle_ttl = idle_ttl
+        self.cross_process = cross_process
+        self.lease_ttl = lease_ttl
+        self._entries = OrderedDict()
+        self._last_purge = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for _ in range(len(self._entries)):
+            key, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_locks and entry.last_used >= cutoff:
+                # Entries are in LRU order, so everything after this is newer
+                break
+            if entry.users:
+                # Still held or awaited; it is active, so treat it as recently used
+                self._entries.move_to_end(key)
+            else:
+                del self._entries[key]
+
+    @asynccontextmanager
+    async def hold(self, platform, chat_id):
+        key = (platform, chat_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _LockEntry()
+        self._entries.move_to_end(key)
+        entry.users += 1
+        try:
+            async with entry.lock:
+                if self.cross_process:
+                    async with self._lease(f"conversation:{platform}:{chat_id}"):
+                        yield
+                else:
+                    yield
+        finally:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            if self._entries.get(key) is entry:
+                self._entries.move_to_end(key)
+            self._evict()
+
+    @asynccontextmanager
+    async def _lease(self, name):
+        # A live holder keeps renewing its lease and a dead one's lease expires,
+        # so waiting until we get it never drops the message; just say why it's slow
+        delay = 0.05
+        started = time.monotonic()
+        next_warning = started + 2 * self.lease_ttl
+        while not await acquire_lease(name, self.lease_ttl):
+            if time.monotonic() > next_warning:
+                print(f"⏳ Still waiting for lease {name} after {time.monotonic() - started:.0f}s; its holder is still renewing it.")
+                next_warning = time.monotonic() + 2 * self.lease_ttl
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+        async def keep_renewed():
+            while True:
+                await asyncio.sleep(self.lease_ttl / 3)
+                if not await renew_lease(name, self.lease_ttl):
+                    print(f"⚠️ Lost lease {name} while holding it.")
+                    return
+
+        renewer = asyncio.create_task(keep_renewed())
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await release_lease(name)
+            await self._maybe_purge()
+
+    async def _maybe_purge(self):
+        if time.monotonic() - self._last_purge < self.lease_ttl:
+            return
+        self._last_purge = time.monotonic()
+        await purge_expired_leases()
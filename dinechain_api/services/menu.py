@@ -0,0 +1,115 @@
+import re
+from collections import namedtuple
+
+# Structured copy of today's menu. Prices are in cents, matching the order JSON.
+# The system prompt, the fast path and order line items all read from here.
+MenuItem = namedtuple("MenuItem", ["id", "name", "category", "price"])
+
+MENU = {
+    "Main Meal": [
+        ("Jollof Rice", 80), ("Fried Rice", 80), ("WhiteRice/Beans", 80),
+        ("Beans Porridge", 80), ("Yam Porridge", 80), ("Pasta", 80),
+    ],
+    "Soups": [("Egusi", 70), ("Ogbnor", 70), ("Vegetable", 70), ("Efo Riro", 70)],
+    "Swallows": [("Semo", 20), ("Apu", 20), ("Garri", 20), ("Pounded Yam", 20)],
+    "Local Fridays": [("Friday Dish", 100)],
+    "Protein": [
+        ("Eggs", 30), ("Turkey", 80), ("Chicken", 70), ("Fish", 50), ("Goat Meat", 70), ("Beef", 50),
+    ],
+    "Pastries": [
+        ("Meat Pie", 70), ("Sausage Roll", 50), ("Fish Roll", 50), ("Dough Nut", 50), ("Cakes", 70), ("Cookies", 50),
+    ],
+    "Shawarma": [
+        ("Beef", 150), ("Chicken", 150), ("Single Sausage", 50), ("Double Sausage", 80),
+        ("Combo", 200), ("Combo with Double Sausage", 250),
+    ],
+    "Cocktails": [
+        ("Virgin Daiquiri", 150), ("Virgin Mojito", 150), ("Tequila Sunrise", 150), ("Pinacolada", 150),
+        ("Chapman", 150), ("Coffee Boba", 150), ("Strawberry", 150),
+    ],
+    "Milkshake & Dairy": [
+        ("Oreo", 150), ("Strawberry", 150), ("Ice Cream", 150), ("Sweetneded Greek Yogurt", 150),
+        ("Unsweetneded Greek Yogurt", 150), ("Strawberry Yogurt", 150), ("Fura Yogo", 150),
+    ],
+    "Fruit Drinks": [
+        ("Pineapple", 100), ("Orange", 100), ("Mix Fruit", 100), ("Carrot", 100), ("Fruity Zobo", 100), ("Tiger Nut Milk", 100),
+    ],
+    "Soda": [
+        ("Coke", 60), ("Fanta", 60), ("Sprite", 60), ("Schweppes Chapman", 70), ("Schweppes Mojito", 70),
+        ("Can Malt", 60), ("Predator", 80), ("5Alive Berry", 70), ("5Alive Pulpy", 70), ("Bottle Water", 40),
+        ("Chivita 100%", 80), ("Chiexotic", 70),
+    ],
+}
+
+FOOD_CATEGORIES = ("Main Meal", "Soups", "Swallows", "Local Fridays", "Protein", "Pastries", "Shawarma")
+DRINK_CATEGORIES = ("Cocktails", "Milkshake & Dairy", "Fruit Drinks", "Soda")
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+MENU_ITEMS = [
+    MenuItem(id=f"{_slug(category)}/{_slug(name)}", name=name, category=category, price=price)
+    for category, items in MENU.items()
+    for name, price in items
+]
+MENU_ITEMS_BY_ID = {item.id: item for item in MENU_ITEMS}
+_DUPLICATE_NAMES = {
+    name for name in (item.name for item in MENU_ITEMS)
+    if sum(1 for item in MENU_ITEMS if item.name == name) > 1
+}
+
+
+def format_price(cents):
+    return f"${cents / 100:.2f}"
+
+
+def display_name(item):
+    """Item name, qualified by category when the same name is on the menu twice (e.g. Beef)."""
+    if item.name in _DUPLICATE_NAMES:
+        return f"{item.name} ({item.category})"
+    return item.name
+
+
+def format_menu_for_prompt():
+    """The menu as the single-line-per-category text used in the system prompt."""
+    return "".join(
+        f"{category}: " + ", ".join(f"{name} ({format_price(price)})" for name, price in items)
+        for category, items in MENU.items()
+    )
+
+
+def find_menu_item(name):
+    """Best-effort lookup of a menu item by display name, e.g. from order JSON. Returns None if unknown or ambiguous."""
+    key = name.strip().lower()
+    matches = [item for item in MENU_ITEMS if item.name.lower() == key]
+    if len(matches) == 1:
+        return matches[0]
+    # "Beef Shawarma" / "Strawberry Milkshake" style names qualify duplicates by category
+    qualified = [
+        item for item in matches or MENU_ITEMS
+        if key in (f"{item.name} {item.category}".lower(), f"{item.category} {item.name}".lower())
+        or _slug(key) in (_slug(f"{item.name} {item.category}"), _slug(f"{item.category} {item.name}"))
+    ]
+    return qualified[0] if len(qualified) == 1 else None
+
+
+def order_lines(items):
+    """Normalises order JSON items into ``(menu_item_id, name, unit_price_cents, quantity)`` rows.
+
+    Prices come from the order itself (what the customer was quoted); the menu
+    id is None for items that can't be matched to the menu.
+    """
+    lines = []
+    for item in items or []:
+        if not isinstance(item, dict) or not item.get("name"):
+            continue
+        try:
+            unit_price = int(item.get("price") or 0)
+            quantity = max(int(item.get("quantity") or 1), 1)
+        except (TypeError, ValueError):
+            continue
+        menu_item = find_menu_item(str(item["name"]))
+        lines.append((menu_item.id if menu_item else None, str(item["name"]), unit_price, quantity))
+    return lines
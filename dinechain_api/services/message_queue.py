@@ -0,0 +1,96 @@
+import asyncio
+import os
+import zlib
+
+MESSAGE_WORKERS = int(os.getenv("MESSAGE_WORKERS", "8"))
+MESSAGE_SHARD_BACKLOG = int(os.getenv("MESSAGE_SHARD_BACKLOG", "100"))
+MESSAGE_QUEUE_MAX = int(os.getenv("MESSAGE_QUEUE_MAX", "500"))
+
+
+class MessageQueue:
+    """Per-chat ordered work queue that lets webhooks acknowledge immediately.
+
+    Messages are sharded by (platform, chat_id) onto one queue per worker, so a
+    single chat is always handled in arrival order by the same worker while
+    different chats are processed in parallel.
+    """
+
+    def __init__(self, handler, workers=MESSAGE_WORKERS, shard_backlog=MESSAGE_SHARD_BACKLOG, max_depth=MESSAGE_QUEUE_MAX):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.shard_backlog = shard_backlog
+        self.max_depth = max_depth
+        self._shards = []
+        self._tasks = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _shard_for(self, platform, chat_id):
+        return zlib.crc32(f"{platform}:{chat_id}".encode()) % self.workers
+
+    def depth(self):
+        return sum(shard.qsize() for shard in self._shards)
+
+    async def start(self):
+        """Starts the worker tasks. Must be awaited on the app loop."""
+        if self._tasks:
+            return
+        self._shards = [asyncio.Queue(maxsize=self.shard_backlog) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(shard), name=f"message-worker-{i}")
+            for i, shard in enumerate(self._shards)
+        ]
+        print(f"📬 Message queue started with {self.workers} worker(s).")
+
+    def enqueue(self, platform, chat_id, *args):
+        """Queues a message for processing. Returns False when the queue is full."""
+        if not self._shards:
+            raise RuntimeError("MessageQueue.start() has not been awaited.")
+        if self.depth() >= self.max_depth:
+            self.rejected += 1
+            return False
+        try:
+            self._shards[self._shard_for(platform, chat_id)].put_nowait((platform, chat_id, args))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    async def _worker(self, shard):
+        while True:
+            platform, chat_id, args = await shard.get()
+            try:
+                await self.handler(platform, chat_id, *args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Dropped message for {platform}:{chat_id} after an error: {type(e).__name__}: {e}")
+            finally:
+                shard.task_done()
+
+    def stats(self):
+        shard_depths = [shard.qsize() for shard in self._shards]
+        return {
+            "workers": self.workers,
+            "depth": sum(shard_depths),
+            "max_depth": self.max_depth,
+            "shard_backlog": self.shard_backlog,
+            "shard_depths": shard_depths,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    async def stop(self, drain_timeout=5.0):
+        """Waits briefly for queued messages to finish, then cancels the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(shard.join() for shard in self._shards)), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Message queue stopped with {self.depth()} message(s) still queued.")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,459 @@
+# Numbered schema migrations, applied in order at startup and tracked in the
+# schema_version table. Never edit a migration that has shipped; add a new one.
+# A step is either a SQL statement or an async callable taking the connection.
+import json
+import re
+
+
+async def _move_history_blobs_to_messages(conn):
+    """Splits each conversations.history JSON blob into conversation_messages rows."""
+    last_id = 0
+    while True:
+        cursor = await conn.execute(
+            "SELECT id, history FROM conversations WHERE id > ? AND history IS NOT NULL ORDER BY id LIMIT 500",
+            (last_id,),
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        for conversation_id, history in rows:
+            try:
+                messages = json.loads(history)
+            except json.JSONDecodeError:
+                messages = []
+            await conn.executemany(
+                "INSERT INTO conversation_messages (conversation_id, role, content) VALUES (?, ?, ?)",
+                [(conversation_id, msg["role"], msg["content"]) for msg in messages],
+            )
+        last_id = rows[-1][0]
+    await conn.execute("UPDATE conversations SET history = NULL WHERE history IS NOT NULL")
+
+
+# Migration 13's own copy of the menu (names only) and of the order-line
+# parsing as they were when it shipped, so editing the live menu or parser can
+# never change what the backfill writes on a fresh database.
+_V13_MENU = {
+    "Main Meal": ("Jollof Rice", "Fried Rice", "WhiteRice/Beans", "Beans Porridge", "Yam Porridge", "Pasta"),
+    "Soups": ("Egusi", "Ogbnor", "Vegetable", "Efo Riro"),
+    "Swallows": ("Semo", "Apu", "Garri", "Pounded Yam"),
+    "Local Fridays": ("Friday Dish",),
+    "Protein": ("Eggs", "Turkey", "Chicken", "Fish", "Goat Meat", "Beef"),
+    "Pastries": ("Meat Pie", "Sausage Roll", "Fish Roll", "Dough Nut", "Cakes", "Cookies"),
+    "Shawarma": ("Beef", "Chicken", "Single Sausage", "Double Sausage", "Combo", "Combo with Double Sausage"),
+    "Cocktails": ("Virgin Daiquiri", "Virgin Mojito", "Tequila Sunrise", "Pinacolada", "Chapman", "Coffee Boba", "Strawberry"),
+    "Milkshake & Dairy": (
+        "Oreo", "Strawberry", "Ice Cream", "Sweetneded Greek Yogurt", "Unsweetneded Greek Yogurt", "Strawberry Yogurt", "Fura Yogo",
+    ),
+    "Fruit Drinks": ("Pineapple", "Orange", "Mix Fruit", "Carrot", "Fruity Zobo", "Tiger Nut Milk"),
+    "Soda": (
+        "Coke", "Fanta", "Sprite", "Schweppes Chapman", "Schweppes Mojito", "Can Malt", "Predator",
+        "5Alive Berry", "5Alive Pulpy", "Bottle Water", "Chivita 100%", "Chiexotic",
+    ),
+}
+
+
+def _v13_slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def _v13_menu_item_id(name):
+    items = [(category, item) for category, names in _V13_MENU.items() for item in names]
+    key = name.strip().lower()
+    matches = [(category, item) for category, item in items if item.lower() == key]
+    if len(matches) != 1:
+        matches = [
+            (category, item) for category, item in matches or items
+            if key in (f"{item} {category}".lower(), f"{category} {item}".lower())
+            or _v13_slug(key) in (_v13_slug(f"{item} {category}"), _v13_slug(f"{category} {item}"))
+        ]
+    if len(matches) != 1:
+        return None
+    category, item = matches[0]
+    return f"{_v13_slug(category)}/{_v13_slug(item)}"
+
+
+def _v13_order_lines(items):
+    lines = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("name"):
+            continue
+        try:
+            unit_price = int(item.get("price") or 0)
+            quantity = max(int(item.get("quantity") or 1), 1)
+        except (TypeError, ValueError):
+            continue
+        lines.append((_v13_menu_item_id(str(item["name"])), str(item["name"]), unit_price, quantity))
+    return lines
+
+
+async def _backfill_order_items(conn):
+    """Splits each order's summary JSON into order_items rows, skipping orders that already have them."""
+    last_id = 0
+    while True:
+        cursor = await conn.execute(
+            """
+            SELECT id, summary FROM orders
+            WHERE id > ? AND NOT EXISTS (SELECT 1 FROM order_items WHERE order_id = orders.id)
+            ORDER BY id LIMIT 500
+            """,
+            (last_id,),
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            break
+        for order_id, summary in rows:
+            try:
+                items = json.loads(summary) if summary else []
+            except json.JSONDecodeError:
+                items = []
+            await conn.executemany(
+                "INSERT INTO order_items (order_id, menu_item_id, name, unit_price, quantity) VALUES (?, ?, ?, ?, ?)",
+                [(order_id, *line) for line in _v13_order_lines(items if isinstance(items, list) else [])],
+            )
+        last_id = rows[-1][0]
+
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            customer_name TEXT,
+            platform TEXT,
+            summary TEXT,
+            delivery TEXT,
+            total INTEGER,
+            paid INTEGER DEFAULT 0,
+            reference TEXT,
+            payment_method TEXT,
+            deposit_address TEXT,
+            private_key TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            platform TEXT,
+            history TEXT,
+            last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(chat_id, platform)
+        )
+        """,
+        # Drop the obsolete circle_wallets table if it exists
+        "DROP TABLE IF EXISTS circle_wallets",
+    ]),
+    (2, "hot-path order indexes", [
+        # Per-message lookup: WHERE chat_id = ? AND platform = ? AND paid = 0 ORDER BY timestamp DESC
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_unpaid_by_chat
+        ON orders (chat_id, platform, timestamp DESC)
+        WHERE paid = 0
+        """,
+        # Payment watcher scan; covers the selected columns so it never touches the table
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_pending_crypto
+        ON orders (deposit_address, total)
+        WHERE paid = 0 AND payment_method = 'crypto' AND deposit_address IS NOT NULL
+        """,
+        # Admin dashboard ordering
+        "CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (timestamp DESC)",
+    ]),
+    (3, "cross-process leases", [
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_leases_expires_at ON leases (expires_at)",
+    ]),
+    (4, "append-only conversation messages", [
+        """
+        CREATE TABLE IF NOT EXISTS conversation_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id INTEGER NOT NULL REFERENCES conversations(id),
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # "Last N messages of a conversation" is a backwards range scan on this index
+        """
+        CREATE INDEX IF NOT EXISTS idx_conversation_messages_conversation
+        ON conversation_messages (conversation_id, id)
+        """,
+        _move_history_blobs_to_messages,
+    ]),
+    (5, "reference prompt templates instead of storing them", [
+        "ALTER TABLE conversations ADD COLUMN prompt_id TEXT NOT NULL DEFAULT 'ordering'",
+        # Every seeded conversation starts with the system prompt and two seed
+        # turns; those now come from the in-memory template instead
+        """
+        DELETE FROM conversation_messages WHERE id IN (
+            SELECT m.id FROM conversation_messages m
+            WHERE m.id IN (
+                SELECT first.id FROM conversation_messages first
+                WHERE first.conversation_id = m.conversation_id
+                ORDER BY first.id LIMIT 3
+            )
+            AND (
+                SELECT head.role FROM conversation_messages head
+                WHERE head.conversation_id = m.conversation_id
+                ORDER BY head.id LIMIT 1
+            ) = 'system'
+        )
+        """,
+    ]),
+    (6, "llm response cache", [
+        """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            namespace TEXT NOT NULL,
+            response TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_llm_cache_expires_at ON llm_cache (expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_cache_namespace ON llm_cache (namespace)",
+    ]),
+    (7, "payment scanner checkpoints", [
+        """
+        CREATE TABLE IF NOT EXISTS chain_checkpoints (
+            name TEXT PRIMARY KEY,
+            block_number INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (8, "expire abandoned crypto orders", [
+        "ALTER TABLE orders ADD COLUMN expired_at DATETIME",
+        "DROP INDEX IF EXISTS idx_orders_unpaid_by_chat",
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_unpaid_by_chat
+        ON orders (chat_id, platform, timestamp DESC)
+        WHERE paid = 0 AND expired_at IS NULL
+        """,
+        # Leading timestamp serves the expiry sweep; the rest covers the watcher's scan
+        "DROP INDEX IF EXISTS idx_orders_pending_crypto",
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_pending_crypto
+        ON orders (timestamp, deposit_address, total)
+        WHERE paid = 0 AND payment_method = 'crypto' AND deposit_address IS NOT NULL AND expired_at IS NULL
+        """,
+    ]),
+    (9, "notification outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            platform TEXT NOT NULL,
+            chat_id TEXT NOT NULL,
+            body TEXT NOT NULL,
+            order_id INTEGER REFERENCES orders(id),
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+        """,
+        # Dispatcher claim scan; the partial index only holds undelivered rows
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (next_attempt_at) WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_outbox_sent_at ON outbox (sent_at) WHERE sent_at IS NOT NULL",
+    ]),
+    (10, "stripe webhook events", [
+        """
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            received_at REAL NOT NULL,
+            processed_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_stripe_events_due ON stripe_events (next_attempt_at) WHERE status = 'pending'",
+    ]),
+    (11, "admin keyset pagination and order search", [
+        # Keyset pagination orders by (timestamp, id); the id breaks timestamp ties
+        "DROP INDEX IF EXISTS idx_orders_timestamp",
+        "CREATE INDEX IF NOT EXISTS idx_orders_timestamp_id ON orders (timestamp DESC, id DESC)",
+        # External-content FTS index: stores only the index, the text stays in orders
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(
+            customer_name, summary, delivery,
+            content = 'orders', content_rowid = 'id'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS orders_fts_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO orders_fts (rowid, customer_name, summary, delivery)
+            VALUES (new.id, new.customer_name, new.summary, new.delivery);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS orders_fts_delete AFTER DELETE ON orders BEGIN
+            INSERT INTO orders_fts (orders_fts, rowid, customer_name, summary, delivery)
+            VALUES ('delete', old.id, old.customer_name, old.summary, old.delivery);
+        END
+        """,
+        # Only the indexed columns; payment status flips don't touch the FTS index
+        """
+        CREATE TRIGGER IF NOT EXISTS orders_fts_update AFTER UPDATE OF customer_name, summary, delivery ON orders BEGIN
+            INSERT INTO orders_fts (orders_fts, rowid, customer_name, summary, delivery)
+            VALUES ('delete', old.id, old.customer_name, old.summary, old.delivery);
+            INSERT INTO orders_fts (rowid, customer_name, summary, delivery)
+            VALUES (new.id, new.customer_name, new.summary, new.delivery);
+        END
+        """,
+        "INSERT INTO orders_fts (orders_fts) VALUES ('rebuild')",
+    ]),
+    (12, "sales analytics rollups", [
+        "ALTER TABLE orders ADD COLUMN paid_at DATETIME",
+        # Revenue is in cents; buckets are UTC
+        """
+        CREATE TABLE IF NOT EXISTS sales_hourly (
+            hour TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, platform)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS item_sales_daily (
+            day TEXT NOT NULL,
+            item TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, item)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (13, "normalised order line items", [
+        """
+        CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+            menu_item_id TEXT,
+            name TEXT NOT NULL,
+            unit_price INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 1
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_menu_item_id ON order_items (menu_item_id)",
+        _backfill_order_items,
+    ]),
+    (14, "hd wallet deposit addresses", [
+        """
+        CREATE TABLE IF NOT EXISTS deposit_addresses (
+            wallet TEXT NOT NULL,
+            derivation_index INTEGER NOT NULL,
+            address TEXT NOT NULL,
+            order_id INTEGER REFERENCES orders(id),
+            claimed_at TIMESTAMP,
+            PRIMARY KEY (wallet, derivation_index)
+        ) WITHOUT ROWID
+        """,
+        # Unclaimed addresses only, so a claim is one index seek however many have been used
+        "CREATE INDEX IF NOT EXISTS idx_deposit_addresses_free ON deposit_addresses (wallet, derivation_index) WHERE order_id IS NULL",
+        "ALTER TABLE orders ADD COLUMN derivation_index INTEGER",
+    ]),
+    (15, "conversation prompt version", [
+        "ALTER TABLE conversations ADD COLUMN prompt_version INTEGER",
+    ]),
+    (16, "order deposit wallet", [
+        "ALTER TABLE orders ADD COLUMN deposit_wallet TEXT",
+        "ALTER TABLE orders ADD COLUMN derivation_path TEXT",
+        # Orders claimed before this migration: the pool row records the wallet
+        """
+        UPDATE orders SET deposit_wallet = (
+            SELECT wallet FROM deposit_addresses WHERE deposit_addresses.order_id = orders.id
+        )
+        WHERE derivation_index IS NOT NULL
+        """,
+    ]),
+    (17, "crypto payment window", [
+        # When the deposit address was last given to the customer; expiry and
+        # poll back-off count from here, not from when the order was placed
+        "ALTER TABLE orders ADD COLUMN crypto_requested_at DATETIME",
+        """
+        UPDATE orders SET crypto_requested_at = COALESCE(
+            (SELECT claimed_at FROM deposit_addresses WHERE deposit_addresses.order_id = orders.id),
+            timestamp
+        )
+        WHERE deposit_address IS NOT NULL
+        """,
+        "DROP INDEX IF EXISTS idx_orders_pending_crypto",
+        """
+        CREATE INDEX IF NOT EXISTS idx_orders_pending_crypto
+        ON orders (crypto_requested_at, deposit_address, total)
+        WHERE paid = 0 AND payment_method = 'crypto' AND deposit_address IS NOT NULL AND expired_at IS NULL
+        """,
+    ]),
+    (18, "item rollups by menu item", [
+        # Re-key item_sales_daily from the LLM's free-text names to menu item ids
+        "DELETE FROM item_sales_daily",
+        """
+        INSERT INTO item_sales_daily (day, item, quantity, revenue)
+        SELECT date(COALESCE(o.paid_at, o.timestamp)) AS day,
+               COALESCE(line.menu_item_id, lower(trim(line.name))) AS item,
+               SUM(line.quantity),
+               SUM(line.unit_price * line.quantity)
+        FROM orders AS o JOIN order_items AS line ON line.order_id = o.id
+        WHERE o.paid = 1
+        GROUP BY day, item
+        """,
+    ]),
+]
+
+
+async def get_schema_version(conn):
+    cursor = await conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    row = await cursor.fetchone()
+    return row[0]
+
+
+async def run_migrations(conn):
+    """Applies every pending migration, each in its own transaction. Returns the new version."""
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await conn.commit()
+
+    for version, name, steps in MIGRATIONS:
+        # IMMEDIATE takes the write lock up front, so concurrent workers starting
+        # together re-check the version and apply each migration exactly once
+        await conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= await get_schema_version(conn):
+                await conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    await step(conn)
+                else:
+                    await conn.execute(step)
+            await conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            await conn.commit()
+            print(f"🗄️ Applied migration {version:03d}: {name}")
+        except Exception:
+            await conn.rollback()
+            raise
+
+    return await get_schema_version(conn)
@@ -0,0 +1,223 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from .resilience import retry_after_seconds
+
+# Rate-limited delivery of outbound messages. Every send takes a token from its
+# destination's bucket (one chat, or the kitchen group) and then from the
+# platform's global bucket, so a burst of paid orders is spread out instead of
+# drawing 429s. Global tokens go to payment confirmations before chit-chat.
+# A 429 pauses that destination for the server's retry_after, and the send is
+# retried if the wait is short.
+PRIORITY_PAYMENT = 0
+PRIORITY_CHAT = 1
+
+# Sustained messages per second and burst size. The defaults follow Telegram's
+# published limits (about 30/s overall, 1/s per chat, 20/min per group) and
+# Twilio's default throughput for a WhatsApp sender.
+OUTBOUND_LIMITS = {
+    "telegram": {
+        "global": (float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")), int(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))),
+        "chat": (float(os.getenv("TELEGRAM_CHAT_RATE", "1")), int(os.getenv("TELEGRAM_CHAT_BURST", "3"))),
+        "group": (float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60))), int(os.getenv("TELEGRAM_GROUP_BURST", "5"))),
+    },
+    "whatsapp": {
+        "global": (float(os.getenv("WHATSAPP_GLOBAL_RATE", "10")), int(os.getenv("WHATSAPP_GLOBAL_BURST", "10"))),
+        "chat": (float(os.getenv("WHATSAPP_CHAT_RATE", "1")), int(os.getenv("WHATSAPP_CHAT_BURST", "3"))),
+    },
+}
+# A 429 asking us to wait longer than this is not retried here; the caller
+# (e.g. the outbox) reschedules instead
+OUTBOUND_MAX_RETRY_WAIT = float(os.getenv("OUTBOUND_MAX_RETRY_WAIT", "10"))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "3"))
+# Idle destination buckets are dropped once there are more than this many
+OUTBOUND_MAX_DESTINATIONS = int(os.getenv("OUTBOUND_MAX_DESTINATIONS", "10000"))
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Takes a token and returns 0, or returns how long to wait for one."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Holds every token back for ``seconds`` (the server said to slow down)."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def ready(self):
+        """Whether a token could be taken right now, without taking it."""
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= 1 and now >= self.paused_until
+
+    def idle(self):
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.burst and now >= self.paused_until
+
+
+class PriorityBucket:
+    """A token bucket whose waiters are served lowest priority value first, then in arrival order."""
+
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self._waiters = []
+        self._seq = itertools.count()
+
+    def _wake_head(self):
+        if self._waiters:
+            self._waiters[0][2].set()
+
+    async def acquire(self, priority):
+        if not self._waiters and self.bucket.take() == 0:
+            return
+        entry = (priority, next(self._seq), asyncio.Event())
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] is entry:
+                    wait = self.bucket.take()
+                    if wait == 0:
+                        heapq.heappop(self._waiters)
+                        self._wake_head()
+                        return
+                else:
+                    wait = None
+                entry[2].clear()
+                try:
+                    await asyncio.wait_for(entry[2].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._wake_head()
+            raise
+
+    def waiting(self):
+        return len(self._waiters)
+
+
+class _Destination:
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        # Keeps one chat's messages in order while they wait for tokens
+        self.lock = asyncio.Lock()
+
+
+class OutboundScheduler:
+    """Paces ``send(platform, chat_id, text)`` calls to each platform's rate limits.
+
+    ``send`` must raise on a rejected message (an ``httpx.HTTPStatusError``
+    for HTTP errors) so 429s can be seen and retried.
+    """
+
+    def __init__(self, send, limits=OUTBOUND_LIMITS):
+        self._send = send
+        self.limits = limits
+        self._global = {platform: PriorityBucket(*limit["global"]) for platform, limit in limits.items()}
+        self._destinations = {}
+        self.sent = 0
+        self.throttled = 0
+        self.retried = 0
+        self.failed = 0
+        self.waited = 0.0
+
+    def _destination(self, platform, chat_id):
+        key = (platform, str(chat_id))
+        destination = self._destinations.get(key)
+        if destination is None:
+            if len(self._destinations) >= OUTBOUND_MAX_DESTINATIONS:
+                self._prune()
+            limit = self.limits.get(platform, {})
+            # Telegram group and channel ids are negative
+            kind = "group" if str(chat_id).startswith("-") and "group" in limit else "chat"
+            destination = self._destinations[key] = _Destination(*limit.get(kind, (1.0, 1)))
+        return destination
+
+    def _prune(self):
+        for key, destination in list(self._destinations.items()):
+            if destination.bucket.idle() and not destination.lock.locked():
+                del self._destinations[key]
+
+    async def _take(self, bucket):
+        while (wait := bucket.take()) > 0:
+            await asyncio.sleep(wait)
+
+    def ready(self, platform, chat_id):
+        """Whether a call to this destination would go out without waiting.
+
+        For optional calls such as interim streaming edits, which are better
+        skipped than queued behind the rate limit.
+        """
+        destination = self._destination(platform, chat_id)
+        return not destination.lock.locked() and destination.bucket.ready()
+
+    async def send(self, platform, chat_id, text, priority=PRIORITY_CHAT, raise_errors=False):
+        return await self.call(
+            platform, chat_id, lambda: self._send(platform, chat_id, text), priority=priority, raise_errors=raise_errors
+        )
+
+    async def call(self, platform, chat_id, request, priority=PRIORITY_CHAT, raise_errors=False):
+        """Runs ``request()`` (one API call to ``chat_id``, e.g. a message edit) under the same pacing as ``send``."""
+        destination = self._destination(platform, chat_id)
+        async with destination.lock:
+            for attempt in range(1, OUTBOUND_MAX_ATTEMPTS + 1):
+                started = time.monotonic()
+                await self._take(destination.bucket)
+                if platform in self._global:
+                    await self._global[platform].acquire(priority)
+                self.waited += time.monotonic() - started
+                try:
+                    result = await request()
+                    self.sent += 1
+                    return result
+                except Exception as e:
+                    retry_after = retry_after_seconds(e)
+                    if retry_after is not None:
+                        self.throttled += 1
+                        destination.bucket.pause(retry_after)
+                        print(f"🐢 {platform}:{chat_id} is rate limited for {retry_after:.1f}s.")
+                    if retry_after is None or retry_after > OUTBOUND_MAX_RETRY_WAIT or attempt == OUTBOUND_MAX_ATTEMPTS:
+                        self.failed += 1
+                        if raise_errors:
+                            raise
+                        print(f"⚠️ Could not send a {platform} message to {chat_id}: {e}")
+                        return None
+                    self.retried += 1
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "retried": self.retried,
+            "failed": self.failed,
+            "wait_seconds": round(self.waited, 3),
+            "destinations": len(self._destinations),
+            "waiting": {platform: bucket.waiting() for platform, bucket in self._global.items()},
+        }
@@ -0,0 +1,278 @@
+import asyncio
+import math
+import os
+import time
+from .analytics import record_paid_order
+from .resilience import backoff_delay, retry_after_seconds
+from ..blueprints.orders import get_db_conn, get_order_items
+
+# Durable outbox for customer and kitchen notifications. Rows are written in
+# the same transaction that marks an order paid, so a payment can never be
+# recorded without its notifications; the dispatcher then delivers them with
+# retries. Each row has an idempotency key, so re-running a payment path
+# never queues a second copy.
+KITCHEN_CHAT_ID = os.getenv("KITCHEN_CHAT_ID")
+
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "2"))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "300"))
+# How long a claimed row is hidden from other dispatchers (other workers)
+OUTBOX_CLAIM_TTL = float(os.getenv("OUTBOX_CLAIM_TTL", "60"))
+OUTBOX_SEND_CONCURRENCY = int(os.getenv("OUTBOX_SEND_CONCURRENCY", "5"))
+# Delivered rows are kept this long (seconds) before being purged
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", str(7 * 86400)))
+
+# Several queued messages for the same chat are joined into one send, up to
+# the platform's message size limit
+MAX_MESSAGE_CHARS = {"telegram": 4096, "whatsapp": 1600}
+BATCH_SEPARATOR = "\n\n———\n\n"
+# Kitchen digest: with a window (seconds) set, kitchen tickets are held until
+# the end of the window they were queued in and go out together as one message
+KITCHEN_DIGEST_WINDOW = float(os.getenv("KITCHEN_DIGEST_WINDOW", "0"))
+KITCHEN_DIGEST_HEADER = "🧾 Kitchen digest: {count} new orders\n\n"
+
+
+def _format_lines(items):
+    lines = []
+    for item in items:
+        quantity = f" x{item['quantity']}" if item['quantity'] > 1 else ""
+        lines.append(f"- {item['name']}{quantity}: ${item['price'] * item['quantity']/100:.2f}")
+    return "\n".join(lines)
+
+
+def format_kitchen_order(chat_id, customer_name, items, total, delivery, platform):
+    total_price = f"${total/100:.2f}"
+
+    return (
+        f"🍽️ New Order for {customer_name} ({chat_id}) on {platform}:\n"
+        f"{_format_lines(items)}\n"
+        f"Total: {total_price}\n"
+        f"Delivery: {delivery}"
+    )
+
+
+def format_payment_receipt(order, items):
+    return f"✅ Payment successful! Your order is confirmed.\n\nYour receipt:\n{_format_lines(items)}\n\nTotal: ${order['total']/100:.2f}"
+
+
+async def enqueue_message(conn, idempotency_key, platform, chat_id, body, order_id=None, not_before=None):
+    """Queues one message on ``conn``'s open transaction. Returns False if the key was already queued."""
+    now = time.time()
+    cursor = await conn.execute(
+        """
+        INSERT OR IGNORE INTO outbox (idempotency_key, platform, chat_id, body, order_id, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (idempotency_key, platform, str(chat_id), body, order_id, max(now, not_before or now), now)
+    )
+    return cursor.rowcount == 1
+
+
+async def enqueue_order_paid(conn, order):
+    """Queues the kitchen ticket and the customer's receipt for a paid order."""
+    items = await get_order_items(conn, order['id'])
+    if KITCHEN_CHAT_ID:
+        kitchen_message = format_kitchen_order(
+            order['chat_id'], order['customer_name'], items, order['total'], order['delivery'], order['platform']
+        )
+        not_before = None
+        if KITCHEN_DIGEST_WINDOW > 0:
+            not_before = math.ceil(time.time() / KITCHEN_DIGEST_WINDOW) * KITCHEN_DIGEST_WINDOW
+        await enqueue_message(
+            conn, f"order-paid:{order['id']}:kitchen", "telegram", KITCHEN_CHAT_ID, kitchen_message, order['id'], not_before
+        )
+    await enqueue_message(
+        conn, f"order-paid:{order['id']}:customer", order['platform'], order['chat_id'], format_payment_receipt(order, items), order['id']
+    )
+
+
+async def mark_order_paid(conn, order_id):
+    """Flips an order to paid, updates the sales rollups and queues its notifications, on ``conn``'s open transaction.
+
+    Returns False (and queues nothing) if the order was already paid or doesn't exist.
+    """
+    cursor = await conn.execute(
+        "UPDATE orders SET paid = 1, paid_at = CURRENT_TIMESTAMP WHERE id = ? AND paid = 0", (order_id,)
+    )
+    if cursor.rowcount != 1:
+        return False
+    await record_paid_order(conn, order_id)
+    cursor = await conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+    await enqueue_order_paid(conn, await cursor.fetchone())
+    return True
+
+
+def _batches(rows, limit):
+    """Splits one destination's rows into groups whose joined bodies fit in one message."""
+    batch, size = [], 0
+    for row in rows:
+        extra = len(row["body"]) + (len(BATCH_SEPARATOR) if batch else 0)
+        if batch and size + extra > limit:
+            yield batch
+            batch, size = [], 0
+            extra = len(row["body"])
+        batch.append(row)
+        size += extra
+    if batch:
+        yield batch
+
+
+class OutboxDispatcher:
+    """Drains the outbox: claims due rows, batches them per chat and sends them with retries.
+
+    ``send(platform, chat_id, text)`` delivers one message. Rows are claimed
+    with a short lease so dispatchers in several gunicorn workers never send
+    the same row at once; ``wake()`` skips the poll wait after new rows are
+    committed in this process.
+    """
+
+    def __init__(self, send, poll_interval=OUTBOX_POLL_INTERVAL, batch_size=OUTBOX_BATCH_SIZE):
+        self.send = send
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(OUTBOX_SEND_CONCURRENCY)
+        self._wake = None
+        self._task = None
+        self._last_purge = 0.0
+        self.sent = 0
+        self.sends = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def start(self):
+        """Starts the dispatcher task. Must be awaited on the app loop."""
+        if self._task:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="outbox-dispatcher")
+        print("📤 Outbox dispatcher started.")
+
+    def wake(self):
+        if self._wake:
+            self._wake.set()
+
+    async def _claim(self):
+        now = time.time()
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                """
+                UPDATE outbox SET locked_until = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ? AND (locked_until IS NULL OR locked_until < ?)
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING id, platform, chat_id, body, attempts
+                """,
+                (now + OUTBOX_CLAIM_TTL, now, now, self.batch_size)
+            )
+            rows = await cursor.fetchall()
+            await conn.commit()
+        return sorted(rows, key=lambda row: row["id"])
+
+    async def _mark_sent(self, ids):
+        placeholders = ",".join("?" * len(ids))
+        async with get_db_conn() as conn:
+            await conn.execute(
+                f"UPDATE outbox SET status = 'sent', sent_at = ?, locked_until = NULL WHERE id IN ({placeholders})",
+                (time.time(), *ids)
+            )
+            await conn.commit()
+
+    async def _mark_failed(self, rows, error):
+        attempts = max(row["attempts"] for row in rows)
+        delay = retry_after_seconds(error)
+        if delay is None:
+            delay = backoff_delay(attempts - 1, OUTBOX_RETRY_BASE_DELAY, OUTBOX_RETRY_MAX_DELAY)
+        placeholders = ",".join("?" * len(rows))
+        async with get_db_conn() as conn:
+            await conn.execute(
+                f"""
+                UPDATE outbox
+                SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                    next_attempt_at = ?, locked_until = NULL, last_error = ?
+                WHERE id IN ({placeholders})
+                """,
+                (OUTBOX_MAX_ATTEMPTS, time.time() + delay, f"{type(error).__name__}: {error}"[:500], *[row["id"] for row in rows])
+            )
+            await conn.commit()
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            self.dead += len(rows)
+            print(f"☠️ Giving up on {len(rows)} outbox message(s) after {attempts} attempts: {error}")
+        else:
+            self.retried += len(rows)
+            print(f"🔁 Retrying {len(rows)} outbox message(s) in {delay:.1f}s after: {type(error).__name__}")
+
+    async def _deliver(self, platform, chat_id, rows):
+        # Messages for one chat go out in order; a failed batch holds back the rest
+        is_kitchen = KITCHEN_DIGEST_WINDOW > 0 and (platform, chat_id) == ("telegram", str(KITCHEN_CHAT_ID))
+        limit = MAX_MESSAGE_CHARS.get(platform, 1600)
+        async with self.semaphore:
+            batches = list(_batches(rows, limit - len(KITCHEN_DIGEST_HEADER) - 8 if is_kitchen else limit))
+            for i, batch in enumerate(batches):
+                text = BATCH_SEPARATOR.join(row["body"] for row in batch)
+                if is_kitchen and len(batch) > 1:
+                    text = KITCHEN_DIGEST_HEADER.format(count=len(batch)) + text
+                try:
+                    await self.send(platform, chat_id, text)
+                except Exception as e:
+                    await self._mark_failed([row for later in batches[i:] for row in later], e)
+                    return
+                self.sends += 1
+                self.sent += len(batch)
+                await self._mark_sent([row["id"] for row in batch])
+
+    async def dispatch_once(self):
+        """Claims and delivers one batch of due rows. Returns how many rows were claimed."""
+        rows = await self._claim()
+        by_destination = {}
+        for row in rows:
+            by_destination.setdefault((row["platform"], row["chat_id"]), []).append(row)
+        await asyncio.gather(*(
+            self._deliver(platform, chat_id, destination_rows)
+            for (platform, chat_id), destination_rows in by_destination.items()
+        ))
+        return len(rows)
+
+    async def _purge(self):
+        async with get_db_conn() as conn:
+            await conn.execute("DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?", (time.time() - OUTBOX_RETENTION,))
+            await conn.commit()
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+                if time.monotonic() - self._last_purge > 3600:
+                    self._last_purge = time.monotonic()
+                    await self._purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                claimed = 0
+                print(f"🚨 Outbox dispatcher error: {e}")
+            if claimed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "running": self._task is not None,
+            "sent": self.sent,
+            "sends": self.sends,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
@@ -0,0 +1,298 @@
+import asyncio
+import os
+import time
+from collections import namedtuple
+import httpx
+from hexbytes import HexBytes
+from web3 import Web3
+from .crypto_payment import w3, USDC_TOKEN_ADDRESS
+from .http_clients import get_http_client
+from .outbox import mark_order_paid
+from ..blueprints.orders import get_db_conn
+
+# Detects USDC deposits for pending crypto orders. The default backend scans
+# Transfer logs for the whole token over block ranges and matches recipients
+# against the pending deposit addresses in one pass, so cost no longer grows
+# with the number of open orders. The last scanned block is checkpointed in
+# the same transaction that marks orders paid, so restarts resume where they
+# stopped. Snowtrace (one tokentx call per address) remains as a fallback.
+PAYMENT_SCAN_BACKEND = os.getenv("PAYMENT_SCAN_BACKEND", "logs")
+PAYMENT_SCAN_FALLBACK = os.getenv("PAYMENT_SCAN_FALLBACK", "snowtrace")
+# Avalanche's public RPC caps eth_getLogs at 2048 blocks per call
+PAYMENT_SCAN_BLOCK_RANGE = int(os.getenv("PAYMENT_SCAN_BLOCK_RANGE", "2000"))
+PAYMENT_SCAN_CONFIRMATIONS = int(os.getenv("PAYMENT_SCAN_CONFIRMATIONS", "1"))
+# How far back the very first scan starts when there is no checkpoint yet
+PAYMENT_SCAN_START_LOOKBACK = int(os.getenv("PAYMENT_SCAN_START_LOOKBACK", "2000"))
+# Up to this many pending addresses are also pushed into the RPC topic filter
+PAYMENT_SCAN_TOPIC_FILTER_MAX = int(os.getenv("PAYMENT_SCAN_TOPIC_FILTER_MAX", "50"))
+SNOWTRACE_API_URL = os.getenv("SNOWTRACE_API_URL", "https://api-testnet.snowtrace.io/api")
+# Concurrent per-address checks for backends that query one address at a time
+PAYMENT_CHECK_CONCURRENCY = int(os.getenv("PAYMENT_CHECK_CONCURRENCY", "5"))
+
+# Adaptive polling: orders are checked every PAYMENT_POLL_MIN_INTERVAL seconds
+# right after their deposit address is issued, and the interval doubles for
+# every PAYMENT_POLL_BACKOFF_AFTER seconds since then, up to
+# PAYMENT_POLL_MAX_INTERVAL. Ages count from orders.crypto_requested_at, so an
+# old order that only now switches to crypto gets a full payment window.
+PAYMENT_POLL_MIN_INTERVAL = float(os.getenv("PAYMENT_POLL_MIN_INTERVAL", "10"))
+PAYMENT_POLL_MAX_INTERVAL = float(os.getenv("PAYMENT_POLL_MAX_INTERVAL", "300"))
+PAYMENT_POLL_BACKOFF_AFTER = float(os.getenv("PAYMENT_POLL_BACKOFF_AFTER", "300"))
+# Unpaid crypto orders whose address was issued longer ago than this many seconds are expired (0 disables)
+PAYMENT_ORDER_EXPIRY = float(os.getenv("PAYMENT_ORDER_EXPIRY", "86400"))
+
+TRANSFER_TOPIC = "0x" + bytes(Web3.keccak(text="Transfer(address,address,uint256)")).hex()
+USDC_DECIMALS = 6
+CHECKPOINT_NAME = f"usdc-transfers:{USDC_TOKEN_ADDRESS.lower()}"
+
+PendingOrder = namedtuple("PendingOrder", ["id", "expected_amount", "age"])
+
+
+def poll_interval(age):
+    """Seconds between payment checks for an order whose address was issued ``age`` seconds ago."""
+    doublings = int(max(age, 0) // PAYMENT_POLL_BACKOFF_AFTER) if PAYMENT_POLL_BACKOFF_AFTER > 0 else 0
+    return min(PAYMENT_POLL_MAX_INTERVAL, PAYMENT_POLL_MIN_INTERVAL * 2 ** min(doublings, 16))
+
+
+async def load_pending_crypto_orders():
+    """Returns ``{deposit_address (lowercase): PendingOrder}`` for unpaid, unexpired crypto orders."""
+    async with get_db_conn(readonly=True) as conn:
+        cursor = await conn.execute(
+            """
+            SELECT id, deposit_address, total, (julianday('now') - julianday(crypto_requested_at)) * 86400 AS age
+            FROM orders
+            WHERE paid = 0 AND payment_method = 'crypto' AND deposit_address IS NOT NULL AND expired_at IS NULL
+            """
+        )
+        rows = await cursor.fetchall()
+    return {
+        row["deposit_address"].lower(): PendingOrder(row["id"], row["total"] / 100, row["age"] or 0.0)
+        for row in rows
+    }
+
+
+async def expire_stale_orders(max_age=PAYMENT_ORDER_EXPIRY):
+    """Expires unpaid crypto orders whose address was issued over ``max_age`` seconds ago; returns their ids."""
+    if max_age <= 0:
+        return []
+    async with get_db_conn() as conn:
+        cursor = await conn.execute(
+            """
+            UPDATE orders SET expired_at = CURRENT_TIMESTAMP
+            WHERE paid = 0 AND payment_method = 'crypto' AND deposit_address IS NOT NULL AND expired_at IS NULL
+              AND crypto_requested_at < datetime('now', ?)
+            RETURNING id
+            """,
+            (f"-{int(max_age)} seconds",)
+        )
+        expired = [row["id"] for row in await cursor.fetchall()]
+        await conn.commit()
+    return expired
+
+
+async def get_checkpoint(name=CHECKPOINT_NAME):
+    async with get_db_conn(readonly=True) as conn:
+        cursor = await conn.execute("SELECT block_number FROM chain_checkpoints WHERE name = ?", (name,))
+        row = await cursor.fetchone()
+    return row["block_number"] if row else None
+
+
+async def mark_orders_paid(order_ids, checkpoint=None, name=CHECKPOINT_NAME):
+    """Marks orders paid, queues their notifications and advances the checkpoint in one transaction.
+
+    Returns the ids that were actually flipped from unpaid to paid, so an order
+    found twice (e.g. by a retried scan) is only notified once.
+    """
+    newly_paid = []
+    async with get_db_conn() as conn:
+        await conn.execute("BEGIN IMMEDIATE")
+        for order_id in order_ids:
+            # Queues the order's notifications in this same transaction
+            if await mark_order_paid(conn, order_id):
+                newly_paid.append(order_id)
+        if checkpoint is not None:
+            await conn.execute(
+                """
+                INSERT INTO chain_checkpoints (name, block_number, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET block_number = excluded.block_number, updated_at = excluded.updated_at
+                """,
+                (name, checkpoint, time.time())
+            )
+        await conn.commit()
+    return newly_paid
+
+
+def _address_topic(address):
+    return "0x" + "00" * 12 + address.lower()[2:]
+
+
+def _parse_transfer(log):
+    """Returns ``(recipient (lowercase), amount in USDC, tx hash)`` for a Transfer log."""
+    recipient = "0x" + bytes(HexBytes(log["topics"][2]))[-20:].hex()
+    amount = int.from_bytes(bytes(HexBytes(log["data"])), "big") / 10**USDC_DECIMALS
+    return recipient, amount, bytes(HexBytes(log["transactionHash"])).hex()
+
+
+class TransferLogScanner:
+    """Scans USDC Transfer logs with ``eth_getLogs`` from the checkpoint up to the confirmed head."""
+
+    name = "logs"
+
+    def __init__(self, block_range=PAYMENT_SCAN_BLOCK_RANGE, confirmations=PAYMENT_SCAN_CONFIRMATIONS):
+        self.block_range = block_range
+        self.confirmations = confirmations
+        self.last_block = None
+
+    async def scan(self, load_pending):
+        """Yields ``(matched order ids, block checkpoint)`` per block range scanned."""
+        # Read the head before snapshotting pending orders, so an order created
+        # after the snapshot can only be paid in a block we haven't passed yet
+        head = await asyncio.to_thread(lambda: w3.eth.block_number)
+        pending = await load_pending()
+        target = head - self.confirmations
+        start = await get_checkpoint()
+        start = target - PAYMENT_SCAN_START_LOOKBACK if start is None else start + 1
+        if start > target:
+            return
+
+        if not pending:
+            # Nothing to match; skip ahead without fetching any logs
+            self.last_block = target
+            yield [], target
+            return
+
+        filter_params = {"address": USDC_TOKEN_ADDRESS, "topics": [TRANSFER_TOPIC]}
+        if len(pending) <= PAYMENT_SCAN_TOPIC_FILTER_MAX:
+            filter_params["topics"] = [TRANSFER_TOPIC, None, [_address_topic(address) for address in pending]]
+
+        for from_block in range(start, target + 1, self.block_range):
+            to_block = min(from_block + self.block_range - 1, target)
+            logs = await asyncio.to_thread(
+                w3.eth.get_logs, {**filter_params, "fromBlock": from_block, "toBlock": to_block}
+            )
+            matched = []
+            for log in logs:
+                if len(log["topics"]) < 3:
+                    continue
+                recipient, amount, tx_hash = _parse_transfer(log)
+                order = pending.get(recipient)
+                if order and amount >= order.expected_amount and order.id not in matched:
+                    print(f"Found USDC payment: {amount} USDC in tx {tx_hash}")
+                    matched.append(order.id)
+            self.last_block = to_block
+            yield matched, to_block
+
+
+class SnowtraceScanner:
+    """One Snowtrace ``tokentx`` query per due address, run concurrently; no checkpoint.
+
+    Each order is re-checked on its own ``poll_interval`` schedule, so old
+    orders cost fewer API calls than fresh ones.
+    """
+
+    name = "snowtrace"
+
+    def __init__(self, concurrency=PAYMENT_CHECK_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.next_check = {}
+
+    async def _is_paid(self, session, address, expected_amount):
+        params = {
+            "module": "account",
+            "action": "tokentx",
+            "contractaddress": USDC_TOKEN_ADDRESS,
+            "address": address,
+            "page": 1,
+            "offset": 100,
+            "sort": "desc",
+        }
+        try:
+            resp = await session.get(SNOWTRACE_API_URL, params=params)
+            resp.raise_for_status()
+            data = resp.json()
+
+            if data.get("status") != "1" or "result" not in data:
+                return False
+
+            # Loop through recent transactions to find incoming USDC
+            for tx in data["result"]:
+                if tx["to"].lower() == address.lower():
+                    # Convert from token's smallest unit (USDC has 6 decimals)
+                    amount = int(tx["value"]) / 10**USDC_DECIMALS
+                    print(f"Found USDC payment: {amount} USDC")
+                    if amount >= expected_amount:
+                        return True
+            return False
+        except httpx.HTTPStatusError as e:
+            print(f"❌ HTTP error checking payment for {address}: {e.response.status_code}")
+            return False
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"❌ Error parsing Snowtrace API response for {address}: {e}")
+            return False
+
+    async def _check(self, session, address, order):
+        async with self.semaphore:
+            paid = await self._is_paid(session, address, order.expected_amount)
+        self.next_check[order.id] = time.monotonic() + poll_interval(order.age)
+        return order.id if paid else None
+
+    async def scan(self, load_pending):
+        pending = await load_pending()
+        session = get_http_client("snowtrace")
+        now = time.monotonic()
+        live = {order.id for order in pending.values()}
+        self.next_check = {order_id: due for order_id, due in self.next_check.items() if order_id in live}
+        due = [
+            (address, order) for address, order in pending.items()
+            if self.next_check.get(order.id, 0) <= now
+        ]
+        results = await asyncio.gather(*(self._check(session, address, order) for address, order in due))
+        yield [order_id for order_id in results if order_id is not None], None
+
+
+PAYMENT_SCANNERS = {
+    "logs": TransferLogScanner,
+    "snowtrace": SnowtraceScanner,
+}
+
+
+class PaymentDetector:
+    """Runs the primary scanner, falling back to the secondary for a cycle when it fails."""
+
+    def __init__(self, primary=PAYMENT_SCAN_BACKEND, fallback=PAYMENT_SCAN_FALLBACK):
+        self.primary = PAYMENT_SCANNERS[primary]()
+        self.fallback = PAYMENT_SCANNERS[fallback]() if fallback in PAYMENT_SCANNERS and fallback != primary else None
+        self.fallback_cycles = 0
+        self.pending = {}
+
+    async def _load_pending(self):
+        self.pending = await load_pending_crypto_orders()
+        return self.pending
+
+    async def _run(self, scanner):
+        newly_paid = []
+        async for matched, checkpoint in scanner.scan(self._load_pending):
+            if matched or checkpoint is not None:
+                newly_paid += await mark_orders_paid(matched, checkpoint)
+        if newly_paid:
+            self.pending = {address: order for address, order in self.pending.items() if order.id not in newly_paid}
+        return newly_paid
+
+    async def poll(self):
+        """One detection cycle; returns the ids of orders that just became paid."""
+        try:
+            return await self._run(self.primary)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            print(f"⚠️ {self.primary.name} payment scan failed ({type(e).__name__}: {e}); using {self.fallback.name}.")
+            self.fallback_cycles += 1
+            return await self._run(self.fallback)
+
+    def stats(self):
+        return {
+            "backend": self.primary.name,
+            "fallback": self.fallback.name if self.fallback else None,
+            "fallback_cycles": self.fallback_cycles,
+            "last_block": getattr(self.primary, "last_block", None),
+            "pending_orders": len(self.pending),
+        }
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import signal
+from .payment_scanner import PaymentDetector, expire_stale_orders, poll_interval
+from .http_clients import init_http_clients, close_http_clients
+from .leases import PROCESS_OWNER_ID, acquire_lease, renew_lease, release_lease
+from ..blueprints.orders import init_db, close_db_pool
+
+# The crypto payment watcher. It runs as a task on the web app's loop, or on
+# its own as the `payment-watcher` worker (`python payment_watcher.py`); set
+# PAYMENT_WATCHER_IN_APP=0 on the web service when the worker is deployed.
+# Every copy (gunicorn workers, the standalone worker) competes for one lease
+# and only the holder polls; the others stand by to take over.
+PAYMENT_WATCHER_IN_APP = os.getenv("PAYMENT_WATCHER_IN_APP", "1").lower() in ("1", "true", "yes")
+# Sleep between cycles while there are no pending crypto orders
+PAYMENT_POLL_IDLE_INTERVAL = float(os.getenv("PAYMENT_POLL_IDLE_INTERVAL", "60"))
+# The leader heartbeats every third of the TTL; standbys try to take over just
+# as often, so a dead leader is replaced within about 1.3 × TTL
+PAYMENT_WATCHER_LEASE_TTL = float(os.getenv("PAYMENT_WATCHER_LEASE_TTL", "15"))
+PAYMENT_WATCHER_LEASE_NAME = "payment-watcher"
+
+
+class PaymentWatcher:
+    """Polls for crypto payments and expires abandoned orders.
+
+    Paid orders get their notifications queued in the outbox in the same
+    transaction; ``on_paid(order_id)`` is an optional hook (the web app uses it
+    to wake its outbox dispatcher).
+
+    The cycle interval follows the freshest pending order (see
+    ``poll_interval``), so the watcher is quick right after an order is placed
+    and backs off as orders age. Only the process holding the
+    ``payment-watcher`` lease runs cycles.
+    """
+
+    def __init__(self, on_paid=None, detector=None):
+        self.on_paid = on_paid
+        self.detector = detector or PaymentDetector()
+        self.lease_ttl = PAYMENT_WATCHER_LEASE_TTL
+        self._stopping = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self.is_leader = False
+        self.leader_terms = 0
+        self.cycles = 0
+        self.paid = 0
+        self.expired = 0
+
+    def next_interval(self):
+        if not self.detector.pending:
+            return PAYMENT_POLL_IDLE_INTERVAL
+        return min(poll_interval(order.age) for order in self.detector.pending.values())
+
+    async def run_once(self):
+        # Detect first: an order paid just before its window closes must be
+        # scanned one last time before the sweep expires it
+        paid = await self.detector.poll()
+        for order_id in paid:
+            print(f"💰 Payment detected for order {order_id}!")
+            if self.on_paid:
+                await self.on_paid(order_id)
+        self.paid += len(paid)
+
+        expired = await expire_stale_orders()
+        if expired:
+            self.expired += len(expired)
+            print(f"⌛ Expired {len(expired)} unpaid crypto order(s): {expired}")
+        self.cycles += 1
+
+    async def _heartbeat(self):
+        """Renews the lease until it is lost; returning ends the leadership term."""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if not await renew_lease(PAYMENT_WATCHER_LEASE_NAME, self.lease_ttl):
+                    print("⚠️ Payment watcher lost its lease to another process.")
+                    return
+            except Exception as e:
+                print(f"⚠️ Payment watcher could not renew its lease: {e}")
+                return
+
+    async def _lead(self):
+        """Runs watcher cycles while we hold the lease."""
+        self.is_leader = True
+        self.leader_terms += 1
+        print(f"👑 Payment watcher is now the leader ({PROCESS_OWNER_ID}).")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            while not self._stopping.is_set() and not heartbeat.done():
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    print(f"🚨 An unexpected error occurred in the payment watcher: {e}")
+                await asyncio.wait({heartbeat, stopping}, timeout=self.next_interval(), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.is_leader = False
+            heartbeat.cancel()
+            stopping.cancel()
+
+    async def run(self):
+        print(f"🤖 Starting payment watcher ({self.detector.primary.name} backend)...")
+        self._stopping.clear()
+        self._stopped.clear()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if await acquire_lease(PAYMENT_WATCHER_LEASE_NAME, self.lease_ttl):
+                        await self._lead()
+                except Exception as e:
+                    print(f"🚨 Payment watcher leader election failed: {e}")
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.lease_ttl / 3)
+                except asyncio.TimeoutError:
+                    pass
+            # Hand over straight away instead of making a standby wait out the TTL
+            await release_lease(PAYMENT_WATCHER_LEASE_NAME)
+        finally:
+            self._stopped.set()
+        print("🛑 Payment watcher stopped.")
+
+    async def stop(self, timeout=5):
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._stopped.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self):
+        return {
+            "leader": self.is_leader,
+            "owner": PROCESS_OWNER_ID,
+            "leader_terms": self.leader_terms,
+            "cycles": self.cycles,
+            "paid": self.paid,
+            "expired": self.expired,
+            "next_interval": self.next_interval(),
+            **self.detector.stats(),
+        }
+
+
+async def run_worker():
+    await init_db()
+    await init_http_clients()
+    # Notifications land in the outbox; the web app's dispatcher delivers them
+    watcher = PaymentWatcher()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: loop.create_task(watcher.stop()))
+    try:
+        await watcher.run()
+    finally:
+        await close_http_clients()
+        await close_db_pool()
+
+
+def main():
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
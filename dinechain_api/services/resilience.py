@@ -0,0 +1,92 @@
+import random
+import time
+import httpx
+
+# HTTP statuses worth retrying: throttling, timeouts and transient upstream failures
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail fast for ``recovery_timeout`` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.recovery_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        # Half-open: one trial at a time (a trial that never reported back is given up on)
+        now = time.monotonic()
+        if self._trial_started is None or now - self._trial_started >= self.recovery_timeout:
+            self._trial_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_started is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"🔌 Circuit for {self.name} opened after {self.failures} failure(s).")
+            self.opened_at = time.monotonic()
+        self._trial_started = None
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Full-jitter exponential backoff for the given (0-based) retry attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+def retry_after_seconds(error):
+    """The server's Retry-After hint in seconds, if it sent one."""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("Retry-After")
+    if value is None:
+        # Telegram sends it in the body: {"parameters": {"retry_after": 5}}
+        try:
+            value = error.response.json()["parameters"]["retry_after"]
+        except (ValueError, KeyError, TypeError):
+            return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import time
+from .outbox import enqueue_message, mark_order_paid
+from .resilience import backoff_delay
+from ..blueprints.orders import get_db_conn
+
+# Stripe webhooks are acknowledged as soon as the event is verified and
+# recorded; a background processor applies them. The event id is the primary
+# key, so Stripe's retries and duplicate deliveries are dropped on insert, and
+# an event is marked processed in the same transaction as its effects.
+STRIPE_EVENT_POLL_INTERVAL = float(os.getenv("STRIPE_EVENT_POLL_INTERVAL", "5"))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "10"))
+STRIPE_EVENT_CLAIM_TTL = float(os.getenv("STRIPE_EVENT_CLAIM_TTL", "60"))
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE", "20"))
+
+PAYMENT_SUCCEEDED_EVENTS = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+PAYMENT_FAILED_EVENTS = ("checkout.session.async_payment_failed", "payment_intent.payment_failed")
+HANDLED_EVENT_TYPES = PAYMENT_SUCCEEDED_EVENTS + PAYMENT_FAILED_EVENTS + ("checkout.session.expired",)
+
+
+async def record_stripe_event(event_id, event_type, payload):
+    """Stores a verified event for processing. Returns False if it was already received."""
+    now = time.time()
+    async with get_db_conn() as conn:
+        cursor = await conn.execute(
+            """
+            INSERT OR IGNORE INTO stripe_events (id, type, payload, next_attempt_at, received_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (event_id, event_type, payload, now, now)
+        )
+        await conn.commit()
+    return cursor.rowcount == 1
+
+
+def _order_id(obj):
+    order_id = (obj.get("metadata") or {}).get("order_id")
+    return int(order_id) if order_id else None
+
+
+async def _unpaid_order(conn, order_id):
+    cursor = await conn.execute("SELECT * FROM orders WHERE id = ? AND paid = 0", (order_id,))
+    return await cursor.fetchone()
+
+
+async def apply_stripe_event(conn, event_id, event_type, obj):
+    """Applies one event on ``conn``'s open transaction. Returns True if messages were queued."""
+    order_id = _order_id(obj)
+    if order_id is None:
+        print(f"⚠️ Stripe event {event_id} ({event_type}) has no order_id; ignoring.")
+        return False
+
+    if event_type in PAYMENT_SUCCEEDED_EVENTS:
+        if obj.get("payment_status") == "unpaid":
+            # Delayed payment method; wait for async_payment_succeeded
+            return False
+        return await mark_order_paid(conn, order_id)
+
+    order = await _unpaid_order(conn, order_id)
+    if not order:
+        return False
+
+    if event_type == "checkout.session.expired":
+        # Free the order to pick a payment method again, unless a newer session replaced this one
+        cursor = await conn.execute(
+            "UPDATE orders SET payment_method = NULL, reference = NULL WHERE id = ? AND reference = ?",
+            (order_id, obj.get("id"))
+        )
+        if cursor.rowcount != 1:
+            return False
+        text = "⌛ Your card payment link has expired. Reply 'Card' for a new link or 'Crypto' to pay with USDC."
+    else:
+        text = "❌ Your card payment didn't go through. Reply 'Card' to try again or 'Crypto' to pay with USDC."
+    return await enqueue_message(conn, f"stripe-event:{event_id}", order["platform"], order["chat_id"], text, order_id)
+
+
+class StripeEventProcessor:
+    """Applies recorded Stripe events in the background, with retries.
+
+    Rows are claimed with a short lease so several gunicorn workers can share
+    the table. ``on_queued()`` is called after an event queued outbox
+    messages (the app uses it to wake the outbox dispatcher).
+    """
+
+    def __init__(self, on_queued=None, poll_interval=STRIPE_EVENT_POLL_INTERVAL):
+        self.on_queued = on_queued
+        self.poll_interval = poll_interval
+        self._wake = None
+        self._task = None
+        self.received = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def start(self):
+        """Starts the processor task. Must be awaited on the app loop."""
+        if self._task:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="stripe-event-processor")
+
+    def wake(self):
+        if self._wake:
+            self._wake.set()
+
+    async def record(self, event_id, event_type, payload):
+        """Records a verified event and wakes the processor. Returns False for duplicates."""
+        if not await record_stripe_event(event_id, event_type, payload):
+            self.duplicates += 1
+            return False
+        self.received += 1
+        self.wake()
+        return True
+
+    async def _claim(self):
+        now = time.time()
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                """
+                UPDATE stripe_events SET locked_until = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM stripe_events
+                    WHERE status = 'pending' AND next_attempt_at <= ? AND (locked_until IS NULL OR locked_until < ?)
+                    ORDER BY received_at
+                    LIMIT ?
+                )
+                RETURNING id, type, payload, attempts
+                """,
+                (now + STRIPE_EVENT_CLAIM_TTL, now, now, STRIPE_EVENT_BATCH_SIZE)
+            )
+            rows = await cursor.fetchall()
+            await conn.commit()
+        return rows
+
+    async def _process(self, row):
+        try:
+            obj = json.loads(row["payload"])["data"]["object"]
+            async with get_db_conn() as conn:
+                await conn.execute("BEGIN IMMEDIATE")
+                queued = await apply_stripe_event(conn, row["id"], row["type"], obj)
+                await conn.execute(
+                    "UPDATE stripe_events SET status = 'processed', processed_at = ?, locked_until = NULL, last_error = NULL WHERE id = ?",
+                    (time.time(), row["id"])
+                )
+                await conn.commit()
+        except Exception as e:
+            give_up = row["attempts"] >= STRIPE_EVENT_MAX_ATTEMPTS
+            async with get_db_conn() as conn:
+                await conn.execute(
+                    "UPDATE stripe_events SET status = ?, next_attempt_at = ?, locked_until = NULL, last_error = ? WHERE id = ?",
+                    (
+                        "failed" if give_up else "pending",
+                        time.time() + backoff_delay(row["attempts"] - 1, 1.0, 300.0),
+                        f"{type(e).__name__}: {e}"[:500],
+                        row["id"],
+                    )
+                )
+                await conn.commit()
+            if give_up:
+                self.failed += 1
+                print(f"☠️ Giving up on Stripe event {row['id']} ({row['type']}): {e}")
+            else:
+                self.retried += 1
+                print(f"🔁 Will retry Stripe event {row['id']} ({row['type']}) after: {e}")
+            return
+        self.processed += 1
+        if queued and self.on_queued:
+            self.on_queued()
+
+    async def _run(self):
+        while True:
+            try:
+                rows = await self._claim()
+                for row in rows:
+                    await self._process(row)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                rows = []
+                print(f"🚨 Stripe event processor error: {e}")
+            if len(rows) >= STRIPE_EVENT_BATCH_SIZE:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "running": self._task is not None,
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
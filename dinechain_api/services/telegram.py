@@ -0,0 +1,118 @@
+import os
+import re
+import time
+from dotenv import load_dotenv
+from .http_clients import get_http_client
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+# Telegram tolerates roughly one edit per second per chat
+TELEGRAM_STREAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_STREAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_STREAM_MIN_CHARS = int(os.getenv("TELEGRAM_STREAM_MIN_CHARS", "20"))
+
+# A half-received ```json fence at the end of a partial reply
+_PARTIAL_FENCE_RE = re.compile(r"`{1,3}(j(s(on?)?)?)?\s*$")
+
+
+async def telegram_api(method, payload):
+    return await get_http_client("telegram").post(f"{TELEGRAM_BASE_URL}/{method}", json=payload)
+
+
+async def send_telegram_message(chat_id, text, raise_errors=False):
+    """Sends a message and returns its message_id (None if Telegram rejected it).
+
+    With ``raise_errors`` a rejected send raises ``httpx.HTTPStatusError`` instead,
+    for callers that retry.
+    """
+    response = await telegram_api("sendMessage", {"chat_id": chat_id, "text": text})
+    if raise_errors:
+        response.raise_for_status()
+    try:
+        return response.json()["result"]["message_id"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+async def edit_telegram_message(chat_id, message_id, text, raise_errors=False):
+    response = await telegram_api("editMessageText", {"chat_id": chat_id, "message_id": message_id, "text": text})
+    if raise_errors:
+        response.raise_for_status()
+    return response
+
+
+async def send_chat_action(chat_id, action="typing"):
+    return await telegram_api("sendChatAction", {"chat_id": chat_id, "action": action})
+
+
+def visible_reply_text(text):
+    """The part of a (possibly partial) assistant reply that is safe to show: never the order JSON."""
+    text = text.split("```json")[0]
+    return _PARTIAL_FENCE_RE.sub("", text).strip()
+
+
+class TelegramStreamingReply:
+    """Shows an LLM reply progressively: one message, then throttled edits as text arrives.
+
+    With an ``outbound`` scheduler every send and edit takes a token from the
+    chat's bucket and gets its 429 handling; an interim edit that would have
+    to wait for a token is skipped, since a later one carries newer text.
+    """
+
+    def __init__(self, chat_id, edit_interval=TELEGRAM_STREAM_EDIT_INTERVAL, min_chars=TELEGRAM_STREAM_MIN_CHARS, outbound=None):
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.min_chars = min_chars
+        self.outbound = outbound
+        self.message_id = None
+        self._shown = ""
+        self._last_edit = 0.0
+
+    async def _send(self, text):
+        if self.outbound is None:
+            return await send_telegram_message(self.chat_id, text)
+        return await self.outbound.call(
+            "telegram", self.chat_id, lambda: send_telegram_message(self.chat_id, text, raise_errors=True)
+        )
+
+    async def _edit(self, text):
+        if self.outbound is None:
+            return await edit_telegram_message(self.chat_id, self.message_id, text)
+        return await self.outbound.call(
+            "telegram", self.chat_id, lambda: edit_telegram_message(self.chat_id, self.message_id, text, raise_errors=True)
+        )
+
+    @property
+    def started(self):
+        return self.message_id is not None
+
+    async def start(self):
+        await send_chat_action(self.chat_id, "typing")
+
+    async def update(self, text):
+        text = visible_reply_text(text)[:TELEGRAM_MAX_MESSAGE_LENGTH]
+        if not text or text == self._shown:
+            return
+        if self.outbound is not None and not self.outbound.ready("telegram", self.chat_id):
+            return
+        if self.message_id is None:
+            if len(text) < self.min_chars:
+                return
+            self.message_id = await self._send(text)
+        elif time.monotonic() - self._last_edit < self.edit_interval:
+            return
+        else:
+            await self._edit(text)
+        self._shown = text
+        self._last_edit = time.monotonic()
+
+    async def finish(self, text):
+        """Replaces the progressive message with the final text (or sends it if nothing was shown yet)."""
+        text = text[:TELEGRAM_MAX_MESSAGE_LENGTH]
+        if self.message_id is None:
+            self.message_id = await self._send(text)
+        elif text != self._shown:
+            await self._edit(text)
+        self._shown = text
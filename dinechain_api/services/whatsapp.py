@@ -0,0 +1,102 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from dotenv import load_dotenv
+from .http_clients import get_http_client
+
+load_dotenv()
+
+TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
+TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
+TWILIO_MESSAGES_URL = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+
+# Sends in flight at once; the rest wait their turn instead of piling onto Twilio
+WHATSAPP_SEND_CONCURRENCY = int(os.getenv("WHATSAPP_SEND_CONCURRENCY", "10"))
+# Threads for the Twilio SDK fallback, used only when the pooled HTTP client
+# could not get the request out at all
+WHATSAPP_FALLBACK_THREADS = int(os.getenv("WHATSAPP_FALLBACK_THREADS", "2"))
+
+
+class WhatsAppSender:
+    """Sends WhatsApp messages through Twilio's Messages REST endpoint.
+
+    Requests go out on the shared "twilio" connection pool with the Basic auth
+    header built once. If a request can't be sent at all (no connection, pool
+    exhausted) it is retried once through the Twilio SDK on a small dedicated
+    executor, so a burst never ties up the default thread pool. Errors after
+    Twilio has seen the request are never retried here, since that could send
+    the message twice.
+    """
+
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN, from_number=TWILIO_WHATSAPP_NUMBER):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_ = f"whatsapp:{from_number}"
+        self.auth = httpx.BasicAuth(account_sid or "", auth_token or "")
+        self.semaphore = asyncio.Semaphore(WHATSAPP_SEND_CONCURRENCY)
+        self._executor = None
+        self._sdk_client = None
+        self.sent = 0
+        self.fallbacks = 0
+        self.failed = 0
+
+    def _send_with_sdk(self, chat_id, text):
+        if self._sdk_client is None:
+            from twilio.rest import Client
+            self._sdk_client = Client(self.account_sid, self.auth_token)
+        return self._sdk_client.messages.create(body=text, from_=self.from_, to=chat_id).sid
+
+    async def _fallback(self, chat_id, text):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=WHATSAPP_FALLBACK_THREADS, thread_name_prefix="twilio-fallback")
+        self.fallbacks += 1
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._send_with_sdk, chat_id, text)
+
+    async def send(self, chat_id, text, raise_errors=False):
+        """Sends a message and returns its sid (None if Twilio rejected it).
+
+        With ``raise_errors`` a rejected send raises instead, for callers that retry.
+        """
+        async with self.semaphore:
+            try:
+                try:
+                    response = await get_http_client("twilio").post(
+                        TWILIO_MESSAGES_URL,
+                        data={"From": self.from_, "To": chat_id, "Body": text},
+                        auth=self.auth,
+                    )
+                except (httpx.ConnectError, httpx.PoolTimeout) as e:
+                    print(f"⚠️ Twilio request could not be sent ({type(e).__name__}); using the SDK fallback.")
+                    sid = await self._fallback(chat_id, text)
+                    self.sent += 1
+                    return sid
+                response.raise_for_status()
+            except Exception as e:
+                self.failed += 1
+                if raise_errors:
+                    raise
+                print(f"⚠️ WhatsApp message to {chat_id} failed: {e}")
+                return None
+        self.sent += 1
+        try:
+            return response.json()["sid"]
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    async def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "fallbacks": self.fallbacks,
+            "failed": self.failed,
+            "concurrency": WHATSAPP_SEND_CONCURRENCY,
+        }
+
+
+whatsapp_sender = WhatsAppSender()
@@ -0,0 +1,87 @@
+import asyncio
+import atexit
+import functools
+import threading
+
+# A single long-lived event loop shared by the whole app. Async views, the
+# payment watcher and every pooled HTTP client run on it, so connections and
+# asyncio primitives outlive individual requests.
+_app_loop = None
+_loop_thread = None
+_shutdown_hooks = []
+
+
+def start_app_loop():
+    """Starts the shared event loop in a daemon thread (idempotent)."""
+    global _app_loop, _loop_thread
+    if _app_loop is not None:
+        return _app_loop
+
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    _loop_thread = threading.Thread(target=run, name="dinechain-app-loop", daemon=True)
+    _loop_thread.start()
+    ready.wait()
+    _app_loop = loop
+    atexit.register(stop_app_loop)
+    return loop
+
+
+def get_app_loop():
+    if _app_loop is None:
+        return start_app_loop()
+    return _app_loop
+
+
+def submit(coro):
+    """Schedules a coroutine on the app loop and returns a concurrent Future."""
+    return asyncio.run_coroutine_threadsafe(coro, get_app_loop())
+
+
+def run_sync(coro):
+    """Runs a coroutine on the app loop and blocks until it finishes."""
+    return submit(coro).result()
+
+
+def async_to_sync(func):
+    """Flask async view adapter that runs views on the app loop instead of a fresh loop per request."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_sync(func(*args, **kwargs))
+    return wrapper
+
+
+def on_shutdown(hook):
+    """Registers a coroutine function to be awaited on the app loop at shutdown."""
+    _shutdown_hooks.append(hook)
+    return hook
+
+
+def stop_app_loop():
+    global _app_loop, _loop_thread
+    loop = _app_loop
+    if loop is None:
+        return
+
+    async def run_hooks():
+        for hook in reversed(_shutdown_hooks):
+            try:
+                await hook()
+            except Exception as e:
+                print(f"⚠️ Error during shutdown hook {hook.__name__}: {e}")
+
+    try:
+        asyncio.run_coroutine_threadsafe(run_hooks(), loop).result(timeout=10)
+    except Exception as e:
+        print(f"⚠️ Error stopping app loop: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    _loop_thread.join(timeout=5)
+    _shutdown_hooks.clear()
+    _app_loop = None
+    _loop_thread = None
@@ -0,0 +1,18 @@
+import os
+from dotenv import load_dotenv
+from flask import request
+
+load_dotenv()
+
+# Shared secret for the internal and admin data endpoints, sent as
+# "Authorization: Bearer <INTERNAL_API_KEY>"
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
+
+
+def is_internal_request():
+    """True if the current request carries the internal API key.
+
+    With INTERNAL_API_KEY unset every request is rejected, so "Bearer None" never passes.
+    """
+    auth_header = request.headers.get("Authorization")
+    return bool(INTERNAL_API_KEY) and auth_header == f"Bearer {INTERNAL_API_KEY}"
@@ -37,7 +37,9 @@ async def create_stripe_checkout_session(order_id, email, order_items, chat_id,
                 "chat_id": chat_id,
                 "delivery": delivery_info,
                 "platform": platform,
-            }
+            },
+            # Lets payment_intent.payment_failed events be traced back to the order
+            payment_intent_data={"metadata": {"order_id": order_id}},
         )
         return checkout_session.url, checkout_session.id
     except Exception as e:
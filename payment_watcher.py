@@ -0,0 +1,5 @@
+# Entry point for the `payment-watcher` worker in render.yaml
+from dinechain_api.services.payment_watcher import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The app and its services read their configuration at import time, so the
+# test environment is set up before anything from dinechain_api is imported.
+# Every test session gets its own database file.
+_tmp_dir = tempfile.mkdtemp(prefix="dinechain-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp_dir, "orders.db")
+os.environ.setdefault("USDC_TOKEN_ADDRESS", "0x" + "11" * 20)
+# Keeps the payment watcher and webhook registration out of the test process
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+os.environ.setdefault("INTERNAL_API_KEY", "test-internal-key")
+os.environ.setdefault("LLM_API_KEY", "test-llm-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """The wired app module; importing it starts the app loop and migrates the test database."""
+    from dinechain_api import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import os
+import pytest
+from dinechain_api.utils.event_loop import run_sync
+
+
+def _auth():
+    return {"Authorization": f"Bearer {os.environ['INTERNAL_API_KEY']}"}
+
+
+@pytest.fixture(scope="module")
+def export_orders(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            for day in range(1, 6):
+                await conn.execute(
+                    """
+                    INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, private_key, delivery, timestamp)
+                    VALUES ('telegram', ?, 'Export Tester', ?, 100, 1, 'SECRET-KEY', 'Table 1', ?)
+                    """,
+                    (f"export-{day}", json.dumps([{"name": "Jollof Rice", "price": 100}]), f"2020-03-0{day} 12:00:00")
+                )
+            await conn.commit()
+
+    run_sync(insert())
+
+
+def _rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_export_requires_the_internal_api_key(client, export_orders):
+    assert client.get("/admin/export").status_code == 401
+    assert client.get("/admin/export.ndjson", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/admin/export", headers={"Authorization": "Bearer None"}).status_code == 401
+
+
+def test_export_filters_by_date_and_never_includes_private_keys(client, export_orders):
+    response = client.get("/admin/export?date_from=2020-03-02&date_to=2020-03-04", headers=_auth())
+    assert response.status_code == 200
+    rows = _rows(response)
+    header, body = rows[0], rows[1:]
+    assert "private_key" not in header
+    assert [row[header.index("chat_id")] for row in body] == ["export-2", "export-3", "export-4"]
+    assert "SECRET-KEY" not in response.get_data(as_text=True)
+
+
+def test_export_accepts_other_iso_spellings_of_a_date(client, export_orders):
+    response = client.get("/admin/export.ndjson?date_from=20200305&date_to=20200305", headers=_auth())
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)["chat_id"] for line in lines] == ["export-5"]
+
+
+@pytest.mark.parametrize("query", [
+    "date_from=yesterday",
+    "date_to=2020-13-01",
+    "date_from=2020-03-01' OR '1'='1",
+])
+def test_export_rejects_malformed_date_filters(client, export_orders, query):
+    assert client.get(f"/admin/export?{query}", headers=_auth()).status_code == 400
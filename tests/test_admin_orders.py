@@ -0,0 +1,106 @@
+import html
+import json
+import re
+import pytest
+from dinechain_api.blueprints.admin import _build_orders_query
+from dinechain_api.utils.event_loop import run_sync
+
+# Seeded in their own month so other tests' orders never fall inside the filters
+DATE_FILTER = "date_from=2019-06-01&date_to=2019-06-30"
+
+
+@pytest.fixture(scope="module")
+def seeded_orders(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        ids = []
+        async with get_db_conn() as conn:
+            for n in range(23):
+                dish = "Jollof Rice" if n % 3 == 0 else "Chicken Shawarma"
+                cursor = await conn.execute(
+                    """
+                    INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, payment_method, delivery, timestamp)
+                    VALUES (?, ?, ?, ?, 500, ?, 'card', ?, ?)
+                    """,
+                    (
+                        "telegram" if n % 2 else "whatsapp", f"admin-{n}", f"Keyset Tester {n}",
+                        json.dumps([{"name": dish, "price": 500}]), n % 2, f"{n} Admiralty Way",
+                        # Three orders per timestamp, so pages have to break ties on id
+                        f"2019-06-{1 + n // 3:02d} 12:00:00",
+                    )
+                )
+                ids.append(cursor.lastrowid)
+            await conn.commit()
+        return ids
+
+    return run_sync(insert())
+
+
+def _ids(response):
+    return [int(order_id) for order_id in re.findall(r"<tr>\s*<td>(\d+)</td>", response.get_data(as_text=True))]
+
+
+def _next_url(response):
+    match = re.search(r'href="(\?[^"]*before=[^"]*)"', response.get_data(as_text=True))
+    return html.unescape(match.group(1)) if match else None
+
+
+def test_pages_walk_every_order_newest_first_without_gaps(client, seeded_orders):
+    seen, url, pages = [], f"/admin?{DATE_FILTER}&limit=5", 0
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = _ids(response)
+        assert 0 < len(page) <= 5
+        seen += page
+        pages += 1
+        next_url = _next_url(response)
+        url = f"/admin{next_url}" if next_url else None
+
+    assert pages == 5
+    # Newest timestamp first, then highest id within a timestamp
+    assert seen == sorted(seeded_orders, key=lambda order_id: (seeded_orders.index(order_id) // 3, order_id), reverse=True)
+
+
+def test_filters_and_search_combine(client, seeded_orders):
+    jollof_paid = [order_id for n, order_id in enumerate(seeded_orders) if n % 3 == 0 and n % 2]
+    assert sorted(_ids(client.get(f"/admin?{DATE_FILTER}&q=jollof&paid=1"))) == jollof_paid
+    # Prefix match on every word, across name and delivery
+    assert _ids(client.get(f"/admin?{DATE_FILTER}&q=keyset+tes+7+admiral")) == [seeded_orders[7]]
+    assert sorted(_ids(client.get(f"/admin?{DATE_FILTER}&platform=whatsapp&q=shawarma"))) == [
+        order_id for n, order_id in enumerate(seeded_orders) if n % 3 and n % 2 == 0
+    ]
+
+
+def test_search_follows_edits_to_the_order(client, seeded_orders):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def rename():
+        async with get_db_conn() as conn:
+            await conn.execute("UPDATE orders SET summary = ? WHERE id = ?", (json.dumps([{"name": "Zobo", "price": 300}]), seeded_orders[4]))
+            await conn.commit()
+
+    run_sync(rename())
+    assert _ids(client.get(f"/admin?{DATE_FILTER}&q=zobo")) == [seeded_orders[4]]
+    assert seeded_orders[4] not in _ids(client.get(f"/admin?{DATE_FILTER}&q=shawarma"))
+
+
+def test_awkward_search_text_and_bad_cursors(client, seeded_orders):
+    assert client.get(f'/admin?{DATE_FILTER}&q="unbalanced AND (').status_code == 200
+    assert client.get("/admin?before=garbage").status_code == 400
+
+
+def test_a_page_is_read_through_the_timestamp_index(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+    filters = {"q": "", "paid": "", "platform": "", "payment_method": "", "date_from": "", "date_to": ""}
+    sql, params = _build_orders_query(filters, ("2019-06-05 12:00:00", 10), 50)
+
+    async def plan():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " ".join(row["detail"] for row in await cursor.fetchall())
+
+    detail = run_sync(plan())
+    assert "USING INDEX idx_orders_timestamp_id" in detail
+    assert "TEMP B-TREE" not in detail
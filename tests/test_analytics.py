@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+import pytest
+from dinechain_api.services.analytics import backfill_rollups, get_sales_analytics, record_paid_order
+from dinechain_api.services.outbox import mark_order_paid
+from dinechain_api.utils.event_loop import run_sync
+
+# A platform and item of their own keep other tests' paid orders out of these buckets
+PLATFORM = "analytics-test"
+ITEM = "Analytics Puff-Puff"
+
+
+def _today():
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+@pytest.fixture(scope="module")
+def paid_orders(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert_and_pay():
+        async with get_db_conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            ids = []
+            for quantity in (1, 2, 3):
+                cursor = await conn.execute(
+                    "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid) VALUES (?, 'analytics', 'Analytics Tester', '[]', ?, 0)",
+                    (PLATFORM, 150 * quantity)
+                )
+                await conn.execute(
+                    "INSERT INTO order_items (order_id, menu_item_id, name, unit_price, quantity) VALUES (?, NULL, ?, 150, ?)",
+                    (cursor.lastrowid, ITEM, quantity)
+                )
+                ids.append(cursor.lastrowid)
+            # An unpaid order never reaches the rollups
+            await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid) VALUES (?, 'analytics', 'Analytics Tester', '[]', 999, 0)",
+                (PLATFORM,)
+            )
+            for order_id in ids:
+                await mark_order_paid(conn, order_id)
+            # Paying again (a retried webhook) must not count twice
+            await mark_order_paid(conn, ids[0])
+            await conn.commit()
+        return ids
+
+    return run_sync(insert_and_pay())
+
+
+def _analytics():
+    return run_sync(get_sales_analytics(_today(), _today(), platform=PLATFORM, top_items=100))
+
+
+def _item(result):
+    # Lines that don't match the menu are grouped under their normalised name
+    return next(item for item in result["top_items"] if item["item"] == ITEM.lower())
+
+
+def test_paying_an_order_updates_the_rollups(paid_orders):
+    result = _analytics()
+    assert result["totals"] == {"orders": 3, "revenue": 900}
+    assert result["daily"] == [{"day": _today(), "orders": 3, "revenue": 900}]
+    assert {bucket["platform"] for bucket in result["hourly"]} == {PLATFORM}
+    assert _item(result) == {"item": ITEM.lower(), "menu_item_id": None, "quantity": 6, "revenue": 900}
+
+
+def test_backfill_rebuilds_the_same_rollups(paid_orders):
+    before = _analytics()
+    run_sync(backfill_rollups())
+    run_sync(backfill_rollups())
+    after = _analytics()
+    assert after["totals"] == before["totals"]
+    assert after["hourly"] == before["hourly"]
+    assert _item(after) == _item(before)
+
+
+def test_spellings_of_one_dish_share_a_bucket(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+    day = "2018-03-03"
+    lines = [
+        ("main-meal/jollof-rice", "Jollof Rice", 2),
+        ("main-meal/jollof-rice", "jollof rice", 1),
+        ("main-meal/jollof-rice", "Jollof rice (party size)", 1),
+        (None, "Suya Platter", 1),
+        (None, "  suya platter ", 2),
+    ]
+
+    async def pay():
+        async with get_db_conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            for menu_item_id, name, quantity in lines:
+                cursor = await conn.execute(
+                    "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, paid_at) "
+                    "VALUES (?, 'analytics-spelling', 'Analytics Tester', '[]', ?, 1, ?)",
+                    (PLATFORM, 100 * quantity, f"{day} 12:00:00")
+                )
+                await conn.execute(
+                    "INSERT INTO order_items (order_id, menu_item_id, name, unit_price, quantity) VALUES (?, ?, ?, 100, ?)",
+                    (cursor.lastrowid, menu_item_id, name, quantity)
+                )
+                await record_paid_order(conn, cursor.lastrowid)
+            await conn.commit()
+
+    run_sync(pay())
+    items = run_sync(get_sales_analytics(day, day))["top_items"]
+    assert items == [
+        {"item": "Jollof Rice", "menu_item_id": "main-meal/jollof-rice", "quantity": 4, "revenue": 400},
+        {"item": "suya platter", "menu_item_id": None, "quantity": 3, "revenue": 300},
+    ]
+
+
+def test_analytics_endpoint(client, paid_orders):
+    response = client.get(f"/admin/analytics?from={_today()}&to={_today()}&platform={PLATFORM}")
+    assert response.status_code == 200
+    assert response.get_json()["totals"] == {"orders": 3, "revenue": 900}
+    assert client.get("/admin/analytics?from=2026-02-10&to=2026-02-01").status_code == 400
+    assert client.get("/admin/analytics?from=last-week").status_code == 400
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import aiosqlite
+from dinechain_api.services import migrations
+from dinechain_api.services.migrations import MIGRATIONS, run_migrations
+from dinechain_api.utils.event_loop import run_sync
+
+
+def _turn(n):
+    return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+
+def test_turns_are_appended_without_rewriting_earlier_rows(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def scenario():
+        async with get_db_conn() as conn:
+            await app_module.append_conversation_messages(conn, "telegram", "conv-append", _turn(1))
+            first_rows = await (await conn.execute(
+                "SELECT m.id, m.content FROM conversation_messages m JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE c.chat_id = 'conv-append' ORDER BY m.id"
+            )).fetchall()
+            await app_module.append_conversation_messages(conn, "telegram", "conv-append", _turn(2))
+            all_rows = await (await conn.execute(
+                "SELECT m.id, m.content FROM conversation_messages m JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE c.chat_id = 'conv-append' ORDER BY m.id"
+            )).fetchall()
+        async with get_db_conn(readonly=True) as conn:
+            history = await app_module.get_conversation_history(conn, "telegram", "conv-append")
+        return [tuple(row) for row in first_rows], [tuple(row) for row in all_rows], history
+
+    first_rows, all_rows, (prompt_id, history) = run_sync(scenario())
+    assert all_rows[:2] == first_rows
+    assert len(all_rows) == 4
+    assert prompt_id == "ordering"
+    assert history == _turn(1) + _turn(2)
+
+
+def test_history_returns_the_latest_messages_in_order(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def scenario():
+        async with get_db_conn() as conn:
+            for n in range(10):
+                await app_module.append_conversation_messages(conn, "whatsapp", "conv-limit", _turn(n))
+        async with get_db_conn(readonly=True) as conn:
+            return await app_module.get_conversation_history(conn, "whatsapp", "conv-limit", limit=3)
+
+    _, history = run_sync(scenario())
+    assert [msg["content"] for msg in history] == ["answer 8", "question 9", "answer 9"]
+
+
+def test_unknown_chat_has_an_empty_history(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def scenario():
+        async with get_db_conn(readonly=True) as conn:
+            return await app_module.get_conversation_history(conn, "telegram", "conv-nobody")
+
+    assert run_sync(scenario()) == ("ordering", [])
+
+
+def test_history_blobs_are_split_into_message_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "blobs.db")
+    blob = [
+        {"role": "system", "content": "old system prompt"},
+        {"role": "user", "content": "seed question"},
+        {"role": "assistant", "content": "seed answer"},
+    ] + _turn(1)
+
+    async def scenario():
+        monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in MIGRATIONS if m[0] <= 3])
+        conn = await aiosqlite.connect(path)
+        await run_migrations(conn)
+        await conn.execute("INSERT INTO conversations (chat_id, platform, history) VALUES ('9', 'telegram', ?)", (json.dumps(blob),))
+        await conn.commit()
+        monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS)
+        await run_migrations(conn)
+        rows = await (await conn.execute("SELECT role, content FROM conversation_messages ORDER BY id")).fetchall()
+        history = (await (await conn.execute("SELECT history FROM conversations")).fetchone())[0]
+        await conn.close()
+        return [{"role": role, "content": content} for role, content in rows], history
+
+    messages, history = asyncio.run(scenario())
+    # The seeded system prompt and turns now come from the prompt template
+    assert messages == _turn(1)
+    assert history is None
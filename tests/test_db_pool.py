@@ -0,0 +1,78 @@
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from dinechain_api.blueprints import orders
+from dinechain_api.blueprints.orders import get_db_conn
+from dinechain_api.utils.event_loop import run_sync
+
+
+@pytest.fixture
+def scratch_table(app_module):
+    async def create():
+        async with get_db_conn() as conn:
+            await conn.execute("CREATE TABLE IF NOT EXISTS pool_test (value TEXT)")
+            await conn.execute("DELETE FROM pool_test")
+            await conn.commit()
+
+    run_sync(create())
+
+
+def test_writer_uses_wal_and_readers_see_its_commits(scratch_table):
+    async def scenario():
+        async with get_db_conn() as conn:
+            mode = (await (await conn.execute("PRAGMA journal_mode")).fetchone())[0]
+            await conn.execute("INSERT INTO pool_test (value) VALUES ('written')")
+            await conn.commit()
+        async with get_db_conn(readonly=True) as conn:
+            rows = await (await conn.execute("SELECT value FROM pool_test")).fetchall()
+        return mode, [row["value"] for row in rows]
+
+    assert run_sync(scenario()) == ("wal", ["written"])
+    assert os.path.exists(orders.DATABASE_PATH)
+
+
+def test_readers_cannot_write(scratch_table):
+    async def scenario():
+        async with get_db_conn(readonly=True) as conn:
+            await conn.execute("INSERT INTO pool_test (value) VALUES ('nope')")
+
+    with pytest.raises(sqlite3.OperationalError):
+        run_sync(scenario())
+
+
+def test_an_uncommitted_write_is_rolled_back_for_the_next_caller(scratch_table):
+    async def scenario():
+        async with get_db_conn() as conn:
+            await conn.execute("INSERT INTO pool_test (value) VALUES ('abandoned')")
+        async with get_db_conn() as conn:
+            assert not conn.in_transaction
+            rows = await (await conn.execute("SELECT value FROM pool_test")).fetchall()
+        return rows
+
+    assert run_sync(scenario()) == []
+
+
+def test_reader_pool_is_bounded(scratch_table):
+    async def read():
+        async with get_db_conn(readonly=True) as conn:
+            await (await conn.execute("SELECT COUNT(*) FROM pool_test")).fetchone()
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await asyncio.gather(*(read() for _ in range(orders.DB_READER_POOL_SIZE * 3)))
+        return orders._reader_count
+
+    assert run_sync(scenario()) <= orders.DB_READER_POOL_SIZE
+
+
+def test_an_empty_database_path_means_the_default():
+    env = {**os.environ, "DATABASE_PATH": ""}
+    output = subprocess.run(
+        [sys.executable, "-c", "from dinechain_api.blueprints import orders; print(orders.DATABASE_PATH)"],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert output == os.path.join(os.path.dirname(orders.__file__), "orders.db")
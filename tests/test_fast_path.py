@@ -0,0 +1,56 @@
+import pytest
+from dinechain_api.services.fast_path import answer_without_llm, parse_order_lines
+from dinechain_api.utils.event_loop import run_sync
+
+
+@pytest.mark.parametrize("text", ["Hi", "hello there", "Good morning!"])
+def test_greetings_are_answered(text):
+    assert "Welcome to DineChain" in answer_without_llm(text)
+
+
+def test_menu_and_category_listings():
+    menu = answer_without_llm("show me the menu")
+    assert "*Main Meal*" in menu and "Jollof Rice: $0.80" in menu
+    drinks = answer_without_llm("what drinks do you have")
+    assert "*Soda*" in drinks and "*Main Meal*" not in drinks
+
+
+def test_price_questions():
+    assert answer_without_llm("how much is jollof rice") == "Jollof Rice is $0.80. Would you like to add it to your order?"
+
+
+def test_plain_orders_are_itemised():
+    reply = answer_without_llm("2 jollof rice and a coke")
+    assert "2 x Jollof Rice: $1.60" in reply
+    assert "1 x Coke: $0.60" in reply
+    assert parse_order_lines("I want 3 jollof rice") is not None
+
+
+@pytest.mark.parametrize("text", ["can you deliver to lekki?", "2 unicorn steaks", "beef", "my name is Ada"])
+def test_anything_else_goes_to_the_llm(text):
+    assert answer_without_llm(text) is None
+
+
+def test_a_fast_path_turn_never_calls_the_llm(app_module, monkeypatch):
+    sent = []
+
+    async def record(platform, chat_id, text, **kwargs):
+        sent.append(text)
+
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("the LLM must not be called for a greeting")
+
+    monkeypatch.setattr(app_module, "send_user_message", record)
+    monkeypatch.setattr(app_module, "process_llm_response", no_llm)
+    run_sync(app_module.process_message("telegram", "fast-path-1", "hello", "Ada"))
+
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def history():
+        async with get_db_conn(readonly=True) as conn:
+            return await app_module.get_conversation_history(conn, "telegram", "fast-path-1")
+
+    _, messages = run_sync(history())
+    assert len(sent) == 1 and "Welcome to DineChain" in sent[0]
+    # The turn is stored so the LLM has full context later
+    assert messages == [{"role": "user", "content": "hello"}, {"role": "assistant", "content": sent[0]}]
@@ -0,0 +1,103 @@
+import asyncio
+from dinechain_api.services.hd_wallet import DepositAddressPool, HDWallet
+from dinechain_api.utils.event_loop import run_sync
+
+# The well-known development mnemonic (Hardhat/Anvil); never holds real funds
+MNEMONIC = "test test test test test test test test test test test junk"
+
+
+def test_derivation_follows_bip44():
+    wallet = HDWallet(MNEMONIC)
+    assert wallet.path(0) == "m/44'/60'/0'/0/0"
+    assert wallet.address(0) == "0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266"
+    assert wallet.address(1) == "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"
+
+
+def test_fingerprint_changes_with_account_and_passphrase():
+    fingerprints = {
+        HDWallet(MNEMONIC).fingerprint,
+        HDWallet(MNEMONIC, account=1).fingerprint,
+        HDWallet(MNEMONIC, passphrase="extra").fingerprint,
+    }
+    assert len(fingerprints) == 3
+    assert HDWallet(MNEMONIC).fingerprint == HDWallet(MNEMONIC).fingerprint
+
+
+def _insert_order(chat_id):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid) VALUES ('telegram', ?, 'HD Tester', '[]', 100, 0)",
+                (chat_id,)
+            )
+            await conn.commit()
+            return cursor.lastrowid
+
+    return run_sync(insert())
+
+
+def _load_order(order_id):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def load():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+            return await cursor.fetchone()
+
+    return run_sync(load())
+
+
+def test_concurrent_claims_never_share_an_address(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+    pool = DepositAddressPool(HDWallet(MNEMONIC, account=7), size=5, low_water=1)
+    order_ids = [_insert_order(f"hd-claim-{i}") for i in range(8)]
+
+    async def claim(order_id):
+        async with get_db_conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            claimed = await pool.claim(conn, order_id)
+            await conn.commit()
+            return claimed
+
+    async def scenario():
+        assert await pool.fill() == 5
+        return await asyncio.gather(*(claim(order_id) for order_id in order_ids))
+
+    claims = run_sync(scenario())
+    handed_out = [claimed for claimed in claims if claimed]
+    assert len(handed_out) == 5
+    assert len({address for _, address in handed_out}) == 5
+    assert sorted(index for index, _ in handed_out) == [0, 1, 2, 3, 4]
+    # The rest found the pool empty rather than reusing an address
+    assert pool.empty == 3
+
+
+def test_crypto_reply_reuses_the_fallback_wallet(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "deposit_pool", None)
+    order_id = _insert_order("hd-fallback")
+
+    first = run_sync(app_module._assign_deposit_address(_load_order(order_id)))
+    private_key = _load_order(order_id)["private_key"]
+    second = run_sync(app_module._assign_deposit_address(_load_order(order_id)))
+
+    assert second == first
+    assert _load_order(order_id)["private_key"] == private_key
+
+
+def test_claimed_address_records_its_wallet_and_is_reused(app_module, monkeypatch):
+    wallet = HDWallet(MNEMONIC, account=3)
+    monkeypatch.setattr(app_module, "deposit_pool", DepositAddressPool(wallet, size=2, low_water=1))
+    order_id = _insert_order("hd-claimed")
+
+    # The pool starts empty, so the first assignment also fills it
+    address = run_sync(app_module._assign_deposit_address(_load_order(order_id)))
+    order = _load_order(order_id)
+    assert address == wallet.address(order["derivation_index"])
+    assert order["deposit_wallet"] == wallet.fingerprint
+    assert order["derivation_path"] == wallet.path(order["derivation_index"])
+    assert order["private_key"] is None
+
+    assert run_sync(app_module._assign_deposit_address(_load_order(order_id))) == address
+    assert _load_order(order_id)["derivation_index"] == order["derivation_index"]
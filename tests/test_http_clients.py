@@ -0,0 +1,42 @@
+import asyncio
+from dinechain_api.services import http_clients
+from dinechain_api.services.http_clients import UPSTREAM_TIMEOUTS, get_http_client
+
+
+def test_each_upstream_shares_one_client():
+    async def scenario():
+        client = get_http_client("test-upstream")
+        try:
+            assert get_http_client("test-upstream") is client
+            assert get_http_client("other-test-upstream") is not client
+        finally:
+            await http_clients._clients.pop("test-upstream").aclose()
+            await http_clients._clients.pop("other-test-upstream").aclose()
+
+    asyncio.run(scenario())
+
+
+def test_a_closed_client_is_replaced():
+    async def scenario():
+        client = get_http_client("test-upstream")
+        await client.aclose()
+        replacement = get_http_client("test-upstream")
+        try:
+            assert replacement is not client
+            assert not replacement.is_closed
+        finally:
+            await http_clients._clients.pop("test-upstream").aclose()
+
+    asyncio.run(scenario())
+
+
+def test_clients_use_their_upstream_timeout():
+    async def scenario():
+        client = http_clients._build_client("telegram")
+        try:
+            assert client.timeout.read == UPSTREAM_TIMEOUTS["telegram"]
+            assert client.timeout.connect <= http_clients.HTTP_CONNECT_TIMEOUT
+        finally:
+            await client.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import pytest
+from dinechain_api.services import inline_reply as inline_module
+from dinechain_api.services.inline_reply import InlineReply, replying_inline, release_inline_reply, send_inline
+
+
+@pytest.mark.skipif("INLINE_REPLIES" in os.environ, reason="INLINE_REPLIES is set in the environment")
+def test_inline_replies_are_off_by_default():
+    assert inline_module.INLINE_REPLIES is False
+    assert inline_module.get_inline_reply_stats()["enabled"] is False
+
+
+def test_first_reply_of_the_turn_is_returned_inline():
+    async def scenario():
+        slot = InlineReply("telegram", "42")
+
+        async def turn():
+            with replying_inline(slot):
+                first = await send_inline("telegram", "42", "Hello!")
+                # Another chat's message never takes this webhook's slot
+                other = await send_inline("telegram", "43", "Hi there")
+                slot.responded()
+                second = await send_inline("telegram", "42", "What would you like?")
+                return first, other, second
+
+        task = asyncio.create_task(turn())
+        text = await slot.wait(timeout=1.0)
+        return text, await task
+
+    text, (first, other, second) = asyncio.run(scenario())
+    assert text == "Hello!"
+    assert (first, other, second) == (True, False, False)
+
+
+def test_late_reply_goes_through_the_api():
+    async def scenario():
+        slot = InlineReply("whatsapp", "whatsapp:+1")
+        text = await slot.wait(timeout=0.01)
+        with replying_inline(slot):
+            sent_inline = await send_inline("whatsapp", "whatsapp:+1", "Sorry for the wait")
+        return text, sent_inline
+
+    assert asyncio.run(scenario()) == (None, False)
+
+
+def test_long_and_streamed_replies_release_the_webhook():
+    async def scenario():
+        slot = InlineReply("whatsapp", "whatsapp:+1")
+        with replying_inline(slot):
+            too_long = await send_inline("whatsapp", "whatsapp:+1", "x" * 1601)
+        streamed = InlineReply("telegram", "42")
+        with replying_inline(streamed):
+            release_inline_reply()
+            released = await streamed.wait(timeout=1.0)
+        return too_long, await slot.wait(timeout=1.0), released
+
+    assert asyncio.run(scenario()) == (False, None, None)
@@ -0,0 +1,88 @@
+import asyncio
+import httpx
+import pytest
+from dinechain_api.services import llm
+from dinechain_api.services.llm import LLMResponseCache, cache_key, get_llm_response, is_cacheable_conversation
+from dinechain_api.utils.event_loop import run_sync
+
+NAMESPACE = "ordering:v1"
+
+
+class FakeLLM:
+    """Answers chat completions with a fixed reply and counts the calls."""
+
+    def __init__(self, reply="Welcome! What would you like?"):
+        self.reply = reply
+        self.calls = 0
+
+    async def handle(self, request):
+        self.calls += 1
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": self.reply}}]})
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    fake = FakeLLM()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handle))
+    monkeypatch.setattr(llm, "get_http_client", lambda name: client)
+    monkeypatch.setattr(llm, "llm_cache", LLMResponseCache(use_sqlite=False))
+    return fake
+
+
+def _history(text):
+    return [{"role": "system", "content": "prompt"}, {"role": "user", "content": text}]
+
+
+def test_only_short_generic_openings_are_cacheable():
+    assert is_cacheable_conversation([{"role": "user", "content": "hi"}])
+    assert not is_cacheable_conversation([{"role": "user", "content": "call me on 0803 000 0000"}])
+    assert not is_cacheable_conversation([{"role": "user", "content": "ada@example.com"}])
+    assert not is_cacheable_conversation([{"role": "user", "content": "hi"}] * 3)
+
+
+def test_equivalent_user_text_shares_a_key():
+    request = {"model": "m", "temperature": 0.7, "max_tokens": 400}
+    assert cache_key({**request, "messages": _history("Hi!")}, NAMESPACE) == cache_key({**request, "messages": _history("  hi  ")}, NAMESPACE)
+    assert cache_key({**request, "messages": _history("hi")}, NAMESPACE) != cache_key({**request, "messages": _history("menu")}, NAMESPACE)
+
+
+def test_repeated_openings_are_served_from_the_cache(fake_llm):
+    async def scenario():
+        first = await get_llm_response(_history("Hello!"), cacheable=True, namespace=NAMESPACE)
+        second = await get_llm_response(_history("hello"), cacheable=True, namespace=NAMESPACE)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == second
+    assert fake_llm.calls == 1
+
+
+def test_uncacheable_or_unnamespaced_requests_always_call_the_llm(fake_llm):
+    async def scenario():
+        await get_llm_response(_history("hello"), cacheable=False, namespace=NAMESPACE)
+        await get_llm_response(_history("hello"), cacheable=False, namespace=NAMESPACE)
+        await get_llm_response(_history("hello"), cacheable=True)
+        await get_llm_response(_history("hello"), cacheable=True)
+
+    asyncio.run(scenario())
+    assert fake_llm.calls == 4
+
+
+def test_order_summaries_are_never_cached(fake_llm):
+    fake_llm.reply = 'Your Order:\n```json\n{"items": [], "total": 0}\n```'
+
+    async def scenario():
+        await get_llm_response(_history("done"), cacheable=True, namespace=NAMESPACE)
+        await get_llm_response(_history("done"), cacheable=True, namespace=NAMESPACE)
+
+    asyncio.run(scenario())
+    assert fake_llm.calls == 2
+
+
+def test_sqlite_tier_survives_a_new_process(app_module):
+    async def scenario():
+        await LLMResponseCache(use_sqlite=True).set("sqlite-key", NAMESPACE, {"reply": "kept"})
+        # A fresh instance has an empty memory tier, like another worker
+        return await LLMResponseCache(use_sqlite=True).get("sqlite-key")
+
+    assert run_sync(scenario()) == {"reply": "kept"}
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import httpx
+import pytest
+from dinechain_api.services import llm_router as router_module
+from dinechain_api.services.llm_router import LLMBackend, LLMRouter, LLMUnavailableError
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, endpoint, model):
+        self.endpoint = endpoint
+        self.model = model
+
+    async def __aiter__(self):
+        chunk = {"choices": [{"delta": {"content": f"hi from {self.model}"}}]}
+        yield f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+
+    async def aclose(self):
+        self.endpoint.closed.append(self.model)
+
+
+class FakeEndpoint:
+    """An OpenAI-compatible chat-completions endpoint with per-model latency and status."""
+
+    def __init__(self):
+        self.delays = {}
+        self.statuses = {}
+        self.gates = {}
+        self.requests = []
+        self.opened = []
+        self.closed = []
+
+    async def handle(self, request):
+        model = json.loads(request.content)["model"]
+        self.requests.append(model)
+        if model in self.gates:
+            await self.gates[model].wait()
+        await asyncio.sleep(self.delays.get(model, 0))
+        status = self.statuses.get(model, 200)
+        if status != 200:
+            return httpx.Response(status, json={"error": f"{model} says {status}"})
+        self.opened.append(model)
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, stream=_TrackedStream(self, model))
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+
+
+def _backends(*models):
+    return [LLMBackend(model, "https://llm.test/v1", "key", model) for model in models]
+
+
+def _open_stream(client):
+    # The same shape as stream_llm_response's attempt
+    async def open_stream(backend, timeout):
+        request = client.build_request("POST", backend.url, headers=backend.headers, json={"model": backend.model})
+        response = await client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+        return response
+    return open_stream
+
+
+async def _read(response):
+    text = await response.aread()
+    await response.aclose()
+    return text.decode()
+
+
+@pytest.fixture(autouse=True)
+def _fast_router(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_MAX_RETRIES", 1)
+    monkeypatch.setattr(router_module, "LLM_RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(router_module, "LLM_HEDGE_MIN_DELAY", 0.02)
+
+
+def test_default_chain_keeps_primary_first_even_when_a_fallback_is_faster(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_ROUTER_EXPLORE_RATE", 1.0)
+    primary, fallback = _backends("primary", "fallback")
+    for _ in range(10):
+        primary.record(3.0, ok=True)
+        fallback.record(0.1, ok=True)
+    router = LLMRouter([primary, fallback], hedge=False)
+
+    assert router.ranked() == [primary, fallback]
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        async with endpoint.client() as client:
+            await _read(await router.call(_open_stream(client)))
+        return endpoint.requests
+
+    assert asyncio.run(scenario()) == ["primary"]
+
+
+def test_provider_routing_prefers_the_faster_backend(monkeypatch):
+    monkeypatch.setattr(router_module, "LLM_ROUTER_EXPLORE_RATE", 0.0)
+    slow, fast = _backends("slow", "fast")
+    router = LLMRouter([slow, fast], adaptive=True, hedge=False)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        endpoint.delays = {"slow": 0.05, "fast": 0.0}
+        async with endpoint.client() as client:
+            # With no samples yet registry order decides
+            await _read(await router.call(_open_stream(client)))
+            fast.record(0.001, ok=True)
+            endpoint.requests.clear()
+            text = await _read(await router.call(_open_stream(client)))
+        return endpoint.requests, text
+
+    requests, text = asyncio.run(scenario())
+    assert requests == ["fast"]
+    assert "hi from fast" in text
+
+
+def test_failover_to_the_next_backend_after_retries():
+    primary, fallback = _backends("primary", "fallback")
+    router = LLMRouter([primary, fallback], hedge=False)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        endpoint.statuses = {"primary": 503}
+        async with endpoint.client() as client:
+            text = await _read(await router.call(_open_stream(client)))
+        return endpoint.requests, text
+
+    requests, text = asyncio.run(scenario())
+    # One attempt plus LLM_MAX_RETRIES on the primary, then the fallback
+    assert requests == ["primary", "primary", "fallback"]
+    assert "hi from fallback" in text
+    assert primary.breaker.failures == 2
+    assert primary.ewma_error_rate > 0
+
+
+def test_rejected_credentials_are_recorded_and_not_retried():
+    primary, fallback = _backends("primary", "fallback")
+    router = LLMRouter([primary, fallback], hedge=False)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        endpoint.statuses = {"primary": 401}
+        async with endpoint.client() as client:
+            await _read(await router.call(_open_stream(client)))
+        return endpoint.requests
+
+    assert asyncio.run(scenario()) == ["primary", "fallback"]
+    assert primary.breaker.failures == 1
+    assert primary.requests == 1
+
+
+def test_every_backend_failing_raises_unavailable():
+    primary, fallback = _backends("primary", "fallback")
+    router = LLMRouter([primary, fallback], hedge=False)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        endpoint.statuses = {"primary": 500, "fallback": 404}
+        async with endpoint.client() as client:
+            await router.call(_open_stream(client))
+
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(scenario())
+
+
+def test_hedge_answers_from_the_runner_up_and_closes_every_other_stream():
+    primary, secondary = _backends("primary", "secondary")
+    router = LLMRouter([primary, secondary], hedge=True)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        # The primary answers just as the hedge does, so both attempts may finish
+        endpoint.gates = {"primary": asyncio.Event()}
+
+        async def secondary_handler(request):
+            if json.loads(request.content)["model"] == "secondary":
+                endpoint.gates["primary"].set()
+            return await endpoint.handle(request)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(secondary_handler)) as client:
+            response = await router.call(_open_stream(client), release=lambda response: response.aclose())
+            text = await _read(response)
+            await asyncio.sleep(0.01)
+        return endpoint, text
+
+    endpoint, text = asyncio.run(scenario())
+    assert endpoint.requests == ["primary", "secondary"]
+    assert text
+    assert sorted(endpoint.closed) == sorted(endpoint.opened)
+    assert router.hedged_requests == 1
+
+
+def test_hedge_releases_a_loser_that_finished_too():
+    router = LLMRouter(_backends("primary", "secondary"), hedge=True)
+
+    async def scenario():
+        released = []
+
+        async def finished():
+            return "loser"
+
+        task = asyncio.create_task(finished())
+        await task
+
+        async def release(result):
+            released.append(result)
+
+        await router._discard([task], release)
+        return released
+
+    assert asyncio.run(scenario()) == ["loser"]
+
+
+def test_hedge_is_not_sent_when_the_primary_answers_in_time():
+    primary, secondary = _backends("primary", "secondary")
+    router = LLMRouter([primary, secondary], hedge=True)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        async with endpoint.client() as client:
+            await _read(await router.call(_open_stream(client), release=lambda response: response.aclose()))
+        return endpoint.requests
+
+    assert asyncio.run(scenario()) == ["primary"]
+    assert router.hedged_requests == 0
+
+
+@pytest.mark.parametrize("status", [400, 401, 404])
+def test_hedged_router_fails_over_when_the_primary_fails_fast(status):
+    primary, secondary = _backends("primary", "secondary")
+    router = LLMRouter([primary, secondary], hedge=True)
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        endpoint.statuses = {"primary": status}
+        async with endpoint.client() as client:
+            text = await _read(await router.call(_open_stream(client), release=lambda response: response.aclose()))
+        return endpoint.requests, text
+
+    requests, text = asyncio.run(scenario())
+    assert requests == ["primary", "secondary"]
+    assert "hi from secondary" in text
+
+
+def test_hedged_router_skips_an_open_primary_circuit():
+    primary, secondary = _backends("primary", "secondary")
+    router = LLMRouter([primary, secondary], hedge=True)
+    for _ in range(primary.breaker.failure_threshold):
+        primary.breaker.record_failure()
+
+    async def scenario():
+        endpoint = FakeEndpoint()
+        async with endpoint.client() as client:
+            text = await _read(await router.call(_open_stream(client), release=lambda response: response.aclose()))
+        return endpoint.requests, text
+
+    requests, text = asyncio.run(scenario())
+    assert requests == ["secondary"]
+    assert "hi from secondary" in text
+    assert router.hedged_requests == 0
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from dinechain_api.services.leases import acquire_lease, release_lease, renew_lease
+from dinechain_api.services.locks import ConversationLocks
+from dinechain_api.utils.event_loop import run_sync
+
+
+def test_one_chat_is_serialised_and_others_are_not():
+    events = []
+
+    async def turn(locks, chat_id, label):
+        async with locks.hold("telegram", chat_id):
+            events.append(f"{label} start")
+            await asyncio.sleep(0.01)
+            events.append(f"{label} end")
+
+    async def scenario():
+        locks = ConversationLocks(cross_process=False)
+        await asyncio.gather(turn(locks, "1", "a"), turn(locks, "1", "b"), turn(locks, "2", "c"))
+
+    asyncio.run(scenario())
+    assert events.index("a end") < events.index("b start")
+    assert events.index("c start") < events.index("a end")
+
+
+def test_idle_locks_are_evicted_but_held_ones_are_kept():
+    async def scenario():
+        locks = ConversationLocks(max_locks=10, cross_process=False)
+        async with locks.hold("telegram", "busy"):
+            for i in range(50):
+                async with locks.hold("telegram", str(i)):
+                    pass
+            assert ("telegram", "busy") in locks._entries
+        return len(locks)
+
+    assert asyncio.run(scenario()) <= 10
+
+
+def test_leases_exclude_other_owners_until_they_expire(app_module):
+    async def scenario():
+        name = "test:lease-owners"
+        assert await acquire_lease(name, 0.2, owner="worker-a")
+        assert not await acquire_lease(name, 0.2, owner="worker-b")
+        assert not await renew_lease(name, 0.2, owner="worker-b")
+        assert await renew_lease(name, 0.2, owner="worker-a")
+        await asyncio.sleep(0.25)
+        assert await acquire_lease(name, 0.2, owner="worker-b")
+        await release_lease(name, owner="worker-a")
+        # Releasing someone else's lease does nothing
+        assert not await acquire_lease(name, 0.2, owner="worker-a")
+        await release_lease(name, owner="worker-b")
+        assert await acquire_lease(name, 0.2, owner="worker-a")
+        await release_lease(name, owner="worker-a")
+
+    run_sync(scenario())
+
+
+def test_a_turn_waits_for_a_live_lease_holder_instead_of_giving_up(app_module):
+    ttl = 0.2
+    name = "conversation:telegram:lease-wait"
+
+    async def other_process_holds_it(seconds):
+        # Another worker keeps renewing its lease for a while, then exits without releasing it
+        assert await acquire_lease(name, ttl, owner="other-worker")
+        until = time.monotonic() + seconds
+        while time.monotonic() < until:
+            await asyncio.sleep(ttl / 3)
+            await renew_lease(name, ttl, owner="other-worker")
+
+    async def scenario():
+        locks = ConversationLocks(cross_process=True, lease_ttl=ttl)
+        holder = asyncio.create_task(other_process_holds_it(3 * ttl))
+        await asyncio.sleep(0.01)
+        started = time.monotonic()
+        async with locks.hold("telegram", "lease-wait"):
+            waited = time.monotonic() - started
+        await holder
+        return waited
+
+    # Longer than the old 2 * lease_ttl deadline, and the turn still ran
+    assert run_sync(scenario()) > 2 * ttl
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from dinechain_api.services.message_queue import MessageQueue
+from dinechain_api.utils.event_loop import run_sync
+
+
+def _chats_on_different_shards(queue):
+    first = ("telegram", "chat-0")
+    for i in range(1, 100):
+        other = ("telegram", f"chat-{i}")
+        if queue._shard_for(*other) != queue._shard_for(*first):
+            return first, other
+
+
+def test_each_chat_is_handled_in_arrival_order():
+    handled = {}
+
+    async def handler(platform, chat_id, text):
+        await asyncio.sleep(random.uniform(0, 0.005))
+        handled.setdefault(chat_id, []).append(text)
+
+    async def scenario():
+        queue = MessageQueue(handler, workers=4)
+        await queue.start()
+        for n in range(20):
+            for chat in ("a", "b", "c"):
+                assert queue.enqueue("telegram", chat, n)
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert handled == {chat: list(range(20)) for chat in ("a", "b", "c")}
+    assert stats["processed"] == 60
+
+
+def test_different_chats_run_in_parallel():
+    running = set()
+    overlapped = []
+
+    async def handler(platform, chat_id, text):
+        running.add(chat_id)
+        await asyncio.sleep(0.02)
+        overlapped.append(len(running))
+        running.discard(chat_id)
+
+    async def scenario():
+        queue = MessageQueue(handler, workers=4)
+        await queue.start()
+        first, other = _chats_on_different_shards(queue)
+        queue.enqueue(*first, "hi")
+        queue.enqueue(*other, "hi")
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert max(overlapped) == 2
+
+
+def test_a_full_queue_rejects_instead_of_growing():
+    async def handler(platform, chat_id, text):
+        await asyncio.sleep(1)
+
+    async def scenario():
+        queue = MessageQueue(handler, workers=1, shard_backlog=2, max_depth=100)
+        await queue.start()
+        accepted = [queue.enqueue("telegram", "a", n) for n in range(5)]
+        await queue.stop(drain_timeout=0)
+        return accepted, queue.stats()["rejected"]
+
+    accepted, rejected = asyncio.run(scenario())
+    assert accepted == [True, True, False, False, False]
+    assert rejected == 3
+
+
+def test_a_failing_message_does_not_stop_its_worker():
+    handled = []
+
+    async def handler(platform, chat_id, text):
+        if text == "boom":
+            raise ValueError("boom")
+        handled.append(text)
+
+    async def scenario():
+        queue = MessageQueue(handler, workers=1)
+        await queue.start()
+        for text in ("one", "boom", "two"):
+            queue.enqueue("telegram", "a", text)
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert handled == ["one", "two"]
+    assert (stats["processed"], stats["failed"]) == (2, 1)
+
+
+def test_webhook_acknowledges_before_the_message_is_processed(client, app_module, monkeypatch):
+    handled = []
+
+    async def slow_handler(platform, chat_id, *args):
+        await asyncio.sleep(0.3)
+        handled.append((platform, chat_id, args[0]))
+
+    monkeypatch.setattr(app_module.message_queue, "handler", slow_handler)
+    started = time.monotonic()
+    response = client.post("/webhook", json={"message": {"chat": {"id": 555}, "text": "hello", "from": {"first_name": "Ada"}}})
+    elapsed = time.monotonic() - started
+
+    assert response.status_code == 200
+    assert elapsed < 0.25
+    assert handled == []
+    run_sync(asyncio.sleep(0.5))
+    assert handled == [("telegram", "555", "hello")]
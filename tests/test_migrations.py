@@ -0,0 +1,156 @@
+import asyncio
+import aiosqlite
+from dinechain_api.services import migrations
+from dinechain_api.services.migrations import MIGRATIONS, get_schema_version, run_migrations
+
+LATEST = MIGRATIONS[-1][0]
+
+
+async def _connect(path):
+    conn = await aiosqlite.connect(path, timeout=10)
+    conn.row_factory = aiosqlite.Row
+    return conn
+
+
+async def _migrate(path, upto=None, monkeypatch=None):
+    """Runs the migrations on ``path``, optionally only those up to version ``upto``."""
+    if upto is not None:
+        monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in MIGRATIONS if m[0] <= upto])
+    conn = await _connect(path)
+    try:
+        return await run_migrations(conn)
+    finally:
+        await conn.close()
+        if upto is not None:
+            monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS)
+
+
+def test_fresh_database_migrates_to_the_latest_version_once(tmp_path):
+    path = str(tmp_path / "fresh.db")
+
+    async def scenario():
+        first = await _migrate(path)
+        second = await _migrate(path)
+        conn = await _connect(path)
+        versions = [row[0] for row in await (await conn.execute("SELECT version FROM schema_version ORDER BY version")).fetchall()]
+        await conn.close()
+        return first, second, versions
+
+    first, second, versions = asyncio.run(scenario())
+    assert first == second == LATEST
+    assert versions == [m[0] for m in MIGRATIONS]
+
+
+def test_concurrent_workers_apply_each_migration_once(tmp_path):
+    path = str(tmp_path / "race.db")
+
+    async def scenario():
+        results = await asyncio.gather(*(_migrate(path) for _ in range(3)))
+        conn = await _connect(path)
+        count = (await (await conn.execute("SELECT COUNT(*) FROM schema_version")).fetchone())[0]
+        await conn.close()
+        return results, count
+
+    results, count = asyncio.run(scenario())
+    assert results == [LATEST] * 3
+    assert count == len(MIGRATIONS)
+
+
+def test_unpaid_order_lookup_uses_its_index(tmp_path):
+    path = str(tmp_path / "plan.db")
+
+    async def scenario():
+        await _migrate(path)
+        conn = await _connect(path)
+        rows = await (await conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM orders WHERE chat_id = ? AND platform = ? AND paid = 0 AND expired_at IS NULL "
+            "ORDER BY timestamp DESC LIMIT 1",
+            ("1", "telegram")
+        )).fetchall()
+        await conn.close()
+        return " ".join(row["detail"] for row in rows)
+
+    plan = asyncio.run(scenario())
+    assert "idx_orders_unpaid_by_chat" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_existing_tables_are_upgraded_in_place(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+
+    async def scenario():
+        assert await _migrate(path, upto=1, monkeypatch=monkeypatch) == 1
+        conn = await _connect(path)
+        await conn.execute("INSERT INTO orders (chat_id, platform, total, paid) VALUES ('7', 'telegram', 500, 0)")
+        await conn.commit()
+        await conn.close()
+
+        version = await _migrate(path)
+        conn = await _connect(path)
+        schema_version = await get_schema_version(conn)
+        order = await (await conn.execute("SELECT chat_id, total FROM orders")).fetchone()
+        await conn.close()
+        return version, schema_version, tuple(order)
+
+    assert asyncio.run(scenario()) == (LATEST, LATEST, ("7", 500))
+
+
+def test_order_items_backfill_does_not_depend_on_the_live_menu(tmp_path, monkeypatch):
+    from dinechain_api.services import menu
+
+    def changed_parser(*args, **kwargs):
+        raise AssertionError("migration 13 must use its own copy of the parser")
+
+    monkeypatch.setattr(menu, "order_lines", changed_parser)
+    path = str(tmp_path / "backfill.db")
+    summary = '[{"name": "Jollof Rice", "price": 80, "quantity": 2}, {"name": "Chicken Shawarma", "price": 300}]'
+
+    async def scenario():
+        await _migrate(path, upto=12, monkeypatch=monkeypatch)
+        conn = await _connect(path)
+        await conn.execute("INSERT INTO orders (chat_id, platform, summary, total) VALUES ('8', 'telegram', ?, 460)", (summary,))
+        await conn.commit()
+        await conn.close()
+
+        await _migrate(path)
+        conn = await _connect(path)
+        rows = await (await conn.execute("SELECT menu_item_id, name, unit_price, quantity FROM order_items ORDER BY id")).fetchall()
+        await conn.close()
+        return [tuple(row) for row in rows]
+
+    assert asyncio.run(scenario()) == [
+        ("main-meal/jollof-rice", "Jollof Rice", 80, 2),
+        ("shawarma/chicken", "Chicken Shawarma", 300, 1),
+    ]
+
+
+def test_existing_crypto_orders_get_a_payment_window_start(tmp_path, monkeypatch):
+    path = str(tmp_path / "window.db")
+
+    async def scenario():
+        await _migrate(path, upto=16, monkeypatch=monkeypatch)
+        conn = await _connect(path)
+        await conn.execute(
+            "INSERT INTO orders (id, chat_id, platform, total, paid, payment_method, deposit_address, timestamp) "
+            "VALUES (1, '9', 'telegram', 100, 0, 'crypto', '0xrandom', '2026-01-01 10:00:00')"
+        )
+        await conn.execute(
+            "INSERT INTO orders (id, chat_id, platform, total, paid, payment_method, deposit_address, derivation_index, timestamp) "
+            "VALUES (2, '9', 'telegram', 100, 0, 'crypto', '0xpool', 0, '2026-01-01 10:00:00')"
+        )
+        await conn.execute(
+            "INSERT INTO deposit_addresses (wallet, derivation_index, address, order_id, claimed_at) "
+            "VALUES ('fp', 0, '0xpool', 2, '2026-01-03 09:00:00')"
+        )
+        await conn.execute("INSERT INTO orders (id, chat_id, platform, total, paid) VALUES (3, '9', 'telegram', 100, 0)")
+        await conn.commit()
+        await conn.close()
+
+        await _migrate(path)
+        conn = await _connect(path)
+        rows = await (await conn.execute("SELECT id, crypto_requested_at FROM orders ORDER BY id")).fetchall()
+        await conn.close()
+        return [tuple(row) for row in rows]
+
+    # The pool's claim time where there is one, else when the order was placed
+    assert asyncio.run(scenario()) == [(1, "2026-01-01 10:00:00"), (2, "2026-01-03 09:00:00"), (3, None)]
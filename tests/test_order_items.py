@@ -0,0 +1,82 @@
+import json
+from dinechain_api.blueprints.orders import get_order_items
+from dinechain_api.services.menu import order_lines
+from dinechain_api.services.outbox import format_kitchen_order
+from dinechain_api.utils.event_loop import run_sync
+
+ORDER_REPLY = """Your Order:
+- Jollof Rice x2
+- Coke
+```json
+{"items": [{"name": "Jollof Rice", "price": 80, "quantity": 2}, {"name": "Coke", "price": 60}, {"name": "Mystery Stew", "price": 500}], "total": 720, "delivery_info": "Table 4"}
+```"""
+
+
+def test_order_json_becomes_line_items():
+    lines = order_lines([
+        {"name": "Jollof Rice", "price": 80, "quantity": 2},
+        {"name": "Coke", "price": "60"},
+        {"name": "Mystery Stew", "price": 500, "quantity": 0},
+        {"name": "Broken", "price": "n/a"},
+        {"price": 100},
+        "Jollof Rice",
+    ])
+    assert lines == [
+        ("main-meal/jollof-rice", "Jollof Rice", 80, 2),
+        ("soda/coke", "Coke", 60, 1),
+        (None, "Mystery Stew", 500, 1),
+    ]
+
+
+def test_new_orders_are_stored_with_their_line_items(app_module, monkeypatch):
+    from dinechain_api.blueprints.orders import get_db_conn
+    replies = []
+
+    async def record(platform, chat_id, text, streaming_reply=None):
+        replies.append(text)
+
+    monkeypatch.setattr(app_module, "_reply", record)
+    run_sync(app_module.handle_order_creation("telegram", "items-1", "Ada", ORDER_REPLY))
+
+    async def load():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute("SELECT * FROM orders WHERE chat_id = 'items-1'")
+            order = await cursor.fetchone()
+            return order, await get_order_items(conn, order["id"])
+
+    order, items = run_sync(load())
+    assert order["total"] == 720 and order["delivery"] == "Table 4"
+    assert items == [
+        {"menu_item_id": "main-meal/jollof-rice", "name": "Jollof Rice", "price": 80, "quantity": 2},
+        {"menu_item_id": "soda/coke", "name": "Coke", "price": 60, "quantity": 1},
+        {"menu_item_id": None, "name": "Mystery Stew", "price": 500, "quantity": 1},
+    ]
+    # The summary JSON is still written for existing readers
+    assert json.loads(order["summary"])[0]["name"] == "Jollof Rice"
+    assert replies[0].endswith("How would you like to pay? (Card / Crypto)")
+    assert "```json" not in replies[0]
+
+
+def test_kitchen_ticket_is_formatted_from_line_items():
+    items = [{"name": "Jollof Rice", "price": 80, "quantity": 2}, {"name": "Coke", "price": 60, "quantity": 1}]
+    ticket = format_kitchen_order("items-1", "Ada", items, 220, "Table 4", "telegram")
+    assert ticket == (
+        "🍽️ New Order for Ada (items-1) on telegram:\n"
+        "- Jollof Rice x2: $1.60\n"
+        "- Coke: $0.60\n"
+        "Total: $2.20\n"
+        "Delivery: Table 4"
+    )
+
+
+def test_a_per_item_lookup_uses_the_index(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def plan():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute(
+                "EXPLAIN QUERY PLAN SELECT order_id, quantity FROM order_items WHERE menu_item_id = ?", ("main-meal/jollof-rice",)
+            )
+            return " ".join(row["detail"] for row in await cursor.fetchall())
+
+    assert "USING INDEX idx_order_items_menu_item_id" in run_sync(plan())
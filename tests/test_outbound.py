@@ -0,0 +1,192 @@
+import asyncio
+import math
+import time
+import httpx
+import pytest
+from dinechain_api.services import outbound, outbox
+from dinechain_api.services.outbound import PRIORITY_CHAT, PRIORITY_PAYMENT, OutboundScheduler, PriorityBucket, TokenBucket
+from dinechain_api.services.outbox import KITCHEN_DIGEST_HEADER, OutboxDispatcher, enqueue_message, mark_order_paid
+from dinechain_api.utils.event_loop import run_sync
+
+KITCHEN = "-100555"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _throttled(retry_after):
+    request = httpx.Request("POST", "https://api.telegram.org/sendMessage")
+    response = httpx.Response(429, json={"ok": False, "parameters": {"retry_after": retry_after}}, request=request)
+    return httpx.HTTPStatusError("429", request=request, response=response)
+
+
+def test_token_bucket_allows_a_burst_then_paces(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbound.time, "monotonic", clock)
+    bucket = TokenBucket(rate=2, burst=3)
+
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take() == 0
+    clock.now += 10
+    assert bucket.idle()
+
+
+def test_a_paused_bucket_holds_every_token(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(outbound.time, "monotonic", clock)
+    bucket = TokenBucket(rate=100, burst=5)
+
+    bucket.pause(4)
+    assert bucket.take() == pytest.approx(4)
+    assert not bucket.idle()
+    clock.now += 4
+    assert bucket.take() == 0
+
+
+def test_payment_messages_overtake_waiting_chat_replies():
+    order = []
+
+    async def scenario():
+        bucket = PriorityBucket(rate=50, burst=1)
+
+        async def acquire(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(acquire(f"chat-{n}", PRIORITY_CHAT)) for n in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(acquire(f"paid-{n}", PRIORITY_PAYMENT)) for n in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    # The first chat reply had the only token; everyone else queued
+    assert order == ["chat-0", "paid-0", "paid-1", "chat-1", "chat-2", "chat-3"]
+
+
+def test_one_chat_is_paced_and_kept_in_order():
+    sent = []
+
+    async def send(platform, chat_id, text):
+        sent.append((time.monotonic(), text))
+
+    async def scenario():
+        scheduler = OutboundScheduler(send, {"telegram": {"global": (1000, 1000), "chat": (20, 1)}})
+        await asyncio.gather(*(scheduler.send("telegram", "42", f"message {n}") for n in range(4)))
+
+    asyncio.run(scenario())
+    assert [text for _, text in sent] == [f"message {n}" for n in range(4)]
+    gaps = [later - earlier for (earlier, _), (later, _) in zip(sent, sent[1:])]
+    assert all(gap >= 0.04 for gap in gaps)
+
+
+def test_group_chats_get_the_group_limit():
+    scheduler = OutboundScheduler(None, {"telegram": {"global": (30, 30), "chat": (1, 3), "group": (0.25, 2)}})
+    assert scheduler._destination("telegram", KITCHEN).bucket.rate == 0.25
+    assert scheduler._destination("telegram", "42").bucket.rate == 1
+
+
+def test_a_short_429_is_waited_out_and_retried():
+    attempts = []
+
+    async def send(platform, chat_id, text):
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _throttled(0.1)
+        return "ok"
+
+    async def scenario():
+        scheduler = OutboundScheduler(send, {"telegram": {"global": (1000, 1000), "chat": (1000, 10)}})
+        return await scheduler.send("telegram", "42", "hi"), scheduler.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "ok"
+    assert attempts[1] - attempts[0] >= 0.1
+    assert (stats["throttled"], stats["retried"], stats["sent"]) == (1, 1, 1)
+
+
+def test_a_long_429_is_handed_back_to_the_caller(monkeypatch):
+    monkeypatch.setattr(outbound, "OUTBOUND_MAX_RETRY_WAIT", 10)
+    calls = []
+
+    async def send(platform, chat_id, text):
+        calls.append(text)
+        raise _throttled(60)
+
+    async def scenario():
+        scheduler = OutboundScheduler(send, {"telegram": {"global": (1000, 1000), "chat": (1000, 10)}})
+        assert await scheduler.send("telegram", "42", "hi") is None
+        with pytest.raises(httpx.HTTPStatusError):
+            await scheduler.send("telegram", "43", "hi", raise_errors=True)
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert stats["failed"] == 2 and stats["retried"] == 0
+
+
+@pytest.fixture
+def kitchen_digest(app_module, monkeypatch):
+    monkeypatch.setattr(outbox, "KITCHEN_CHAT_ID", KITCHEN)
+    monkeypatch.setattr(outbox, "KITCHEN_DIGEST_WINDOW", 60.0)
+    run_sync(app_module.outbox_dispatcher.stop())
+    yield
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def drop_tickets():
+        # Held tickets would otherwise fall due later in the session
+        async with get_db_conn() as conn:
+            await conn.execute("DELETE FROM outbox WHERE chat_id = ?", (KITCHEN,))
+            await conn.commit()
+
+    run_sync(drop_tickets())
+    run_sync(app_module.outbox_dispatcher.start())
+
+
+def test_kitchen_tickets_are_held_to_the_end_of_the_digest_window(kitchen_digest):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def pay():
+        async with get_db_conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, delivery) "
+                "VALUES ('telegram', 'digest-customer', 'Digest Tester', '[]', 100, 0, 'Table 2')"
+            )
+            order_id = cursor.lastrowid
+            await mark_order_paid(conn, order_id)
+            await conn.commit()
+            cursor = await conn.execute("SELECT chat_id, next_attempt_at, created_at FROM outbox WHERE order_id = ?", (order_id,))
+            return {row["chat_id"]: row for row in await cursor.fetchall()}
+
+    rows = run_sync(pay())
+    kitchen, customer = rows[KITCHEN], rows["digest-customer"]
+    assert kitchen["next_attempt_at"] == math.ceil(kitchen["created_at"] / 60) * 60
+    # The customer's receipt is not held back
+    assert customer["next_attempt_at"] == customer["created_at"]
+
+
+def test_due_kitchen_tickets_go_out_as_one_digest(kitchen_digest):
+    from dinechain_api.blueprints.orders import get_db_conn
+    sent = []
+
+    async def send(platform, chat_id, text):
+        sent.append((chat_id, text))
+
+    async def scenario():
+        async with get_db_conn() as conn:
+            for n in range(3):
+                await enqueue_message(conn, f"digest-ticket-{n}", "telegram", KITCHEN, f"🍽️ New Order {n}")
+            await conn.commit()
+        await OutboxDispatcher(send).dispatch_once()
+
+    run_sync(scenario())
+    [digest] = [text for chat_id, text in sent if chat_id == KITCHEN]
+    assert digest.startswith(KITCHEN_DIGEST_HEADER.format(count=3))
+    assert [digest.index(f"New Order {n}") for n in range(3)] == sorted(digest.index(f"New Order {n}") for n in range(3))
@@ -0,0 +1,160 @@
+import asyncio
+import time
+import httpx
+import pytest
+from dinechain_api.services import outbox
+from dinechain_api.services.outbox import BATCH_SEPARATOR, OutboxDispatcher, enqueue_message, enqueue_order_paid, mark_order_paid
+from dinechain_api.utils.event_loop import run_sync
+
+
+@pytest.fixture
+def quiet_app_dispatcher(app_module, monkeypatch):
+    """Stops the app's own dispatcher so it can't deliver the rows under test."""
+    monkeypatch.setattr(outbox, "KITCHEN_CHAT_ID", "kitchen-1")
+    run_sync(app_module.outbox_dispatcher.stop())
+    yield
+    run_sync(app_module.outbox_dispatcher.start())
+
+
+class Recorder:
+    def __init__(self, fail_with=None):
+        self.sent = []
+        self.fail_with = fail_with
+
+    async def send(self, platform, chat_id, text):
+        if self.fail_with:
+            raise self.fail_with
+        self.sent.append((platform, chat_id, text))
+
+
+def _insert_order(chat_id):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, payment_method, delivery) "
+                "VALUES ('telegram', ?, 'Outbox Tester', '[]', 160, 0, 'card', 'pickup')",
+                (chat_id,)
+            )
+            await conn.execute(
+                "INSERT INTO order_items (order_id, menu_item_id, name, unit_price, quantity) VALUES (?, 1, 'Jollof Rice', 80, 2)",
+                (cursor.lastrowid,)
+            )
+            await conn.commit()
+            return cursor.lastrowid
+
+    return run_sync(insert())
+
+
+def _outbox_rows(where, params):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def load():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute(f"SELECT * FROM outbox WHERE {where} ORDER BY id", params)
+            return [dict(row) for row in await cursor.fetchall()]
+
+    return run_sync(load())
+
+
+def _enqueue(key, chat_id, body):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            queued = await enqueue_message(conn, key, "telegram", chat_id, body)
+            await conn.commit()
+            return queued
+
+    return run_sync(insert())
+
+
+def test_paying_an_order_queues_each_notification_once(quiet_app_dispatcher):
+    from dinechain_api.blueprints.orders import get_db_conn
+    order_id = _insert_order("outbox-pay")
+
+    async def pay_twice():
+        async with get_db_conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            results = [await mark_order_paid(conn, order_id), await mark_order_paid(conn, order_id)]
+            cursor = await conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+            # A manual re-send (e.g. /notify_payment) hits the same idempotency keys
+            await enqueue_order_paid(conn, await cursor.fetchone())
+            await conn.commit()
+            return results
+
+    assert run_sync(pay_twice()) == [True, False]
+    rows = _outbox_rows("order_id = ?", (order_id,))
+    assert [row["idempotency_key"] for row in rows] == [f"order-paid:{order_id}:kitchen", f"order-paid:{order_id}:customer"]
+    assert "Jollof Rice x2: $1.60" in rows[1]["body"]
+
+
+def test_a_rolled_back_payment_leaves_no_notifications(quiet_app_dispatcher):
+    from dinechain_api.blueprints.orders import get_db_conn
+    order_id = _insert_order("outbox-rollback")
+
+    async def pay_then_fail():
+        async with get_db_conn() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            await mark_order_paid(conn, order_id)
+            await conn.rollback()
+            cursor = await conn.execute("SELECT paid FROM orders WHERE id = ?", (order_id,))
+            return (await cursor.fetchone())["paid"]
+
+    assert run_sync(pay_then_fail()) == 0
+    assert _outbox_rows("order_id = ?", (order_id,)) == []
+
+
+def test_messages_for_one_chat_are_batched_in_order(quiet_app_dispatcher, monkeypatch):
+    monkeypatch.setitem(outbox.MAX_MESSAGE_CHARS, "telegram", 60)
+    for n in range(4):
+        _enqueue(f"batch-{n}", "outbox-batch", f"message {n} " + "x" * 10)
+    recorder = Recorder()
+
+    run_sync(OutboxDispatcher(recorder.send).dispatch_once())
+
+    mine = [text for _, chat_id, text in recorder.sent if chat_id == "outbox-batch"]
+    # Two 21-char bodies plus the separator fit in 60 characters, three don't
+    assert mine == [BATCH_SEPARATOR.join([f"message {a} " + "x" * 10, f"message {b} " + "x" * 10]) for a, b in ((0, 1), (2, 3))]
+    assert {row["status"] for row in _outbox_rows("chat_id = 'outbox-batch'", ())} == {"sent"}
+
+
+def test_a_throttled_send_is_retried_after_the_servers_hint(quiet_app_dispatcher, monkeypatch):
+    _enqueue("retry-1", "outbox-retry", "hello")
+    request = httpx.Request("POST", "https://api.telegram.org/")
+    throttled = httpx.HTTPStatusError("429", request=request, response=httpx.Response(429, headers={"Retry-After": "30"}, request=request))
+    dispatcher = OutboxDispatcher(Recorder(fail_with=throttled).send)
+
+    before = time.time()
+    run_sync(dispatcher.dispatch_once())
+    [row] = _outbox_rows("idempotency_key = 'retry-1'", ())
+    assert row["status"] == "pending" and row["attempts"] == 1
+    assert before + 29 <= row["next_attempt_at"] <= time.time() + 31
+    assert row["last_error"].startswith("HTTPStatusError")
+
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def make_due():
+        async with get_db_conn() as conn:
+            await conn.execute("UPDATE outbox SET next_attempt_at = 0 WHERE idempotency_key = 'retry-1'")
+            await conn.commit()
+
+    run_sync(make_due())
+    run_sync(dispatcher.dispatch_once())
+    assert _outbox_rows("idempotency_key = 'retry-1'", ())[0]["status"] == "dead"
+    assert dispatcher.stats()["dead"] >= 1
+
+
+def test_concurrent_dispatchers_never_send_a_row_twice(quiet_app_dispatcher):
+    for n in range(10):
+        _enqueue(f"claim-{n}", f"outbox-claim-{n}", f"message {n}")
+    first, second = Recorder(), Recorder()
+
+    async def race():
+        await asyncio.gather(OutboxDispatcher(first.send).dispatch_once(), OutboxDispatcher(second.send).dispatch_once())
+
+    run_sync(race())
+    delivered = [text for _, chat_id, text in first.sent + second.sent if chat_id.startswith("outbox-claim-")]
+    assert sorted(delivered) == sorted(f"message {n}" for n in range(10))
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+import pytest
+from dinechain_api.services import payment_scanner
+from dinechain_api.services.payment_scanner import (
+    CHECKPOINT_NAME, TRANSFER_TOPIC, PaymentDetector, TransferLogScanner, get_checkpoint, mark_orders_paid,
+)
+from dinechain_api.utils.event_loop import run_sync
+
+DEPOSIT = "0x" + "a1" * 20
+OTHER_DEPOSIT = "0x" + "b2" * 20
+FALLBACK_DEPOSIT = "0x" + "d4" * 20
+
+
+def _transfer(block, recipient, usdc):
+    return {
+        "topics": [TRANSFER_TOPIC, "0x" + "00" * 32, "0x" + "00" * 12 + recipient[2:]],
+        "data": "0x" + int(usdc * 10**6).to_bytes(32, "big").hex(),
+        "blockNumber": block,
+        "transactionHash": "0x" + f"{block:064x}",
+    }
+
+
+class FakeChain:
+    """Serves ``eth_getLogs`` from a fixed list of Transfer logs and records the ranges asked for."""
+
+    def __init__(self, head, logs=()):
+        self.block_number = head
+        self.logs = list(logs)
+        self.requests = []
+
+    def get_logs(self, params):
+        self.requests.append(params)
+        return [log for log in self.logs if params["fromBlock"] <= log["blockNumber"] <= params["toBlock"]]
+
+
+@pytest.fixture
+def chain(app_module, monkeypatch):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def reset_checkpoint():
+        async with get_db_conn() as conn:
+            await conn.execute("DELETE FROM chain_checkpoints WHERE name = ?", (CHECKPOINT_NAME,))
+            await conn.commit()
+
+    run_sync(reset_checkpoint())
+    fake = FakeChain(head=10_000)
+    monkeypatch.setattr(payment_scanner, "w3", SimpleNamespace(eth=fake))
+    return fake
+
+
+def _insert_crypto_order(chat_id, address, total_cents):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, payment_method, deposit_address, crypto_requested_at) "
+                "VALUES ('telegram', ?, 'Scan Tester', '[]', ?, 0, 'crypto', ?, CURRENT_TIMESTAMP)",
+                (chat_id, total_cents, address)
+            )
+            await conn.commit()
+            return cursor.lastrowid
+
+    return run_sync(insert())
+
+
+def _is_paid(order_id):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def load():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute("SELECT paid FROM orders WHERE id = ?", (order_id,))
+            return (await cursor.fetchone())["paid"]
+
+    return bool(run_sync(load()))
+
+
+def _scan(scanner, pending):
+    async def load_pending():
+        return pending
+
+    async def collect():
+        return [batch async for batch in scanner.scan(load_pending)]
+
+    return run_sync(collect())
+
+
+def test_one_scan_covers_every_pending_address_in_block_ranges(chain, monkeypatch):
+    monkeypatch.setattr(payment_scanner, "PAYMENT_SCAN_START_LOOKBACK", 2500)
+    chain.logs = [_transfer(8_000, DEPOSIT, 25.5), _transfer(9_500, OTHER_DEPOSIT, 3.0)]
+    pending = {
+        DEPOSIT: payment_scanner.PendingOrder(1, 25.5, 0),
+        OTHER_DEPOSIT: payment_scanner.PendingOrder(2, 4.0, 0),
+    }
+
+    batches = _scan(TransferLogScanner(block_range=1_000, confirmations=1), pending)
+
+    # 7499..9999 in three ranges; the underpaid order is not matched
+    assert [(r["fromBlock"], r["toBlock"]) for r in chain.requests] == [(7_499, 8_498), (8_499, 9_498), (9_499, 9_999)]
+    assert batches == [([1], 8_498), ([], 9_498), ([], 9_999)]
+    assert chain.requests[0]["topics"][2] == ["0x" + "00" * 12 + DEPOSIT[2:], "0x" + "00" * 12 + OTHER_DEPOSIT[2:]]
+
+
+def test_no_pending_orders_skips_ahead_without_fetching_logs(chain):
+    assert _scan(TransferLogScanner(confirmations=1), {}) == [([], 9_999)]
+    assert chain.requests == []
+
+
+def test_detection_resumes_from_the_checkpoint_and_pays_once(chain):
+    order_id = _insert_crypto_order("scan-1", DEPOSIT, 2550)
+    chain.logs = [_transfer(9_990, DEPOSIT, 25.5)]
+    detector = PaymentDetector(primary="logs", fallback=None)
+
+    assert order_id in run_sync(detector.poll())
+    assert _is_paid(order_id)
+    assert run_sync(get_checkpoint()) == 9_999
+
+    chain.requests.clear()
+    chain.block_number = 10_005
+    assert run_sync(detector.poll()) == []
+    # Only the new blocks are scanned (if anything else is still pending)
+    assert all(r["fromBlock"] >= 10_000 for r in chain.requests)
+    assert run_sync(get_checkpoint()) == 10_004
+
+
+def test_a_replayed_payment_is_only_marked_once(app_module):
+    order_id = _insert_crypto_order("scan-replay", "0x" + "c3" * 20, 100)
+    assert run_sync(mark_orders_paid([order_id])) == [order_id]
+    assert run_sync(mark_orders_paid([order_id])) == []
+
+
+def test_failed_primary_scan_falls_back_for_the_cycle(chain, monkeypatch):
+    class BrokenScanner:
+        name = "logs"
+
+        async def scan(self, load_pending):
+            raise ConnectionError("rpc down")
+            yield
+
+    class FoundScanner:
+        name = "snowtrace"
+
+        async def scan(self, load_pending):
+            pending = await load_pending()
+            yield [pending[FALLBACK_DEPOSIT].id], None
+
+    order_id = _insert_crypto_order("scan-fallback", FALLBACK_DEPOSIT, 100)
+    monkeypatch.setitem(payment_scanner.PAYMENT_SCANNERS, "logs", BrokenScanner)
+    monkeypatch.setitem(payment_scanner.PAYMENT_SCANNERS, "snowtrace", FoundScanner)
+    detector = PaymentDetector(primary="logs", fallback="snowtrace")
+
+    assert run_sync(detector.poll()) == [order_id]
+    assert detector.stats()["fallback_cycles"] == 1
@@ -0,0 +1,188 @@
+import asyncio
+from dinechain_api.services import payment_scanner
+from dinechain_api.services.payment_scanner import (
+    PendingOrder, SnowtraceScanner, expire_stale_orders, load_pending_crypto_orders, poll_interval,
+)
+from dinechain_api.services.payment_watcher import PAYMENT_POLL_IDLE_INTERVAL, PaymentWatcher
+from dinechain_api.utils.event_loop import run_sync
+
+
+def _insert_crypto_order(chat_id, address, age="-0 seconds"):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, payment_method, deposit_address, timestamp, crypto_requested_at) "
+                "VALUES ('telegram', ?, 'Watch Tester', '[]', 100, 0, 'crypto', ?, datetime('now', ?), datetime('now', ?))",
+                (chat_id, address, age, age)
+            )
+            await conn.commit()
+            return cursor.lastrowid
+
+    return run_sync(insert())
+
+
+def _order(order_id):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def load():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute("SELECT paid, expired_at FROM orders WHERE id = ?", (order_id,))
+            return dict(await cursor.fetchone())
+
+    return run_sync(load())
+
+
+def test_poll_interval_backs_off_with_order_age(monkeypatch):
+    monkeypatch.setattr(payment_scanner, "PAYMENT_POLL_MIN_INTERVAL", 10)
+    monkeypatch.setattr(payment_scanner, "PAYMENT_POLL_MAX_INTERVAL", 300)
+    monkeypatch.setattr(payment_scanner, "PAYMENT_POLL_BACKOFF_AFTER", 300)
+    assert [poll_interval(age) for age in (0, 299, 300, 900, 3600, 86400 * 30)] == [10, 10, 20, 80, 300, 300]
+
+
+def test_abandoned_orders_expire_and_leave_the_working_set(app_module):
+    stale = _insert_crypto_order("watch-stale", "0x" + "e5" * 20, "-2 days")
+    fresh = _insert_crypto_order("watch-fresh", "0x" + "f6" * 20, "-1 hours")
+
+    assert run_sync(expire_stale_orders(max_age=0)) == []
+    expired = run_sync(expire_stale_orders(max_age=86400))
+    pending = {order.id for order in run_sync(load_pending_crypto_orders()).values()}
+
+    assert stale in expired and fresh not in expired
+    assert stale not in pending and fresh in pending
+    assert run_sync(expire_stale_orders(max_age=86400)) == []
+
+
+def test_an_old_order_that_switches_to_crypto_gets_a_full_window(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def place_and_pay_late():
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, timestamp) "
+                "VALUES ('telegram', 'watch-late', 'Watch Tester', '[]', 100, 0, datetime('now', '-25 hours'))"
+            )
+            order_id = cursor.lastrowid
+            await conn.commit()
+            cursor = await conn.execute("SELECT * FROM orders WHERE id = ?", (order_id,))
+            order = await cursor.fetchone()
+        address = await app_module._assign_deposit_address(order)
+        return order_id, address.lower()
+
+    order_id, address = run_sync(place_and_pay_late())
+    expired = run_sync(expire_stale_orders(max_age=86400))
+    pending = run_sync(load_pending_crypto_orders())
+
+    assert order_id not in expired
+    assert pending[address].id == order_id
+    # Polled as a fresh order, not a day-old one
+    assert poll_interval(pending[address].age) == payment_scanner.PAYMENT_POLL_MIN_INTERVAL
+
+
+def test_snowtrace_checks_are_concurrent_bounded_and_scheduled_by_age():
+    pending = {f"0x{n:040x}": PendingOrder(n, 1.0, age) for n, age in enumerate([0, 0, 0, 0, 0, 0, 3600, 3600])}
+    scanner = SnowtraceScanner(concurrency=3)
+    running, peak, checked = 0, 0, []
+
+    async def is_paid(session, address, expected_amount):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        checked.append(address)
+        return address == "0x" + "0" * 39 + "1"
+
+    async def load_pending():
+        return pending
+
+    async def scenario():
+        scanner._is_paid = is_paid
+        first = [batch async for batch in scanner.scan(load_pending)]
+        checked.clear()
+        # Fresh orders are due again after the minimum interval, old ones much later
+        for order in pending.values():
+            scanner.next_check[order.id] -= payment_scanner.PAYMENT_POLL_MIN_INTERVAL
+        second = [batch async for batch in scanner.scan(load_pending)]
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == [([1], None)]
+    assert peak == 3
+    assert len(checked) == 6 and second == [([1], None)]
+
+
+class FakeDetector:
+    def __init__(self, paid, pending):
+        self.paid = paid
+        self.pending = pending
+        self.primary = payment_scanner.TransferLogScanner()
+
+    async def poll(self):
+        return self.paid
+
+    def stats(self):
+        return {"pending_orders": len(self.pending)}
+
+
+def test_a_cycle_reports_payments_and_follows_the_freshest_order(app_module):
+    notified = []
+
+    async def on_paid(order_id):
+        notified.append(order_id)
+
+    detector = FakeDetector([7, 8], {"0xa": PendingOrder(1, 1.0, 3600), "0xb": PendingOrder(2, 1.0, 5)})
+    watcher = PaymentWatcher(on_paid=on_paid, detector=detector)
+    run_sync(watcher.run_once())
+
+    assert notified == [7, 8]
+    assert watcher.stats()["paid"] == 2 and watcher.cycles == 1
+    assert watcher.next_interval() == poll_interval(5)
+
+    detector.pending = {}
+    assert watcher.next_interval() == PAYMENT_POLL_IDLE_INTERVAL
+
+
+def test_a_payment_in_the_last_interval_is_found_before_the_order_expires(app_module):
+    address = "0x" + "a7" * 20
+    order_id = _insert_crypto_order("watch-last-minute", address, "-2 days")
+
+    class ChainDetector(FakeDetector):
+        """Finds the transfer to ``address`` if the order is still pending when scanned."""
+
+        async def poll(self):
+            self.pending = await load_pending_crypto_orders()
+            if address in self.pending:
+                return await payment_scanner.mark_orders_paid([self.pending[address].id])
+            return []
+
+    watcher = PaymentWatcher(detector=ChainDetector([], {}))
+    run_sync(watcher.run_once())
+
+    assert watcher.paid == 1
+    assert _order(order_id) == {"paid": 1, "expired_at": None}
+
+
+def test_a_failing_cycle_does_not_stop_the_watcher(app_module):
+    class FailingDetector(FakeDetector):
+        calls = 0
+
+        async def poll(self):
+            self.calls += 1
+            raise RuntimeError("rpc down")
+
+    watcher = PaymentWatcher(detector=FailingDetector([], {"0xa": PendingOrder(1, 1.0, 0)}))
+    watcher.lease_ttl = 3
+
+    async def scenario():
+        # Back-to-back cycles so the test doesn't wait out the real interval
+        watcher.next_interval = lambda: 0.01
+        task = asyncio.create_task(watcher.run())
+        await asyncio.sleep(0.2)
+        await watcher.stop()
+        await task
+
+    run_sync(scenario())
+    assert watcher.detector.calls > 1
+    assert not watcher.is_leader
@@ -0,0 +1,55 @@
+import asyncio
+from dinechain_api.services import prompts
+from dinechain_api.services.llm import LLMResponseCache, cache_key
+from dinechain_api.services.prompts import PromptTemplate, build_llm_messages, get_prompt_template, prompt_namespace
+from dinechain_api.utils.event_loop import run_sync
+
+
+def test_template_is_prepended_to_the_conversation():
+    history = [{"role": "user", "content": "hi"}]
+    messages = build_llm_messages("ordering", history)
+    template = get_prompt_template("ordering")
+    assert messages[:len(template.messages)] == list(template.messages)
+    assert messages[-1] == {"role": "user", "content": "hi"}
+    assert messages[0]["role"] == "system"
+
+
+def test_unknown_prompt_ids_fall_back_to_the_default():
+    assert get_prompt_template("retired-prompt") is get_prompt_template(prompts.DEFAULT_PROMPT_ID)
+
+
+def test_bumping_the_version_changes_the_cache_namespace_and_key(monkeypatch):
+    request = {"model": "m", "temperature": 0.7, "max_tokens": 400, "messages": build_llm_messages("ordering", [])}
+    before = prompt_namespace("ordering")
+    template = get_prompt_template("ordering")
+    monkeypatch.setitem(prompts._TEMPLATES, "ordering", PromptTemplate(template.id, template.version + 1, template.messages))
+    after = prompt_namespace("ordering")
+
+    assert before == f"ordering:v{template.version}"
+    assert after == f"ordering:v{template.version + 1}"
+    assert cache_key(request, before) != cache_key(request, after)
+
+
+def test_invalidate_drops_replies_from_other_template_versions():
+    async def scenario():
+        cache = LLMResponseCache(use_sqlite=False)
+        await cache.set("old", "ordering:v1", {"reply": "stale"})
+        await cache.set("new", "ordering:v2", {"reply": "fresh"})
+        await cache.invalidate(keep_namespaces=["ordering:v2"])
+        return await cache.get("old"), await cache.get("new")
+
+    assert asyncio.run(scenario()) == (None, {"reply": "fresh"})
+
+
+def test_conversations_record_the_template_version(app_module):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def scenario():
+        async with get_db_conn() as conn:
+            await app_module.append_conversation_messages(
+                conn, "telegram", "prompt-version", [{"role": "user", "content": "hi"}], prompt_id="ordering"
+            )
+            cursor = await conn.execute("SELECT prompt_id, prompt_version FROM conversations WHERE chat_id = 'prompt-version'")
+            return tuple(await cursor.fetchone())
+
+    assert run_sync(scenario()) == ("ordering", get_prompt_template("ordering").version)
@@ -0,0 +1,103 @@
+import httpx
+import pytest
+from dinechain_api.services import resilience
+from dinechain_api.services.resilience import CircuitBreaker, backoff_delay, is_retryable, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", fake)
+    return fake
+
+
+def _status_error(status, headers=None, json=None):
+    request = httpx.Request("POST", "https://upstream.test/")
+    response = httpx.Response(status, headers=headers, json=json, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=3, recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through_and_closes_on_success(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.stats() == {"state": "closed", "consecutive_failures": 0}
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=5, recovery_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_abandoned_trial_is_given_up_on(clock):
+    breaker = CircuitBreaker("llm", failure_threshold=1, recovery_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+
+
+def test_backoff_is_jittered_and_capped():
+    for attempt in range(10):
+        delays = [backoff_delay(attempt, base=0.5, cap=8.0) for _ in range(50)]
+        assert all(0 <= delay <= min(8.0, 0.5 * 2 ** attempt) for delay in delays)
+    assert len({backoff_delay(3) for _ in range(20)}) > 1
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_throttling_and_upstream_failures_are_retryable(status):
+    assert is_retryable(_status_error(status))
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 422])
+def test_client_errors_are_not_retryable(status):
+    assert not is_retryable(_status_error(status))
+
+
+def test_transport_errors_are_retryable():
+    assert is_retryable(httpx.ReadTimeout("slow"))
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert not is_retryable(ValueError("bad json"))
+
+
+def test_retry_after_from_header_or_telegram_body():
+    assert retry_after_seconds(_status_error(429, headers={"Retry-After": "7"})) == 7.0
+    assert retry_after_seconds(_status_error(429, json={"ok": False, "parameters": {"retry_after": 5}})) == 5.0
+    assert retry_after_seconds(_status_error(429, json={"ok": False})) is None
+    assert retry_after_seconds(_status_error(503, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) is None
+    assert retry_after_seconds(httpx.ReadTimeout("slow")) is None
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import httpx
+import pytest
+from dinechain_api.services import llm, telegram
+from dinechain_api.services.llm import LLMResponseCache, get_llm_response, stream_llm_response
+from dinechain_api.services.telegram import TelegramStreamingReply, visible_reply_text
+
+NAMESPACE = "ordering:v1"
+REPLY = "Jollof Rice is a great choice! Anything else?"
+
+
+class _SSEStream(httpx.AsyncByteStream):
+    def __init__(self, chunks, closed):
+        self.chunks = chunks
+        self.closed = closed
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    async def aclose(self):
+        self.closed.append(True)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    state = {"calls": 0, "closed": []}
+
+    async def handle(request):
+        state["calls"] += 1
+        if json.loads(request.content).get("stream"):
+            chunks = [REPLY[i:i + 8] for i in range(0, len(REPLY), 8)]
+            return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, stream=_SSEStream(chunks, state["closed"]))
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": REPLY}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(llm, "get_http_client", lambda name: client)
+    monkeypatch.setattr(llm, "llm_cache", LLMResponseCache(use_sqlite=False))
+    return state
+
+
+@pytest.fixture
+def fake_telegram(monkeypatch):
+    calls = []
+
+    async def handle(request):
+        method = request.url.path.rsplit("/", 1)[-1]
+        calls.append((method, json.loads(request.content)))
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 99}})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(telegram, "get_http_client", lambda name: client)
+    return calls
+
+
+def _history():
+    return [{"role": "system", "content": "prompt"}, {"role": "user", "content": "jollof?"}]
+
+
+def test_deltas_arrive_in_order_and_fill_the_cache(fake_llm):
+    async def scenario():
+        deltas = [delta async for delta in stream_llm_response(_history(), cacheable=True, namespace=NAMESPACE)]
+        cached = await get_llm_response(_history(), cacheable=True, namespace=NAMESPACE)
+        return deltas, cached["choices"][0]["message"]["content"]
+
+    deltas, cached = asyncio.run(scenario())
+    assert len(deltas) > 1
+    assert "".join(deltas) == cached == REPLY
+    assert fake_llm["calls"] == 1
+
+
+def test_a_stream_abandoned_early_is_closed(fake_llm):
+    async def scenario():
+        stream = stream_llm_response(_history())
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(scenario()) == REPLY[:8]
+    assert fake_llm["closed"]
+
+
+def test_order_json_is_never_shown_while_streaming():
+    assert visible_reply_text('Your Order:\n- Jollof Rice\n```json\n{"items"') == "Your Order:\n- Jollof Rice"
+    assert visible_reply_text("Your Order:\n- Jollof Rice\n``") == "Your Order:\n- Jollof Rice"
+    assert visible_reply_text("Your Order:\n- Jollof Rice\n```js") == "Your Order:\n- Jollof Rice"
+
+
+def test_streaming_reply_sends_once_then_throttles_edits(fake_telegram):
+    async def scenario():
+        reply = TelegramStreamingReply("42", edit_interval=60, min_chars=10)
+        await reply.start()
+        await reply.update("Jollof")
+        await reply.update("Jollof Rice is")
+        await reply.update("Jollof Rice is a great")
+        await reply.finish(REPLY)
+
+    asyncio.run(scenario())
+    methods = [method for method, _ in fake_telegram]
+    # Too short to show, then one message; the next edit is throttled; finish always edits
+    assert methods == ["sendChatAction", "sendMessage", "editMessageText"]
+    assert fake_telegram[1][1]["text"] == "Jollof Rice is"
+    assert fake_telegram[2][1] == {"chat_id": "42", "message_id": 99, "text": REPLY}
+
+
+def test_a_short_reply_is_sent_whole_on_finish(fake_telegram):
+    async def scenario():
+        reply = TelegramStreamingReply("42", edit_interval=0, min_chars=100)
+        await reply.update("Hi!")
+        await reply.finish("Hi!")
+
+    asyncio.run(scenario())
+    assert [method for method, _ in fake_telegram] == ["sendMessage"]
+
+
+def test_a_burst_of_edits_is_paced_by_the_chats_bucket(fake_telegram):
+    from dinechain_api.services.outbound import OutboundScheduler
+
+    async def scenario():
+        outbound = OutboundScheduler(None, {"telegram": {"global": (1000, 1000), "chat": (10, 2)}})
+        reply = TelegramStreamingReply("42", edit_interval=0, min_chars=1, outbound=outbound)
+        for n in range(1, 21):
+            await reply.update(REPLY[:n * 2])
+        await reply.finish(REPLY)
+        return outbound.stats()
+
+    stats = asyncio.run(scenario())
+    methods = [method for method, _ in fake_telegram]
+    # The burst of two covers the first message and one edit; the rest are skipped, and finish waits its turn
+    assert methods == ["sendMessage", "editMessageText", "editMessageText"]
+    assert fake_telegram[-1][1]["text"] == REPLY
+    assert stats["sent"] == 3 and stats["wait_seconds"] > 0
+
+
+def test_a_throttled_edit_pauses_the_chat_and_the_final_edit_is_retried(monkeypatch):
+    from dinechain_api.services.outbound import OutboundScheduler
+    calls = []
+
+    async def handle(request):
+        method = request.url.path.rsplit("/", 1)[-1]
+        calls.append(method)
+        if method == "editMessageText" and calls.count("editMessageText") == 1:
+            return httpx.Response(429, json={"ok": False, "parameters": {"retry_after": 0.2}})
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 7}})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(telegram, "get_http_client", lambda name: client)
+
+    async def scenario():
+        outbound = OutboundScheduler(None, {"telegram": {"global": (1000, 1000), "chat": (1000, 10)}})
+        reply = TelegramStreamingReply("42", edit_interval=0, min_chars=1, outbound=outbound)
+        await reply.update("Jollof")
+        await reply.finish(REPLY)
+        return outbound.stats()
+
+    stats = asyncio.run(scenario())
+    assert calls == ["sendMessage", "editMessageText", "editMessageText"]
+    assert (stats["throttled"], stats["retried"]) == (1, 1)
@@ -0,0 +1,147 @@
+import hashlib
+import hmac
+import json
+import time
+import pytest
+from dinechain_api.services import stripe_events
+from dinechain_api.services.stripe_events import StripeEventProcessor
+from dinechain_api.utils.event_loop import run_sync
+
+WEBHOOK_SECRET = "whsec_test_secret"
+
+
+@pytest.fixture
+def processor(app_module, monkeypatch):
+    """A processor of our own; the app's is stopped so it can't apply the events under test."""
+    monkeypatch.setattr(app_module, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    run_sync(app_module.stripe_events.stop())
+    yield StripeEventProcessor()
+    run_sync(app_module.stripe_events.start())
+
+
+def _event(event_id, event_type, order_id, **obj):
+    return {"id": event_id, "object": "event", "type": event_type, "data": {"object": {"metadata": {"order_id": str(order_id)}, **obj}}}
+
+
+def _signed_post(client, event, secret=WEBHOOK_SECRET):
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return client.post("/stripe-webhook", data=payload, headers={"Stripe-Signature": f"t={timestamp},v1={signature}"})
+
+
+def _drain(processor):
+    async def run():
+        for row in await processor._claim():
+            await processor._process(row)
+
+    run_sync(run())
+
+
+def _insert_order(chat_id, reference=None):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def insert():
+        async with get_db_conn() as conn:
+            cursor = await conn.execute(
+                "INSERT INTO orders (platform, chat_id, customer_name, summary, total, paid, payment_method, reference) "
+                "VALUES ('telegram', ?, 'Stripe Tester', '[]', 500, 0, 'card', ?)",
+                (chat_id, reference)
+            )
+            await conn.commit()
+            return cursor.lastrowid
+
+    return run_sync(insert())
+
+
+def _query(sql, params):
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def load():
+        async with get_db_conn(readonly=True) as conn:
+            cursor = await conn.execute(sql, params)
+            return [dict(row) for row in await cursor.fetchall()]
+
+    return run_sync(load())
+
+
+def test_webhook_acknowledges_once_and_drops_redeliveries(processor, client):
+    order_id = _insert_order("stripe-dup")
+    event = _event("evt_dup", "checkout.session.completed", order_id, payment_status="paid")
+
+    first = _signed_post(client, event)
+    again = _signed_post(client, event)
+
+    assert (first.status_code, first.get_data(as_text=True)) == (200, "Webhook received")
+    assert (again.status_code, again.get_data(as_text=True)) == (200, "Duplicate event")
+    assert len(_query("SELECT id FROM stripe_events WHERE id = 'evt_dup'", ())) == 1
+
+
+def test_webhook_rejects_bad_signatures_and_ignores_other_events(processor, client):
+    forged = _signed_post(client, _event("evt_forged", "checkout.session.completed", 1), secret="whsec_wrong")
+    ignored = _signed_post(client, _event("evt_other", "customer.created", 1))
+
+    assert forged.status_code == 400
+    assert (ignored.status_code, ignored.get_data(as_text=True)) == (200, "Event ignored")
+    assert _query("SELECT id FROM stripe_events WHERE id IN ('evt_forged', 'evt_other')", ()) == []
+
+
+def test_duplicate_payment_events_notify_once(processor):
+    order_id = _insert_order("stripe-paid")
+    for event_id, event_type in (("evt_paid_1", "checkout.session.completed"), ("evt_paid_2", "checkout.session.async_payment_succeeded")):
+        run_sync(processor.record(event_id, event_type, json.dumps(_event(event_id, event_type, order_id, payment_status="paid"))))
+
+    _drain(processor)
+
+    assert _query("SELECT paid FROM orders WHERE id = ?", (order_id,)) == [{"paid": 1}]
+    assert _query("SELECT status FROM stripe_events WHERE id IN ('evt_paid_1', 'evt_paid_2')", ()) == [{"status": "processed"}] * 2
+    receipts = _query("SELECT idempotency_key FROM outbox WHERE order_id = ? AND chat_id = 'stripe-paid'", (order_id,))
+    assert [row["idempotency_key"] for row in receipts] == [f"order-paid:{order_id}:customer"]
+
+
+def test_delayed_payments_wait_for_the_async_success_event(processor):
+    order_id = _insert_order("stripe-delayed")
+    run_sync(processor.record("evt_delayed", "checkout.session.completed", json.dumps(
+        _event("evt_delayed", "checkout.session.completed", order_id, payment_status="unpaid")
+    )))
+
+    _drain(processor)
+
+    assert _query("SELECT paid FROM orders WHERE id = ?", (order_id,)) == [{"paid": 0}]
+
+
+def test_only_the_current_session_expiring_frees_the_order(processor):
+    order_id = _insert_order("stripe-expired", reference="cs_new")
+    for event_id, session_id in (("evt_exp_old", "cs_old"), ("evt_exp_new", "cs_new")):
+        run_sync(processor.record(event_id, "checkout.session.expired", json.dumps(
+            _event(event_id, "checkout.session.expired", order_id, id=session_id)
+        )))
+
+    _drain(processor)
+
+    assert _query("SELECT payment_method, reference FROM orders WHERE id = ?", (order_id,)) == [{"payment_method": None, "reference": None}]
+    messages = _query("SELECT idempotency_key, body FROM outbox WHERE order_id = ?", (order_id,))
+    assert [row["idempotency_key"] for row in messages] == ["stripe-event:evt_exp_new"]
+    assert "expired" in messages[0]["body"]
+
+
+def test_a_failing_event_is_retried_then_given_up(processor, monkeypatch):
+    monkeypatch.setattr(stripe_events, "STRIPE_EVENT_MAX_ATTEMPTS", 2)
+    run_sync(processor.record("evt_broken", "checkout.session.completed", "not json"))
+
+    _drain(processor)
+    [row] = _query("SELECT status, attempts, next_attempt_at, last_error FROM stripe_events WHERE id = 'evt_broken'", ())
+    assert row["status"] == "pending" and row["attempts"] == 1
+    assert row["last_error"].startswith("JSONDecodeError")
+
+    from dinechain_api.blueprints.orders import get_db_conn
+
+    async def make_due():
+        async with get_db_conn() as conn:
+            await conn.execute("UPDATE stripe_events SET next_attempt_at = 0 WHERE id = 'evt_broken'")
+            await conn.commit()
+
+    run_sync(make_due())
+    _drain(processor)
+    assert _query("SELECT status FROM stripe_events WHERE id = 'evt_broken'", ()) == [{"status": "failed"}]
+    assert processor.stats()["retried"] == 1 and processor.stats()["failed"] == 1
@@ -0,0 +1,114 @@
+import asyncio
+import time
+import pytest
+from dinechain_api.services import payment_scanner
+from dinechain_api.services.leases import PROCESS_OWNER_ID, acquire_lease, purge_expired_leases, release_lease, renew_lease
+from dinechain_api.services.payment_watcher import PAYMENT_WATCHER_LEASE_NAME, PaymentWatcher
+from dinechain_api.utils.event_loop import run_sync
+
+TTL = 0.3
+
+
+class CountingDetector:
+    def __init__(self):
+        self.polls = 0
+        self.pending = {}
+        self.primary = payment_scanner.TransferLogScanner()
+
+    async def poll(self):
+        self.polls += 1
+        return []
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def watcher(app_module):
+    run_sync(release_lease(PAYMENT_WATCHER_LEASE_NAME, owner="other-worker"))
+    run_sync(release_lease(PAYMENT_WATCHER_LEASE_NAME))
+    watcher = PaymentWatcher(detector=CountingDetector())
+    watcher.lease_ttl = TTL
+    yield watcher
+    run_sync(release_lease(PAYMENT_WATCHER_LEASE_NAME, owner="other-worker"))
+
+
+def test_a_standby_never_polls_while_another_process_leads(watcher):
+    async def scenario():
+        assert await acquire_lease(PAYMENT_WATCHER_LEASE_NAME, TTL, owner="other-worker")
+        task = asyncio.create_task(watcher.run())
+        for _ in range(6):
+            await asyncio.sleep(TTL / 3)
+            await renew_lease(PAYMENT_WATCHER_LEASE_NAME, TTL, owner="other-worker")
+        await watcher.stop()
+        await task
+
+    run_sync(scenario())
+    assert watcher.detector.polls == 0
+    assert watcher.leader_terms == 0
+
+
+def test_a_standby_takes_over_soon_after_the_leader_dies(watcher):
+    async def scenario():
+        # The leader crashes without releasing its lease
+        assert await acquire_lease(PAYMENT_WATCHER_LEASE_NAME, TTL, owner="other-worker")
+        died = time.monotonic()
+        task = asyncio.create_task(watcher.run())
+        while not watcher.is_leader:
+            await asyncio.sleep(0.01)
+        took_over = time.monotonic() - died
+        await watcher.stop()
+        await task
+        return took_over
+
+    took_over = run_sync(scenario())
+    assert took_over < 1.5 * TTL
+    assert watcher.detector.polls >= 1
+
+
+def test_a_leader_that_loses_its_lease_stops_polling(watcher):
+    async def scenario():
+        task = asyncio.create_task(watcher.run())
+        while not watcher.is_leader:
+            await asyncio.sleep(0.01)
+        # Another process steals the lease (e.g. after a long stall here)
+        from dinechain_api.blueprints.orders import get_db_conn
+        async with get_db_conn() as conn:
+            await conn.execute("UPDATE leases SET owner = 'other-worker' WHERE name = ?", (PAYMENT_WATCHER_LEASE_NAME,))
+            await conn.commit()
+        for _ in range(20):
+            await renew_lease(PAYMENT_WATCHER_LEASE_NAME, TTL, owner="other-worker")
+            if not watcher.is_leader:
+                break
+            await asyncio.sleep(TTL / 6)
+        lost = not watcher.is_leader
+        await watcher.stop()
+        await task
+        return lost
+
+    assert run_sync(scenario())
+    assert watcher.leader_terms == 1
+
+
+def test_stopping_hands_the_lease_over_at_once(watcher):
+    async def scenario():
+        task = asyncio.create_task(watcher.run())
+        while not watcher.is_leader:
+            await asyncio.sleep(0.01)
+        await watcher.stop()
+        await task
+        return await acquire_lease(PAYMENT_WATCHER_LEASE_NAME, TTL, owner="other-worker")
+
+    assert run_sync(scenario())
+    assert watcher.stats()["owner"] == PROCESS_OWNER_ID
+
+
+def test_leases_of_dead_processes_are_purged(app_module):
+    async def scenario():
+        assert await acquire_lease("test:purge", 0.05, owner="dead-worker")
+        await asyncio.sleep(0.1)
+        purged = await purge_expired_leases()
+        return purged, await acquire_lease("test:purge", 0.05, owner="new-worker")
+
+    purged, acquired = run_sync(scenario())
+    assert purged >= 1 and acquired
@@ -0,0 +1,114 @@
+import asyncio
+import base64
+from urllib.parse import parse_qs
+import httpx
+import pytest
+from dinechain_api.services import whatsapp
+from dinechain_api.services.resilience import retry_after_seconds
+from dinechain_api.services.whatsapp import WhatsAppSender
+
+MESSAGES_URL = "https://api.twilio.test/2010-04-01/Accounts/AC123/Messages.json"
+
+
+class FakeTwilio:
+    """Answers the Messages endpoint, or fails the way it is told to, and records every request."""
+
+    def __init__(self):
+        self.requests = []
+        self.fail = None
+        self.delay = 0
+        self.in_flight = 0
+        self.peak = 0
+
+    async def handle(self, request):
+        self.requests.append(request)
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if isinstance(self.fail, Exception):
+                raise self.fail
+            if self.fail:
+                return httpx.Response(self.fail, headers={"Retry-After": "3"}, json={"message": "nope"})
+            to = parse_qs(request.content.decode())["To"][0]
+            return httpx.Response(201, json={"sid": f"SM{to[-2:]}"})
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def twilio(monkeypatch):
+    fake = FakeTwilio()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handle))
+    monkeypatch.setattr(whatsapp, "get_http_client", lambda name: client)
+    monkeypatch.setattr(whatsapp, "TWILIO_MESSAGES_URL", MESSAGES_URL)
+    return fake
+
+
+def _sender():
+    return WhatsAppSender("AC123", "secret-token", "+14155238886")
+
+
+def test_messages_are_posted_with_basic_auth(twilio):
+    sid = asyncio.run(_sender().send("whatsapp:+2348000000001", "Your order is ready"))
+
+    [request] = twilio.requests
+    assert sid == "SM01"
+    assert request.headers["Authorization"] == "Basic " + base64.b64encode(b"AC123:secret-token").decode()
+    assert parse_qs(request.content.decode()) == {
+        "From": ["whatsapp:+14155238886"], "To": ["whatsapp:+2348000000001"], "Body": ["Your order is ready"],
+    }
+
+
+def test_sends_in_flight_are_bounded(twilio):
+    twilio.delay = 0.02
+
+    async def burst():
+        sender = _sender()
+        sender.semaphore = asyncio.Semaphore(3)
+        return await asyncio.gather(*(sender.send(f"whatsapp:+23480000000{n:02d}", "hi") for n in range(12))), sender
+
+    sids, sender = asyncio.run(burst())
+    assert sids == [f"SM{n:02d}" for n in range(12)]
+    assert twilio.peak == 3
+    assert sender.stats()["sent"] == 12
+
+
+def test_a_request_that_never_left_goes_through_the_sdk(twilio):
+    twilio.fail = httpx.ConnectError("connection refused")
+    sdk_sends = []
+
+    async def scenario():
+        sender = _sender()
+        sender._send_with_sdk = lambda chat_id, text: sdk_sends.append((chat_id, text)) or "SMsdk"
+        sid = await sender.send("whatsapp:+2348000000001", "hi")
+        await sender.close()
+        return sid, sender.stats()
+
+    sid, stats = asyncio.run(scenario())
+    assert sid == "SMsdk"
+    assert sdk_sends == [("whatsapp:+2348000000001", "hi")]
+    assert stats["fallbacks"] == 1 and stats["sent"] == 1
+
+
+@pytest.mark.parametrize("failure", [429, 500, httpx.ReadTimeout("no answer")])
+def test_errors_after_twilio_saw_the_request_are_not_retried(twilio, failure):
+    twilio.fail = failure
+
+    async def scenario():
+        sender = _sender()
+        sender._send_with_sdk = lambda chat_id, text: pytest.fail("must not resend through the SDK")
+        return await sender.send("whatsapp:+2348000000001", "hi"), sender.stats()
+
+    sid, stats = asyncio.run(scenario())
+    assert sid is None
+    assert len(twilio.requests) == 1
+    assert stats["failed"] == 1 and stats["fallbacks"] == 0
+
+
+def test_callers_that_retry_get_the_error(twilio):
+    twilio.fail = 429
+
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        asyncio.run(_sender().send("whatsapp:+2348000000001", "hi", raise_errors=True))
+    assert retry_after_seconds(error.value) == 3.0